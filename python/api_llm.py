@@ -7,14 +7,42 @@ Handles communication with OpenAI GPT models
 
 import os
 import json
+import asyncio
+import time
 import requests
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional, Callable, Tuple
+
+import async_http
+from stream_parser import IncrementalJSONScanner
+from resilience import RetryPolicy, BackendHTTPError, get_breaker, parse_retry_after
+from rate_limiter import get_rate_limiter, estimate_tokens
+from packing import PACKED_INSTRUCTION, build_packed_block, parse_packed
+from grading_schema import (COMPACT_FIELDS, grading_schema, packed_schema, openai_response_format,
+                            extract_json_object, check_result, PARSE_STATS)
+from token_budget import output_budget, verbosity_level, VERBOSITY
+
+
+# Batch states after which no more results will arrive
+BATCH_FINAL_STATES = {"completed", "failed", "expired", "cancelled"}
+
+
+def streamed_usage(usage: Dict[str, Any], content: str) -> Dict[str, Any]:
+    """
+    Usage of a streamed completion
+
+    Returns the reported usage, or an estimate of the completion tokens
+    (marked "estimated") when the stream stopped before the usage chunk;
+    RateLimiter.reconcile adds the prompt estimate to it.
+    """
+    if usage:
+        return usage
+    return {"completion_tokens": estimate_tokens(content), "estimated": True}
 
 
 class OpenAIClient:
     """Client for OpenAI API"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], on_progress: Optional[Callable[[Dict[str, Any]], None]] = None):
         self.model = config.get("model", "gpt-3.5-turbo")
         self.api_key = self._get_api_key(config.get("api_key_env", "OPENAI_API_KEY"))
         self.temperature = config.get("temperature", 0.3)
@@ -22,6 +50,28 @@ class OpenAIClient:
         self.timeout = config.get("timeout", 60)
         self.base_url = config.get("base_url", "https://api.openai.com/v1")
         self.privacy_mode = config.get("privacy_mode", True)
+        self.connection_limit = config.get("connection_limit_per_host", 20)
+        # Streaming parses the JSON as it arrives and stops generation early
+        self.stream = config.get("stream", False)
+        # Constrain output to the grading schema ("json_schema", "json"
+        # for models without structured outputs, or false)
+        self.structured_output = config.get("structured_output", "json_schema")
+        self.schema = grading_schema(COMPACT_FIELDS)
+        # Output budget and feedback verbosity; the router passes the
+        # token_budget settings in
+        self.token_budget = config.get("token_budget")
+        self.verbosity = verbosity_level(self.token_budget)
+        self.on_progress = on_progress
+        # Reuse one HTTP connection pool across calls (keep-alive)
+        self.session = requests.Session()
+        # Transient failures (429, 5xx) are retried with backoff; the router
+        # passes the performance settings in as "retry"
+        self.retry = RetryPolicy(config.get("retry"), get_breaker(f"openai:{self.base_url}", config.get("retry")))
+        # Requests/tokens per minute pacing, shared by clients of one model
+        self.rate_limiter = get_rate_limiter(f"{self.base_url}:{self.model}", config)
+        # Batch API mode (half price, results within the completion window)
+        self.batch_poll_interval = config.get("batch_poll_interval", 60)
+        self.batch_completion_window = config.get("batch_completion_window", "24h")
         
     def _get_api_key(self, env_var: str) -> str:
         """Get API key from environment variable"""
@@ -43,8 +93,12 @@ class OpenAIClient:
         """
         try:
             messages = self._build_messages(text, context)
-            response = self._call_openai(messages)
-            return self._parse_response(response)
+            budget = self.budget_for(text, context)
+            result = self._parse_response(self.retry.call(lambda: self._paced_call(messages, budget)))
+            if result.get("parsing_method") == "fallback" and budget < self.max_tokens:
+                # Most likely cut off by the budget; retry once at the full limit
+                result = self._parse_response(self.retry.call(lambda: self._paced_call(messages)))
+            return result
             
         except Exception as e:
             return {
@@ -55,6 +109,102 @@ class OpenAIClient:
                 "model_used": self.model
             }
     
+    async def agrade_submission(self, text: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Grade a student submission without blocking the event loop
+        
+        Requests share one keep-alive connection pool per base URL. Falls
+        back to a worker thread when aiohttp is not installed.
+        
+        Args:
+            text: Student submission (should be privacy-filtered)
+            context: Assignment context
+            
+        Returns:
+            Grading results dictionary
+        """
+        if not async_http.is_available():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.grade_submission, text, context)
+        
+        try:
+            messages = self._build_messages(text, context)
+            budget = self.budget_for(text, context)
+            result = self._parse_response(await self.retry.acall(lambda: self._apaced_call(messages, budget)))
+            if result.get("parsing_method") == "fallback" and budget < self.max_tokens:
+                # Most likely cut off by the budget; retry once at the full limit
+                result = self._parse_response(await self.retry.acall(lambda: self._apaced_call(messages)))
+            return result
+            
+        except Exception as e:
+            return {
+                "error": True,
+                "message": f"OpenAI API error: {str(e)}",
+                "total_score": 0,
+                "confidence": 0.0,
+                "model_used": self.model
+            }
+    
+    def budget_for(self, text: str, context: Dict[str, Any]) -> int:
+        """Completion budget for one submission (see token_budget)"""
+        # The response has no per-question entries, so only verbosity counts
+        return output_budget(text, context, self.token_budget, self.max_tokens, itemized=False)
+    
+    def grade_packed(self, items: List[Tuple[str, str]], context: Dict[str, Any],
+                     max_tokens: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Grade several short submissions in one completion
+        
+        Args:
+            items: List of (pack id, privacy-filtered submission text)
+            context: Assignment context shared by all items
+            max_tokens: Completion budget for the whole pack
+            
+        Returns:
+            Mapping of pack id to grading result; ids the model did not
+            answer properly are missing. Transport errors are raised.
+        """
+        messages = self._build_packed_messages(items, context)
+        max_tokens = max_tokens or self.max_tokens * len(items)
+        response = self.retry.call(lambda: self._paced_call(messages, max_tokens, packed=True))
+        return self._parse_packed(response, [pack_id for pack_id, _ in items])
+    
+    async def agrade_packed(self, items: List[Tuple[str, str]], context: Dict[str, Any],
+                            max_tokens: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Asyncio variant of grade_packed"""
+        if not async_http.is_available():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.grade_packed, items, context, max_tokens)
+        
+        messages = self._build_packed_messages(items, context)
+        max_tokens = max_tokens or self.max_tokens * len(items)
+        response = await self.retry.acall(lambda: self._apaced_call(messages, max_tokens, packed=True))
+        return self._parse_packed(response, [pack_id for pack_id, _ in items])
+    
+    def _build_packed_messages(self, items: List[Tuple[str, str]], context: Dict[str, Any]) -> list:
+        """Build chat messages holding several submissions"""
+        messages = self._build_messages(build_packed_block(items), context)
+        messages[-1]["content"] += "\n\n" + PACKED_INSTRUCTION
+        return messages
+    
+    def _parse_packed(self, response: Dict[str, Any], ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Parse a packed completion, adding the usual metadata to each result"""
+        try:
+            content = response["choices"][0]["message"]["content"]
+        except (KeyError, IndexError, TypeError):
+            return {}
+        
+        results = {}
+        for pack_id, parsed in parse_packed(content or "", ids).items():
+            parsed = check_result(parsed, self.model, self.schema)
+            if parsed is None:
+                continue
+            results[pack_id] = parsed
+            parsed["model_used"] = self.model
+            parsed["confidence"] = self._calculate_confidence(parsed, response)
+            parsed["packed"] = len(ids)
+        return results
+    
     def _build_messages(self, text: str, context: Dict[str, Any]) -> list:
         """Build chat messages for OpenAI API"""
         system_message = """You are an educational AI assistant for grading student work. 
@@ -87,29 +237,82 @@ Always respond in Thai and provide scores in JSON format."""
     "strengths": "<จุดเด่นของงาน>",
     "improvements": "<ข้อเสนอแนะการพัฒนา>"
 }"""
+        if self.verbosity is not VERBOSITY["detailed"]:
+            user_content += f"\n\n{self.verbosity['instruction']}"
         
         return [
             {"role": "system", "content": system_message},
             {"role": "user", "content": user_content}
         ]
     
-    def _call_openai(self, messages: list) -> Dict[str, Any]:
-        """Make API call to OpenAI"""
-        url = f"{self.base_url}/chat/completions"
-        
-        headers = {
+    def _build_headers(self) -> Dict[str, str]:
+        """Build request headers for OpenAI API"""
+        return {
             "Authorization": f"Bearer {self.api_key}",
             "Content-Type": "application/json"
         }
-        
+    
+    def _build_payload(self, messages: list, max_tokens: Optional[int] = None, packed: bool = False) -> Dict[str, Any]:
+        """Build chat completions request body"""
         payload = {
             "model": self.model,
             "messages": messages,
             "temperature": self.temperature,
-            "max_tokens": self.max_tokens
+            "max_tokens": max_tokens or self.max_tokens
         }
+        if packed:
+            response_format = openai_response_format(self.structured_output, packed_schema(self.schema),
+                                                     "packed_grading_results")
+        else:
+            response_format = openai_response_format(self.structured_output, self.schema)
+        if response_format is not None:
+            payload["response_format"] = response_format
+        return payload
+    
+    def _paced_call(self, messages: list, max_tokens: Optional[int] = None, packed: bool = False) -> Dict[str, Any]:
+        """Call the API once the rate limiter admits the request"""
+        if self.rate_limiter is None:
+            return self._call_openai(messages, max_tokens, packed)
         
-        response = requests.post(
+        reserved = self.rate_limiter.reserve_tokens(messages, max_tokens or self.max_tokens)
+        self.rate_limiter.acquire(reserved)
+        try:
+            response = self._call_openai(messages, max_tokens, packed)
+        except Exception:
+            # Nothing was generated; only the prompt estimate stays charged
+            self.rate_limiter.refund(int(max_tokens or self.max_tokens))
+            raise
+        self.rate_limiter.reconcile(messages, reserved, response.get("usage"))
+        return response
+    
+    async def _apaced_call(self, messages: list, max_tokens: Optional[int] = None, packed: bool = False) -> Dict[str, Any]:
+        """Asyncio variant of _paced_call"""
+        if self.rate_limiter is None:
+            return await self._acall_openai(messages, max_tokens, packed)
+        
+        reserved = self.rate_limiter.reserve_tokens(messages, max_tokens or self.max_tokens)
+        await self.rate_limiter.aacquire(reserved)
+        try:
+            response = await self._acall_openai(messages, max_tokens, packed)
+        except BaseException:
+            # Also covers cancellation (hybrid abandons the slower call)
+            self.rate_limiter.refund(int(max_tokens or self.max_tokens))
+            raise
+        self.rate_limiter.reconcile(messages, reserved, response.get("usage"))
+        return response
+    
+    def _call_openai(self, messages: list, max_tokens: Optional[int] = None, packed: bool = False) -> Dict[str, Any]:
+        """Make API call to OpenAI"""
+        # Streaming stops at the first complete object, so packed
+        # responses are never streamed
+        if self.stream and not packed:
+            return self._stream_openai(messages, max_tokens)
+        
+        url = f"{self.base_url}/chat/completions"
+        headers = self._build_headers()
+        payload = self._build_payload(messages, max_tokens, packed)
+        
+        response = self.session.post(
             url,
             json=payload,
             headers=headers,
@@ -117,39 +320,146 @@ Always respond in Thai and provide scores in JSON format."""
         )
         
         if response.status_code != 200:
-            raise Exception(f"OpenAI API error: {response.status_code} - {response.text}")
+            raise BackendHTTPError("OpenAI", response.status_code, response.text,
+                                   parse_retry_after(response.headers.get("Retry-After")))
         
         return response.json()
     
+    def _stream_openai(self, messages: list, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Stream a chat completion, parsing the JSON as it arrives
+        
+        The connection is closed as soon as the top-level JSON object is
+        complete, which cancels the remaining generation. Returns a response
+        shaped like a non-streamed completion for _parse_response; the usage
+        chunk only comes at the very end, so usage is estimated when the
+        stream was stopped before it (see streamed_usage).
+        """
+        url = f"{self.base_url}/chat/completions"
+        payload = self._build_payload(messages, max_tokens)
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        scanner = IncrementalJSONScanner(self.on_progress)
+        usage = {}
+        
+        response = self.session.post(
+            url,
+            json=payload,
+            headers=self._build_headers(),
+            timeout=self.timeout,
+            stream=True
+        )
+        
+        try:
+            if response.status_code != 200:
+                raise BackendHTTPError("OpenAI", response.status_code, response.text,
+                                       parse_retry_after(response.headers.get("Retry-After")))
+            
+            for line in response.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data:"):
+                    continue
+                data = line[len("data:"):].strip()
+                if data == "[DONE]":
+                    break
+                
+                event = json.loads(data)
+                usage = event.get("usage") or usage
+                choices = event.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if scanner.feed(delta or ""):
+                    break
+        finally:
+            response.close()
+        
+        return {
+            "choices": [{"message": {"content": scanner.text}}],
+            "usage": streamed_usage(usage, scanner.text)
+        }
+    
+    async def _acall_openai(self, messages: list, max_tokens: Optional[int] = None, packed: bool = False) -> Dict[str, Any]:
+        """Make API call to OpenAI through the shared async pool"""
+        if self.stream and not packed:
+            return await self._astream_openai(messages, max_tokens)
+        
+        url = f"{self.base_url}/chat/completions"
+        
+        status, result, headers = await async_http.post_json(
+            self.base_url,
+            url,
+            self._build_payload(messages, max_tokens, packed),
+            headers=self._build_headers(),
+            timeout=self.timeout,
+            limit_per_host=self.connection_limit
+        )
+        
+        if status != 200:
+            raise BackendHTTPError("OpenAI", status, result, parse_retry_after(headers.get("Retry-After")))
+        
+        return result
+    
+    async def _astream_openai(self, messages: list, max_tokens: Optional[int] = None) -> Dict[str, Any]:
+        """Asyncio variant of _stream_openai"""
+        payload = self._build_payload(messages, max_tokens)
+        payload["stream"] = True
+        payload["stream_options"] = {"include_usage": True}
+        scanner = IncrementalJSONScanner(self.on_progress)
+        usage: Dict[str, Any] = {}
+        
+        def on_line(line: str) -> bool:
+            if not line.startswith("data:"):
+                return False
+            data = line[len("data:"):].strip()
+            if data == "[DONE]":
+                return True
+            
+            event = json.loads(data)
+            usage.update(event.get("usage") or {})
+            choices = event.get("choices") or []
+            delta = choices[0].get("delta", {}).get("content") if choices else None
+            return scanner.feed(delta or "")
+        
+        status, error, headers = await async_http.post_stream(
+            self.base_url,
+            f"{self.base_url}/chat/completions",
+            payload,
+            on_line,
+            headers=self._build_headers(),
+            timeout=self.timeout,
+            limit_per_host=self.connection_limit
+        )
+        
+        if status != 200:
+            raise BackendHTTPError("OpenAI", status, error, parse_retry_after(headers.get("Retry-After")))
+        
+        return {
+            "choices": [{"message": {"content": scanner.text}}],
+            "usage": streamed_usage(usage, scanner.text)
+        }
+    
     def _parse_response(self, response: Dict[str, Any]) -> Dict[str, Any]:
         """Parse OpenAI API response"""
         try:
             content = response["choices"][0]["message"]["content"]
-            
-            # Extract JSON from response
-            start = content.find('{')
-            end = content.rfind('}') + 1
-            
-            if start != -1 and end > start:
-                json_str = content[start:end]
-                parsed = json.loads(json_str)
-                
-                # Add metadata
-                parsed["model_used"] = self.model
-                parsed["confidence"] = self._calculate_confidence(parsed, response)
-                parsed["usage"] = response.get("usage", {})
-                
-                return parsed
-            else:
-                return self._fallback_parse(content)
-                
-        except (KeyError, json.JSONDecodeError, IndexError) as e:
+        except (KeyError, IndexError, TypeError) as e:
             return self._fallback_parse(str(e))
+        
+        parsed = check_result(extract_json_object(content or ""), self.model, self.schema)
+        if parsed is None:
+            return self._fallback_parse(content or "")
+        
+        # Add metadata
+        parsed["model_used"] = self.model
+        parsed["confidence"] = self._calculate_confidence(parsed, response)
+        parsed["usage"] = response.get("usage", {})
+        
+        return parsed
     
     def _fallback_parse(self, content: str) -> Dict[str, Any]:
         """Fallback parsing when structured extraction fails"""
         import re
         
+        PARSE_STATS.record(self.model, "fallback")
+        
         # Try to extract score
         score_patterns = [
             r'(\d+(?:\.\d+)?)\s*/\s*100',
@@ -190,12 +500,171 @@ Always respond in Thai and provide scores in JSON format."""
         
         return min(1.0, confidence)
     
+    def build_batch_file(self, items: List[Tuple[str, str, Dict[str, Any]]]) -> bytes:
+        """
+        Serialize grading requests as a Batch API input file
+        
+        Args:
+            items: (custom_id, text, context) tuples; text should be
+                privacy-filtered
+            
+        Returns:
+            JSONL file content, one chat completion request per line
+        """
+        lines = []
+        for custom_id, text, context in items:
+            lines.append(json.dumps({
+                "custom_id": custom_id,
+                "method": "POST",
+                "url": "/v1/chat/completions",
+                "body": self._build_payload(self._build_messages(text, context),
+                                            self.budget_for(text, context))
+            }, ensure_ascii=False))
+        return ("\n".join(lines) + "\n").encode("utf-8")
+    
+    def _batch_request(self, method: str, path: str, **kwargs) -> requests.Response:
+        """Send one Files/Batches API request, raising on non-200"""
+        headers = {"Authorization": f"Bearer {self.api_key}"}
+        if "json" in kwargs:
+            headers = self._build_headers()
+        
+        response = self.session.request(method, f"{self.base_url}{path}", headers=headers,
+                                        timeout=self.timeout, **kwargs)
+        if response.status_code != 200:
+            raise BackendHTTPError("OpenAI", response.status_code, response.text,
+                                   parse_retry_after(response.headers.get("Retry-After")))
+        return response
+    
+    def submit_batch(self, items: List[Tuple[str, str, Dict[str, Any]]]) -> Dict[str, Any]:
+        """
+        Upload a batch input file and create the batch
+        
+        Args:
+            items: (custom_id, text, context) tuples
+            
+        Returns:
+            Batch object as returned by the API
+        """
+        content = self.build_batch_file(items)
+        uploaded = self.retry.call(lambda: self._batch_request(
+            "POST", "/files",
+            data={"purpose": "batch"},
+            files={"file": ("krurooai_batch.jsonl", content, "application/jsonl")}
+        )).json()
+        
+        # Not retried: a retry after a lost response could start a second batch
+        return self._batch_request("POST", "/batches", json={
+            "input_file_id": uploaded["id"],
+            "endpoint": "/v1/chat/completions",
+            "completion_window": self.batch_completion_window
+        }).json()
+    
+    def wait_for_batch(self, batch_id: str, poll_interval: Optional[float] = None,
+                       timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Poll a batch until it reaches a final state
+        
+        Args:
+            batch_id: Batch identifier
+            poll_interval: Seconds between polls (default: batch_poll_interval)
+            timeout: Give up after this many seconds (default: no limit)
+            
+        Returns:
+            Final batch object
+        """
+        poll_interval = self.batch_poll_interval if poll_interval is None else poll_interval
+        started = time.monotonic()
+        
+        while True:
+            batch = self.retry.call(lambda: self._batch_request("GET", f"/batches/{batch_id}")).json()
+            if batch.get("status") in BATCH_FINAL_STATES:
+                return batch
+            
+            if self.on_progress:
+                self.on_progress({
+                    "event": "batch_status",
+                    "batch_id": batch_id,
+                    "status": batch.get("status"),
+                    "request_counts": batch.get("request_counts", {})
+                })
+            
+            if timeout is not None and time.monotonic() - started > timeout:
+                raise TimeoutError(f"Batch {batch_id} still {batch.get('status')} after {timeout}s")
+            time.sleep(poll_interval)
+    
+    def fetch_batch_results(self, batch: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """
+        Download a finished batch and parse each response
+        
+        Args:
+            batch: Final batch object
+            
+        Returns:
+            Grading results keyed by custom_id
+        """
+        results = {}
+        for file_key in ["output_file_id", "error_file_id"]:
+            file_id = batch.get(file_key)
+            if not file_id:
+                continue
+            
+            content = self.retry.call(lambda: self._batch_request("GET", f"/files/{file_id}/content")).text
+            for line in content.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                
+                if response.get("status_code") == 200:
+                    results[record["custom_id"]] = self._parse_response(response.get("body", {}))
+                else:
+                    error = record.get("error") or response.get("body", {}).get("error") or {}
+                    results[record["custom_id"]] = {
+                        "error": True,
+                        "message": f"OpenAI batch error: {error.get('message', response.get('status_code'))}",
+                        "total_score": 0,
+                        "confidence": 0.0,
+                        "model_used": self.model
+                    }
+        return results
+    
+    def grade_batch_api(self, items: List[Tuple[str, str, Dict[str, Any]]],
+                        poll_interval: Optional[float] = None,
+                        timeout: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Grade many submissions through the Batch API
+        
+        Args:
+            items: (custom_id, text, context) tuples; text should be
+                privacy-filtered
+            poll_interval: Seconds between status polls
+            timeout: Give up waiting after this many seconds
+            
+        Returns:
+            Grading results keyed by custom_id; requests missing from the
+            batch output (expired, cancelled) get an error result
+        """
+        batch = self.submit_batch(items)
+        batch = self.wait_for_batch(batch["id"], poll_interval, timeout)
+        results = self.fetch_batch_results(batch)
+        
+        for custom_id, _, _ in items:
+            if custom_id not in results:
+                results[custom_id] = {
+                    "error": True,
+                    "message": f"OpenAI batch {batch.get('status')}: no result for {custom_id}",
+                    "total_score": 0,
+                    "confidence": 0.0,
+                    "model_used": self.model
+                }
+        return results
+    
     def test_connection(self) -> bool:
         """Test connection to OpenAI API"""
         try:
             url = f"{self.base_url}/models"
             headers = {"Authorization": f"Bearer {self.api_key}"}
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.session.get(url, headers=headers, timeout=10)
             return response.status_code == 200
         except:
             return False
@@ -205,7 +674,7 @@ Always respond in Thai and provide scores in JSON format."""
         try:
             url = f"{self.base_url}/models"
             headers = {"Authorization": f"Bearer {self.api_key}"}
-            response = requests.get(url, headers=headers, timeout=10)
+            response = self.session.get(url, headers=headers, timeout=10)
             
             if response.status_code == 200:
                 models = response.json().get("data", [])
@@ -230,7 +699,7 @@ def main():
     }
     
     try:
-        client = OpenAIClient(config)
+        client = OpenAIClient(config, on_progress=lambda event: print(json.dumps(event), file=sys.stderr))
         text = sys.argv[1]
         context = json.loads(sys.argv[2])
         
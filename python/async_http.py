@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+
+"""
+async_http.py - Shared asyncio HTTP connection pools for KruRooAI
+Keeps one keep-alive aiohttp session per backend so many grading
+requests can be in flight from a single process
+"""
+
+import asyncio
+import json
+from typing import Dict, Any, Callable, Optional, Tuple
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is optional; clients fall back to threads
+    aiohttp = None
+
+
+# Sessions are bound to an event loop, so they are keyed by loop and pool
+_SESSIONS: Dict[Tuple[int, str], Any] = {}
+
+
+def is_available() -> bool:
+    """Check whether the aiohttp backend is installed"""
+    return aiohttp is not None
+
+
+def get_session(pool_key: str, limit_per_host: int = 10, limit: int = 100,
+                keepalive_timeout: float = 30.0) -> Any:
+    """
+    Get the shared session for a backend pool, creating it on first use
+
+    Args:
+        pool_key: Pool identifier, usually the backend base URL
+        limit_per_host: Maximum open connections per host
+        limit: Maximum open connections for the whole pool
+        keepalive_timeout: Seconds to keep idle connections open
+
+    Returns:
+        aiohttp.ClientSession bound to the running event loop
+    """
+    if aiohttp is None:
+        raise RuntimeError("aiohttp is not installed (pip3 install aiohttp)")
+
+    loop = asyncio.get_running_loop()
+    key = (id(loop), pool_key)
+    session = _SESSIONS.get(key)
+
+    if session is None or session.closed:
+        connector = aiohttp.TCPConnector(
+            limit=limit,
+            limit_per_host=limit_per_host,
+            keepalive_timeout=keepalive_timeout
+        )
+        session = aiohttp.ClientSession(connector=connector)
+        _SESSIONS[key] = session
+
+    return session
+
+
+async def post_json(pool_key: str, url: str, payload: Dict[str, Any],
+                    headers: Optional[Dict[str, str]] = None, timeout: float = 60,
+                    limit_per_host: int = 10) -> Tuple[int, Any, Dict[str, str]]:
+    """
+    POST a JSON payload through the shared pool
+
+    Args:
+        pool_key: Pool identifier, usually the backend base URL
+        url: Request URL
+        payload: JSON body
+        headers: Extra request headers
+        timeout: Total request timeout in seconds
+        limit_per_host: Maximum open connections per host
+
+    Returns:
+        Tuple of (status_code, parsed JSON body or raw text, response headers)
+    """
+    session = get_session(pool_key, limit_per_host=limit_per_host)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with session.post(url, json=payload, headers=headers, timeout=client_timeout) as response:
+        text = await response.text()
+        headers = dict(response.headers)
+        try:
+            return response.status, json.loads(text), headers
+        except json.JSONDecodeError:
+            return response.status, text, headers
+
+
+async def post_stream(pool_key: str, url: str, payload: Dict[str, Any], on_line: Callable[[str], bool],
+                      headers: Optional[Dict[str, str]] = None, timeout: float = 60,
+                      limit_per_host: int = 10) -> Tuple[int, Any, Dict[str, str]]:
+    """
+    POST a JSON payload and read a line-delimited streaming response
+
+    Args:
+        pool_key: Pool identifier, usually the backend base URL
+        url: Request URL
+        payload: JSON body
+        on_line: Called with each non-empty line of a 200 response;
+            returning True stops reading and drops the connection, which
+            makes the server stop generating
+        headers: Extra request headers
+        timeout: Total request timeout in seconds
+        limit_per_host: Maximum open connections per host
+
+    Returns:
+        Tuple of (status_code, raw error text or None, response headers)
+    """
+    session = get_session(pool_key, limit_per_host=limit_per_host)
+    client_timeout = aiohttp.ClientTimeout(total=timeout)
+
+    async with session.post(url, json=payload, headers=headers, timeout=client_timeout) as response:
+        headers = dict(response.headers)
+        if response.status != 200:
+            return response.status, await response.text(), headers
+
+        async for raw in response.content:
+            line = raw.decode('utf-8').strip()
+            if line and on_line(line):
+                response.close()
+                break
+        return response.status, None, headers
+
+
+async def close_sessions() -> None:
+    """Close every session opened on the running event loop"""
+    loop_id = id(asyncio.get_running_loop())
+    for key in [k for k in _SESSIONS if k[0] == loop_id]:
+        session = _SESSIONS.pop(key)
+        if not session.closed:
+            await session.close()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+
+"""
+context_compactor.py - Trim the assignment context to the questions a submission answers
+Long standard answers and rubrics are split into per-question blocks and
+only the blocks for questions present in the submission are sent, so
+prefill cost follows what is being graded rather than the whole document
+"""
+
+import json
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Set, Tuple
+
+from rate_limiter import estimate_tokens
+from objective_grader import parse_questions, parse_submission, match_question, objective_settings
+
+
+DEFAULTS = {
+    "enabled": True,
+    "min_context_tokens": 1500,     # smaller contexts are sent whole
+    "cache_size": 256               # compacted contexts kept in memory
+}
+
+# Context fields that are split per question; other fields pass through
+COMPACTED_FIELDS = ("question", "standard_answer", "grading_criteria")
+
+# Start of a per-question block: an explicit question heading such as
+# "ข้อ 3.", "ข้อที่ 4:", "คำถามที่ 2" or "### ข้อ 5", at the start of a
+# line. Bare "1." lists are not split: rubrics and model answers number
+# their criteria and steps that way, and those must never be dropped
+BLOCK_START = re.compile(r"^(?:#{1,6}\s*)?(?:ข้อ(?:ที่)?|คำถามที่)\s*(\d+)\b")
+
+
+def compaction_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Read the context_compaction section of the router config"""
+    return dict(DEFAULTS, **(config.get("context_compaction") or {}))
+
+
+def split_blocks(text: str) -> Tuple[str, List[Tuple[int, str]]]:
+    """
+    Split a context field into its preamble and numbered blocks
+
+    Returns:
+        Tuple of (text before the first block, list of (number, block text))
+    """
+    preamble: List[str] = []
+    blocks: List[Tuple[int, List[str]]] = []
+    for line in (text or "").splitlines():
+        match = BLOCK_START.match(line)
+        if match:
+            blocks.append((int(match.group(1)), [line]))
+        elif blocks:
+            blocks[-1][1].append(line)
+        else:
+            preamble.append(line)
+    return "\n".join(preamble), [(number, "\n".join(lines)) for number, lines in blocks]
+
+
+def submission_questions(text: str, context: Dict[str, Any], config: Dict[str, Any]) -> Optional[Set[int]]:
+    """
+    Assignment question numbers answered in a submission
+
+    Only submissions in the CSV import layout have question headings to
+    go by; for anything else, or when a heading matches no question,
+    None is returned and the context is left whole.
+    """
+    _, items = parse_submission(text or "")
+    if not items:
+        return None
+
+    questions = parse_questions(context.get("question", ""))
+    settings = objective_settings(config)
+    numbers = set()
+    for item in items:
+        number = match_question(item, questions, settings)
+        if number is None:
+            return None
+        numbers.add(number)
+    return numbers
+
+
+def compact_field(text: str, keep: Set[int], known: Set[int]) -> str:
+    """
+    Drop the blocks of a field that belong to questions not being graded
+
+    Blocks numbered like no known question (steps, criteria lists) are
+    kept, as is everything before the first block.
+    """
+    preamble, blocks = split_blocks(text)
+    parts = [preamble] if preamble.strip() else []
+    parts.extend(block for number, block in blocks if number in keep or number not in known)
+    return "\n".join(parts)
+
+
+class ContextCompactor:
+    """
+    Per-assignment cache of compacted contexts
+
+    Keyed by the full context and the set of questions kept, so every
+    student answering the same questions gets the same (byte-identical)
+    context, which also keeps prompt prefixes shareable.
+    """
+
+    def __init__(self, cache_size: int = DEFAULTS["cache_size"]):
+        self.cache_size = max(1, int(cache_size))
+        self._cache: "OrderedDict[Tuple[str, Tuple[int, ...]], Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def compact(self, context: Dict[str, Any], keep: Set[int], min_tokens: int) -> Dict[str, Any]:
+        """
+        Context restricted to the questions in keep
+
+        Returns:
+            Compacted copy of the context, or the context itself when it is
+            below min_tokens or cannot be split by question
+        """
+        key = (json.dumps(context, sort_keys=True, ensure_ascii=False, default=str), tuple(sorted(keep)))
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached
+
+        compacted = self._build(context, keep, min_tokens)
+        with self._lock:
+            self._cache[key] = compacted
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return compacted
+
+    def _build(self, context: Dict[str, Any], keep: Set[int], min_tokens: int) -> Dict[str, Any]:
+        total = sum(estimate_tokens(str(context.get(field) or "")) for field in COMPACTED_FIELDS)
+        if total < min_tokens:
+            return context
+
+        # Only numbers that are questions of the assignment can be dropped;
+        # a single-question assignment has nothing to drop
+        known = {number for number, _ in split_blocks(context.get("question", ""))[1]}
+        if len(known) < 2 or not keep <= known or keep == known:
+            return context
+
+        compacted = dict(context)
+        for field in COMPACTED_FIELDS:
+            if context.get(field):
+                compacted[field] = compact_field(context[field], keep, known)
+        return compacted
+
+
+_COMPACTORS: Dict[int, ContextCompactor] = {}
+_COMPACTORS_LOCK = threading.Lock()
+
+
+def get_compactor(cache_size: int = DEFAULTS["cache_size"]) -> ContextCompactor:
+    """Get the shared compactor, creating it on first use"""
+    with _COMPACTORS_LOCK:
+        compactor = _COMPACTORS.get(cache_size)
+        if compactor is None:
+            compactor = ContextCompactor(cache_size)
+            _COMPACTORS[cache_size] = compactor
+    return compactor
+
+
+def compact_context(text: str, context: Dict[str, Any], config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Context to send with a submission
+
+    Args:
+        text: Submission text as it will be sent (after objective items
+            were removed)
+        context: Full assignment context
+        config: Full router configuration
+
+    Returns:
+        The context restricted to the questions the submission answers,
+        or the full context when compaction is off or not applicable
+    """
+    settings = compaction_settings(config)
+    if not settings["enabled"] or not context:
+        return context
+
+    keep = submission_questions(text, context, config)
+    if not keep:
+        return context
+    return get_compactor(int(settings["cache_size"])).compact(context, keep, int(settings["min_context_tokens"]))
@@ -6,18 +6,96 @@ Converts CSV data from forms/surveys into individual submission files
 """
 
 import csv
+import io
+import itertools
 import json
 import os
 import sys
 import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from datetime import datetime
 
 
+# Only the first errors are kept verbatim; the rest are counted
+MAX_REPORTED_ERRORS = 20
+
+# Write buffer for the JSONL container (rows are flushed in large batches)
+CONTAINER_BUFFER_SIZE = 1024 * 1024
+
+# Parallel conversion: files smaller than this are converted sequentially
+PARALLEL_MIN_BYTES = 8 * 1024 * 1024
+PARALLEL_CHUNK_BYTES = 4 * 1024 * 1024
+SCAN_BLOCK_BYTES = 1024 * 1024
+
+
+def detect_delimiter(sample):
+    """Guess the CSV delimiter from a sample of the file"""
+    if sample.count(';') > sample.count(','):
+        return ';'
+    elif sample.count('\t') > sample.count(','):
+        return '\t'
+    return ','
+
+
+class DirectoryWriter:
+    """Write each submission to its own .txt file"""
+    
+    def __init__(self, output_dir):
+        self.output_dir = Path(output_dir)
+        self.path = self.output_dir
+    
+    def write(self, submission_id, content, row_number):
+        file_path = self.output_dir / f"{submission_id}.txt"
+        with open(file_path, 'w', encoding='utf-8') as out_file:
+            out_file.write(content)
+        return str(file_path)
+    
+    def close(self):
+        pass
+
+
+class JSONLWriter:
+    """Append submissions as JSON lines to a single container file"""
+    
+    def __init__(self, path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file so a failed import never leaves a
+        # half-written container behind
+        self.tmp_path = self.path.with_name(self.path.name + ".tmp")
+        self.file = open(self.tmp_path, 'w', encoding='utf-8', buffering=CONTAINER_BUFFER_SIZE)
+    
+    def write(self, submission_id, content, row_number):
+        record = {"id": submission_id, "row": row_number, "text": content}
+        self.file.write(json.dumps(record, ensure_ascii=False))
+        self.file.write("\n")
+        return str(self.path)
+    
+    def close(self):
+        self.file.close()
+        os.replace(self.tmp_path, self.path)
+
+
+def container_path(config):
+    """Path of the JSONL container for an import configuration"""
+    if config.get("output_file"):
+        return Path(config["output_file"])
+    output_dir = Path(config.get("output_dir", "submissions"))
+    return output_dir / f"{config.get('prefix', 'student')}_submissions.jsonl"
+
+
 def process_csv(csv_file, config):
     """
     Process CSV file and convert to individual submission files
     
+    With output_format "jsonl" every submission is streamed into one
+    container file and only counters are kept, so memory stays flat
+    regardless of the number of rows. With workers > 1, large files are
+    split into byte ranges and converted in parallel; numbering stays the
+    same as a sequential run.
+    
     Args:
         csv_file: Path to CSV file
         config: Configuration dictionary
@@ -25,99 +103,175 @@ def process_csv(csv_file, config):
     Returns:
         Dictionary with processing results
     """
+    output_format = config.get("output_format", "files")
+    streaming = output_format == "jsonl"
+    progress_every = int(config.get("progress_every", 1000))
+    
     results = {
         "success": True,
+        "output_format": output_format,
         "files_created": [],
+        "written": 0,
         "errors": [],
+        "error_count": 0,
         "total_rows": 0,
         "skipped_rows": 0
     }
     
+    writer = None
     try:
         # Create output directory
         output_dir = Path(config.get("output_dir", "submissions"))
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        # Read CSV file
-        with open(csv_file, 'r', encoding='utf-8') as f:
-            # Try to detect delimiter
-            sample = f.read(1024)
-            f.seek(0)
-            
-            delimiter = ','
-            if sample.count(';') > sample.count(','):
-                delimiter = ';'
-            elif sample.count('\t') > sample.count(','):
-                delimiter = '\t'
-            
-            reader = csv.DictReader(f, delimiter=delimiter)
-            
-            # Get columns to process
-            all_columns = reader.fieldnames
-            email_col = config.get("email_column", "Email Address")
-            timestamp_col = config.get("timestamp_column", "Timestamp")
-            score_col = config.get("score_column", "Score")
-            skip_columns = set(config.get("skip_columns", []))
-            
-            # Add system columns to skip list
-            skip_columns.update([email_col, timestamp_col, score_col])
-            
-            # Determine question columns
-            question_columns = [col for col in all_columns if col not in skip_columns]
-            
-            print(f"Processing CSV with {len(all_columns)} total columns")
-            print(f"Question columns: {len(question_columns)}")
-            print(f"Output directory: {output_dir}")
+        if streaming:
+            writer = JSONLWriter(container_path(config))
+            results["container"] = str(writer.path)
+        elif output_format == "files":
+            writer = DirectoryWriter(output_dir)
+        else:
+            raise ValueError(f"Unknown output format: {output_format}")
+        
+        print(f"Output: {writer.path}")
+        
+        # Process each row
+        for i, submission_id, content, error in iter_csv_submissions(csv_file, config):
+            results["total_rows"] += 1
             
-            # Process each row
-            for i, row in enumerate(reader, 1):
-                results["total_rows"] += 1
+            try:
+                if error is not None:
+                    raise ValueError(error)
                 
-                try:
-                    # Generate filename
-                    prefix = config.get("prefix", "student")
-                    filename = f"{prefix}_{i:03d}.txt"
-                    file_path = output_dir / filename
-                    
-                    # Create submission file content
-                    content = create_submission_content(row, config, question_columns)
-                    
-                    # Write file
-                    with open(file_path, 'w', encoding='utf-8') as out_file:
-                        out_file.write(content)
-                    
-                    results["files_created"].append(str(file_path))
-                    
-                    if i <= 3:  # Show first 3 files created
-                        print(f"Created: {filename}")
+                created = writer.write(submission_id, content, i)
+                results["written"] += 1
                 
-                except Exception as e:
-                    error_msg = f"Row {i}: {str(e)}"
-                    results["errors"].append(error_msg)
-                    results["skipped_rows"] += 1
+                if not streaming:
+                    results["files_created"].append(created)
+                
+                if i <= 3:  # Show first 3 submissions created
+                    print(f"Created: {submission_id}")
+            
+            except Exception as e:
+                results["error_count"] += 1
+                results["skipped_rows"] += 1
+                if len(results["errors"]) < MAX_REPORTED_ERRORS:
+                    results["errors"].append(f"Row {i}: {str(e)}")
                     print(f"Error processing row {i}: {e}")
+            
+            if progress_every > 0 and i % progress_every == 0:
+                print(f"Processed {i} rows ({results['written']} written, {results['error_count']} errors)")
+        
+        writer.close()
+        writer = None
         
         print(f"\nProcessing complete:")
         print(f"- Total rows processed: {results['total_rows']}")
-        print(f"- Files created: {len(results['files_created'])}")
-        print(f"- Errors: {len(results['errors'])}")
+        print(f"- Submissions written: {results['written']}")
+        print(f"- Errors: {results['error_count']}")
         
     except Exception as e:
         results["success"] = False
+        results["error_count"] += 1
         results["errors"].append(f"Failed to process CSV: {str(e)}")
         print(f"Error: {e}")
     
+    finally:
+        if isinstance(writer, JSONLWriter):
+            writer.file.close()
+            if writer.tmp_path.exists():
+                writer.tmp_path.unlink()
+    
     return results
 
 
-def create_submission_content(row, config, question_columns):
-    """Create content for individual submission file"""
+def iter_csv_submissions(csv_file, config, log=print):
+    """
+    Stream submissions from a CSV export, one row at a time
+    
+    Args:
+        csv_file: Path to CSV file
+        config: Configuration dictionary
+        log: Function used for status messages
+    
+    Yields:
+        (row_number, submission_id, content, error) tuples in file order;
+        content is None when the row could not be converted
+    """
+    workers = int(config.get("workers", 1))
+    prefix = config.get("prefix", "student")
+    
+    with open(csv_file, 'r', encoding='utf-8') as f:
+        # Try to detect delimiter
+        sample = f.read(1024)
+        f.seek(0)
+        
+        delimiter = detect_delimiter(sample)
+        
+        reader = csv.DictReader(f, delimiter=delimiter)
+        
+        # Get columns to process
+        all_columns = reader.fieldnames
+        email_col = config.get("email_column", "Email Address")
+        timestamp_col = config.get("timestamp_column", "Timestamp")
+        score_col = config.get("score_column", "Score")
+        skip_columns = set(config.get("skip_columns", []))
+        
+        # Add system columns to skip list
+        skip_columns.update([email_col, timestamp_col, score_col])
+        
+        # Determine question columns
+        question_columns = [col for col in all_columns if col not in skip_columns]
+        layout = prepare_layout(config, question_columns)
+        
+        log(f"Processing CSV with {len(all_columns)} total columns")
+        log(f"Question columns: {len(question_columns)}")
+        
+        if workers > 1 and os.path.getsize(csv_file) >= PARALLEL_MIN_BYTES:
+            log(f"Converting in parallel with {workers} workers")
+            rows = iter_rows_parallel(csv_file, delimiter, all_columns, layout, workers)
+        else:
+            rows = iter_rows(reader, layout)
+        
+        for i, (content, error) in enumerate(rows, 1):
+            # Submission id doubles as file stem / container id
+            yield i, f"{prefix}_{i:03d}", content, error
+
+
+def prepare_layout(config, question_columns):
+    """
+    Resolve column names and question headers once per import
+    
+    Args:
+        config: Configuration dictionary
+        question_columns: Columns holding question answers, in order
+    
+    Returns:
+        Dictionary used by render_submission
+    """
+    questions = []
+    for i, col in enumerate(question_columns, 1):
+        # Clean up question text
+        question = col.strip()
+        if len(question) > 100:
+            question = question[:97] + "..."
+        questions.append((col, f"คำถามที่ {i}: {question}"))
+    
+    return {
+        "email_column": config.get("email_column", "Email Address"),
+        "timestamp_column": config.get("timestamp_column", "Timestamp"),
+        "score_column": config.get("score_column", "Score"),
+        "questions": questions
+    }
+
+
+def render_submission(row, layout):
+    """Render one CSV row as submission text using a prepared layout"""
     content = []
     
     # Add metadata
-    email_col = config.get("email_column", "Email Address")
-    timestamp_col = config.get("timestamp_column", "Timestamp")
-    score_col = config.get("score_column", "Score")
+    email_col = layout["email_column"]
+    timestamp_col = layout["timestamp_column"]
+    score_col = layout["score_column"]
     
     if email_col in row and row[email_col]:
         content.append(f"Email: {row[email_col]}")
@@ -131,22 +285,130 @@ def create_submission_content(row, config, question_columns):
     content.append("")  # Empty line
     
     # Add questions and answers
-    for i, col in enumerate(question_columns, 1):
+    for col, header in layout["questions"]:
         if col in row and row[col]:
-            # Clean up question text
-            question = col.strip()
-            if len(question) > 100:
-                question = question[:97] + "..."
-            
-            answer = row[col].strip()
-            
-            content.append(f"คำถามที่ {i}: {question}")
-            content.append(f"คำตอบ: {answer}")
+            content.append(header)
+            content.append(f"คำตอบ: {row[col].strip()}")
             content.append("")  # Empty line between questions
     
     return "\n".join(content)
 
 
+def create_submission_content(row, config, question_columns):
+    """Create content for individual submission file"""
+    return render_submission(row, prepare_layout(config, question_columns))
+
+
+def iter_rows(reader, layout):
+    """Yield (content, error) for each row of a DictReader"""
+    for row in reader:
+        try:
+            yield render_submission(row, layout), None
+        except Exception as e:
+            yield None, str(e)
+
+
+def find_record_boundaries(csv_file, chunk_bytes):
+    """
+    Split a CSV file into byte ranges that start and end on record boundaries
+    
+    A newline ends a record only when the number of quote characters before
+    it is even (quoted fields may contain newlines; escaped quotes come in
+    pairs). UTF-8 continuation bytes never equal a quote or a newline, so
+    the scan works on raw bytes.
+    
+    Args:
+        csv_file: Path to CSV file
+        chunk_bytes: Approximate size of each range
+    
+    Returns:
+        List of (start, end) byte offsets covering the records after the header
+    """
+    size = os.path.getsize(csv_file)
+    boundaries = []
+    target = 0  # the header ends at the first record boundary
+    quotes = 0
+    
+    with open(csv_file, 'rb') as f:
+        offset = 0
+        while target is not None:
+            block = f.read(SCAN_BLOCK_BYTES)
+            if not block:
+                break
+            
+            position = max(0, target - offset)
+            counted = 0
+            block_quotes = 0
+            while target is not None:
+                newline = block.find(b"\n", position)
+                if newline == -1:
+                    break
+                block_quotes += block.count(b'"', counted, newline)
+                counted = newline
+                if (quotes + block_quotes) % 2 == 0:
+                    boundaries.append(offset + newline + 1)
+                    target = offset + newline + 1 + chunk_bytes
+                    if target >= size:
+                        target = None
+                    position = max(newline + 1, target - offset) if target is not None else 0
+                else:
+                    position = newline + 1
+            
+            quotes += block.count(b'"')
+            offset += len(block)
+    
+    if not boundaries:
+        return []
+    
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+def convert_range(csv_file, start, end, delimiter, fieldnames, layout):
+    """Worker: convert the records in one byte range to submission texts"""
+    with open(csv_file, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    
+    # Same newline handling as the sequential reader (open() defaults)
+    text = io.TextIOWrapper(io.BytesIO(data), encoding='utf-8')
+    reader = csv.DictReader(text, fieldnames=fieldnames, delimiter=delimiter)
+    return list(iter_rows(reader, layout))
+
+
+def iter_rows_parallel(csv_file, delimiter, fieldnames, layout, workers):
+    """
+    Yield (content, error) for each row, converting byte ranges in worker
+    processes while preserving file order
+    
+    Args:
+        csv_file: Path to CSV file
+        delimiter: CSV delimiter
+        fieldnames: Header columns
+        layout: Prepared layout (see prepare_layout)
+        workers: Number of worker processes
+    
+    Yields:
+        (content, error) tuples in file order
+    """
+    ranges = find_record_boundaries(csv_file, PARALLEL_CHUNK_BYTES)
+    
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = deque()
+        ranges = iter(ranges)
+        
+        # Keep a bounded window of ranges in flight so memory stays flat
+        for start, end in itertools.islice(ranges, workers * 2):
+            pending.append(pool.submit(convert_range, csv_file, start, end, delimiter, fieldnames, layout))
+        
+        while pending:
+            rows = pending.popleft().result()
+            for start, end in itertools.islice(ranges, 1):
+                pending.append(pool.submit(convert_range, csv_file, start, end, delimiter, fieldnames, layout))
+            for row in rows:
+                yield row
+
+
 def auto_grade_files(files_created, context_file, config):
     """
     Automatically grade the created files using KruRooAI
@@ -203,6 +465,103 @@ def auto_grade_files(files_created, context_file, config):
     return results
 
 
+def iter_pipeline_jobs(csv_file, config, context, privacy_rules=None, log=print):
+    """
+    Turn CSV rows into privacy-filtered grading jobs as they are parsed
+    
+    Args:
+        csv_file: Path to CSV file
+        config: Import configuration dictionary
+        context: Assignment context passed to the LLM
+        privacy_rules: Privacy rules applied before grading (optional)
+        log: Function used for status messages
+    
+    Yields:
+        Job dictionaries for llm_router.iter_grade_batch
+    """
+    from privacy_utils import filter_for_api
+    
+    for i, submission_id, content, error in iter_csv_submissions(csv_file, config, log=log):
+        if error is not None:
+            yield {"id": submission_id, "row": i, "text": "", "invalid": f"Row {i}: {error}"}
+            continue
+        
+        if privacy_rules:
+            content = filter_for_api(content, privacy_rules)
+        
+        yield {"id": submission_id, "row": i, "text": content, "context": context}
+
+
+def run_grading_pipeline(csv_file, config, context, backend, llm_config, out=None, results_file=None):
+    """
+    Grade a CSV export row by row without writing intermediate files
+    
+    Rows flow through content creation, privacy filtering and LLM grading
+    as generator stages, so grading starts on the first row while later
+    rows are still being parsed. Each graded row is written to `out` as a
+    JSON line ({"id", "row", "text", "result"}) as soon as it completes.
+    
+    Args:
+        csv_file: Path to CSV file
+        config: Import configuration dictionary
+        context: Assignment context passed to the LLM
+        backend: Backend type (local, openai, hybrid)
+        llm_config: Router configuration; its "privacy_rules" are applied
+            to every row before grading
+        out: Stream for result lines (default: stdout)
+        results_file: Optional JSONL file that collects the results
+    
+    Returns:
+        Dictionary with total, succeeded and failed counts
+    """
+    from llm_router import iter_grade_batch
+    
+    out = out or sys.stdout
+    llm_config = dict(llm_config or {})
+    
+    # Rows are filtered here for every backend, so the router must not
+    # filter them a second time
+    privacy_rules = llm_config.pop("privacy_rules", None)
+    progress_every = int(config.get("progress_every", 1000))
+    
+    def log(message):
+        print(message, file=sys.stderr)
+    
+    # Texts of jobs in flight, so each result line carries its submission
+    in_flight = {}
+    
+    def tracked_jobs():
+        for job in iter_pipeline_jobs(csv_file, config, context, privacy_rules, log=log):
+            in_flight[job["id"]] = (job["row"], job["text"])
+            yield job
+    
+    summary = {"total": 0, "succeeded": 0, "failed": 0}
+    results_out = open(results_file, 'a', encoding='utf-8') if results_file else None
+    
+    try:
+        for result in iter_grade_batch(tracked_jobs(), backend, llm_config):
+            row, text = in_flight.pop(result.get("id"), (None, ""))
+            summary["total"] += 1
+            summary["failed" if result.get("error") else "succeeded"] += 1
+            
+            out.write(json.dumps({"id": result.get("id"), "row": row, "text": text, "result": result},
+                                 ensure_ascii=False) + "\n")
+            out.flush()
+            
+            if results_out:
+                results_out.write(json.dumps(dict(result, row=row), ensure_ascii=False) + "\n")
+                results_out.flush()
+            
+            if progress_every > 0 and summary["total"] % progress_every == 0:
+                log(f"Graded {summary['total']} rows ({summary['failed']} failed)")
+    finally:
+        if results_out:
+            results_out.close()
+    
+    log(f"Pipeline complete: {summary['succeeded']} graded, {summary['failed']} failed")
+    return summary
+
+
 def detect_csv_structure(csv_file):
     """
     Analyze CSV structure and suggest configuration
@@ -280,9 +639,21 @@ def main():
     parser.add_argument("--score-column", default="Score", help="Score column name")
     parser.add_argument("--skip-columns", help="Comma-separated columns to skip")
     parser.add_argument("--prefix", default="student", help="Output filename prefix")
+    parser.add_argument("--output-format", choices=["files", "jsonl"], default="files",
+                        help="One .txt file per row, or a single JSONL container")
+    parser.add_argument("--output-file", help="JSONL container path (default: <output-dir>/<prefix>_submissions.jsonl)")
+    parser.add_argument("--progress-every", type=int, default=1000, help="Report progress every N rows")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Worker processes for large files (1 = sequential)")
     parser.add_argument("--auto-grade", action="store_true", help="Auto-grade after import")
     parser.add_argument("--context", help="Context file for auto-grading")
     parser.add_argument("--analyze", action="store_true", help="Only analyze CSV structure")
+    parser.add_argument("--pipeline", action="store_true",
+                        help="Grade rows directly and stream JSON result lines to stdout")
+    parser.add_argument("--context-json", help="Assignment context JSON file (pipeline mode)")
+    parser.add_argument("--mode", default="local", help="LLM backend for pipeline mode")
+    parser.add_argument("--llm-config", help="Router configuration JSON file (pipeline mode)")
+    parser.add_argument("--results", help="Also append result lines to this JSONL file (pipeline mode)")
     
     args = parser.parse_args()
     
@@ -305,10 +676,28 @@ def main():
         "score_column": args.score_column,
         "skip_columns": args.skip_columns.split(",") if args.skip_columns else [],
         "prefix": args.prefix,
+        "output_format": args.output_format,
+        "output_file": args.output_file,
+        "progress_every": args.progress_every,
+        "workers": args.workers,
         "auto_grade": args.auto_grade,
         "context": args.context
     }
     
+    if args.pipeline:
+        context = {}
+        if args.context_json:
+            with open(args.context_json, 'r', encoding='utf-8') as f:
+                context = json.load(f)
+        llm_config = {}
+        if args.llm_config:
+            with open(args.llm_config, 'r', encoding='utf-8') as f:
+                llm_config = json.load(f)
+        
+        summary = run_grading_pipeline(args.csv_file, config, context, args.mode, llm_config,
+                                       results_file=args.results)
+        sys.exit(1 if summary["total"] and not summary["succeeded"] else 0)
+    
     results = process_csv(args.csv_file, config)
     
     # Auto-grading
@@ -323,7 +712,10 @@ def main():
             print(f"Error: {error}")
         sys.exit(1)
     
-    print(f"\nSuccess! Created {len(results['files_created'])} submission files")
+    if results["output_format"] == "jsonl":
+        print(f"\nSuccess! Wrote {results['written']} submissions to {results['container']}")
+    else:
+        print(f"\nSuccess! Created {results['written']} submission files")
     return results
 
 
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+
+"""
+endpoint_pool.py - Load balancing across several Ollama hosts
+Sends each request to the healthy host with the fewest requests in flight
+and takes hosts that fail out of rotation until they recover
+"""
+
+import threading
+import time
+from typing import Dict, Any, List, Optional, Union
+
+import requests
+
+from resilience import BackendHTTPError, is_retryable
+
+
+# Seconds a failed host stays out of rotation before it is probed again
+DEFAULT_COOLDOWN = 30
+
+# Timeout for /api/tags health checks
+HEALTH_TIMEOUT = 5
+
+
+def parse_endpoints(config: Dict[str, Any]) -> List[str]:
+    """
+    Read the local backend's hosts from its config
+
+    Args:
+        config: Local backend configuration; "endpoints" may be a list or a
+            comma-separated string and takes precedence over "endpoint"
+
+    Returns:
+        Endpoint base URLs without trailing slashes
+    """
+    endpoints: Union[str, List[str], None] = config.get("endpoints") or config.get("endpoint")
+    if not endpoints:
+        endpoints = ["http://localhost:11434"]
+    if isinstance(endpoints, str):
+        endpoints = endpoints.split(",")
+    return [e.strip().rstrip("/") for e in endpoints if e and e.strip()]
+
+
+def is_host_failure(error: Exception) -> bool:
+    """Check whether a failed call should be retried on another host"""
+    # 404 means this host does not have the model pulled
+    if isinstance(error, BackendHTTPError) and error.status == 404:
+        return True
+    return is_retryable(error)
+
+
+class EndpointPool:
+    """
+    Least-outstanding-requests dispatch over a set of Ollama hosts
+
+    A host that fails is marked down for `cooldown` seconds; after that
+    one request is let through as a probe and its outcome decides whether
+    the host rejoins the rotation. When every host is down the one that
+    has been down longest is tried anyway, so the pool never refuses work.
+    """
+
+    def __init__(self, endpoints: List[str], cooldown: float = DEFAULT_COOLDOWN):
+        if not endpoints:
+            raise ValueError("Endpoint pool needs at least one endpoint")
+        self.endpoints = list(endpoints)
+        self.cooldown = float(cooldown)
+        self.outstanding = {e: 0 for e in self.endpoints}
+        self.served = {e: 0 for e in self.endpoints}
+        self.failures = {e: 0 for e in self.endpoints}
+        self.down_until: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def is_healthy(self, endpoint: str, now: Optional[float] = None) -> bool:
+        until = self.down_until.get(endpoint)
+        return until is None or (now or time.monotonic()) >= until
+
+    def acquire(self, exclude: Optional[set] = None) -> Optional[str]:
+        """
+        Reserve the least loaded healthy host
+
+        Args:
+            exclude: Hosts already tried for this request
+
+        Returns:
+            Endpoint URL, or None when every host has been excluded
+        """
+        exclude = exclude or set()
+        with self._lock:
+            now = time.monotonic()
+            candidates = [e for e in self.endpoints if e not in exclude]
+            if not candidates:
+                return None
+
+            healthy = [e for e in candidates if self.is_healthy(e, now)]
+            if healthy:
+                # Ties go to the host that has served least, spreading a
+                # cold start evenly instead of piling onto the first host
+                endpoint = min(healthy, key=lambda e: (self.outstanding[e], self.served[e]))
+                if endpoint in self.down_until:
+                    # Cooldown over: this request is the probe; hold the
+                    # host back from others until it reports in
+                    self.down_until[endpoint] = now + self.cooldown
+            else:
+                endpoint = min(candidates, key=lambda e: self.down_until[e])
+
+            self.outstanding[endpoint] += 1
+            self.served[endpoint] += 1
+            return endpoint
+
+    def release(self, endpoint: str, error: Optional[Exception] = None) -> None:
+        """Return a host after a request, marking it down on host failure"""
+        with self._lock:
+            self.outstanding[endpoint] = max(0, self.outstanding[endpoint] - 1)
+            if error is not None and is_host_failure(error):
+                self.failures[endpoint] += 1
+                self.down_until[endpoint] = time.monotonic() + self.cooldown
+            elif error is None:
+                self.failures[endpoint] = 0
+                self.down_until.pop(endpoint, None)
+
+    def check_health(self, session: Optional[requests.Session] = None,
+                     model: Optional[str] = None) -> Dict[str, bool]:
+        """
+        Probe every host's /api/tags and update the rotation
+
+        Args:
+            session: HTTP session to use
+            model: When given, a host must also have this model pulled
+
+        Returns:
+            Mapping of endpoint to health
+        """
+        session = session or requests.Session()
+        health = {}
+        for endpoint in self.endpoints:
+            try:
+                response = session.get(f"{endpoint}/api/tags", timeout=HEALTH_TIMEOUT)
+                ok = response.status_code == 200
+                if ok and model:
+                    names = [m.get("name") for m in response.json().get("models", [])]
+                    ok = model in names or f"{model}:latest" in names
+            except (requests.RequestException, ValueError):
+                ok = False
+
+            with self._lock:
+                if ok:
+                    self.down_until.pop(endpoint, None)
+                    self.failures[endpoint] = 0
+                else:
+                    self.down_until[endpoint] = time.monotonic() + self.cooldown
+            health[endpoint] = ok
+        return health
+
+    def status(self) -> List[Dict[str, Any]]:
+        """Per-host load and health, for diagnostics"""
+        with self._lock:
+            now = time.monotonic()
+            return [{
+                "endpoint": e,
+                "healthy": self.is_healthy(e, now),
+                "outstanding": self.outstanding[e],
+                "served": self.served[e],
+                "failures": self.failures[e]
+            } for e in self.endpoints]
+
+
+_POOLS: Dict[str, EndpointPool] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def get_endpoint_pool(endpoints: List[str], cooldown: float = DEFAULT_COOLDOWN) -> EndpointPool:
+    """Get the shared pool for a set of hosts, creating it on first use"""
+    key = ",".join(endpoints)
+    with _POOLS_LOCK:
+        pool = _POOLS.get(key)
+        if pool is None:
+            pool = EndpointPool(endpoints, cooldown)
+            _POOLS[key] = pool
+    return pool
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+
+"""
+grading_cache.py - Content-addressed grading result cache for KruRooAI
+Stores LLM grading results in SQLite, keyed by a hash of everything
+that determines the result (filtered text, context, backend, sampling)
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Any, Iterator, Optional
+
+
+# Backend settings that change how a request is sent but not its result
+TRANSPORT_KEYS = {
+    "timeout",
+    "endpoint",
+    "endpoints",
+    "endpoint_cooldown",
+    "base_url",
+    "api_key_env",
+    "connection_limit_per_host",
+    "privacy_mode",
+    "keep_alive",
+    "stream",
+    "requests_per_minute",
+    "tokens_per_minute",
+    "batch_poll_interval",
+    "batch_completion_window",
+    "batch_max_requests"
+}
+
+CACHE_VERSION = 1
+
+_CACHES: Dict[str, "GradingCache"] = {}
+_CACHES_LOCK = threading.Lock()
+
+
+class GradingCache:
+    """Persistent SQLite cache of grading results"""
+
+    def __init__(self, config: Dict[str, Any]):
+        self.path = Path(config.get("path", "cache/grading_cache.sqlite"))
+        self.max_age_days = float(config.get("max_age_days", 30))
+        self.max_size_mb = float(config.get("max_size_mb", 200))
+        self.evict_every = int(config.get("evict_every", 100))
+        self._puts = 0
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    result TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            """)
+        self.evict()
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a short-lived connection that commits on success"""
+        conn = sqlite3.connect(str(self.path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    @staticmethod
+    def make_key(text: str, context: Dict[str, Any], backend: str, options: Dict[str, Any]) -> str:
+        """
+        Build the cache key for a grading request
+
+        Args:
+            text: Privacy-filtered submission text
+            context: Assignment context
+            backend: Backend type
+            options: Model and sampling options of the backends involved
+
+        Returns:
+            Hex SHA-256 digest
+        """
+        material = json.dumps({
+            "version": CACHE_VERSION,
+            "text": text,
+            "context": context,
+            "backend": backend,
+            "options": options
+        }, sort_keys=True, ensure_ascii=False, default=str)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Look up a cached result, or None on miss or expiry"""
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT result, created_at FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            if now - row[1] > self.max_age_days * 86400:
+                conn.execute("DELETE FROM results WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE results SET accessed_at = ? WHERE key = ?", (now, key))
+
+        return json.loads(row[0])
+
+    def put(self, key: str, result: Dict[str, Any]) -> None:
+        """Store a result, evicting old entries periodically"""
+        payload = json.dumps(result, ensure_ascii=False)
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO results (key, result, size, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (key, payload, len(payload.encode('utf-8')), now, now)
+            )
+
+        with self._lock:
+            self._puts += 1
+            due = self._puts % self.evict_every == 0
+        if due:
+            self.evict()
+
+    def evict(self) -> int:
+        """
+        Drop entries older than max_age_days, then least recently used
+        entries until the cache fits in max_size_mb
+
+        Returns:
+            Number of entries removed
+        """
+        cutoff = time.time() - self.max_age_days * 86400
+        max_bytes = int(self.max_size_mb * 1024 * 1024)
+
+        with self._connect() as conn:
+            removed = conn.execute("DELETE FROM results WHERE created_at < ?", (cutoff,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0]
+
+            if total > max_bytes:
+                rows = conn.execute("SELECT key, size FROM results ORDER BY accessed_at").fetchall()
+                stale = []
+                for key, size in rows:
+                    if total <= max_bytes:
+                        break
+                    stale.append((key,))
+                    total -= size
+                conn.executemany("DELETE FROM results WHERE key = ?", stale)
+                removed += len(stale)
+
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        """Entry count and total payload size"""
+        with self._connect() as conn:
+            count, size = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM results"
+            ).fetchone()
+        return {"entries": count, "size_bytes": size, "path": str(self.path)}
+
+
+def get_cache(config: Dict[str, Any]) -> Optional[GradingCache]:
+    """
+    Get the shared cache for a configuration
+
+    Args:
+        config: Full router configuration (uses its "cache" section)
+
+    Returns:
+        GradingCache, or None when caching is disabled
+    """
+    cache_config = config.get("cache", {})
+    if not cache_config.get("enabled", False):
+        return None
+
+    path = os.path.abspath(cache_config.get("path", "cache/grading_cache.sqlite"))
+    with _CACHES_LOCK:
+        cache = _CACHES.get(path)
+        if cache is None:
+            cache = GradingCache(dict(cache_config, path=path))
+            _CACHES[path] = cache
+    return cache
+
+
+def backend_options(backend: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Collect the result-affecting settings of the backends a request uses"""
+    backends = config.get("backends", {})
+    if backend in ("hybrid", "cascade"):
+        names = ["local", "openai"]
+    elif backend == "openai-batch":
+        # Same model and prompt as interactive OpenAI grading
+        names = ["openai"]
+    else:
+        names = [backend]
+
+    options = {}
+    for name in names:
+        section = backends.get(name, {})
+        options[name] = {k: v for k, v in section.items() if k not in TRANSPORT_KEYS}
+
+    if config.get("token_budget"):
+        # Verbosity changes the prompt and the budget can cut output short
+        options["token_budget"] = config["token_budget"]
+    if backend == "hybrid":
+        options["hybrid"] = config.get("hybrid", {})
+    elif backend == "cascade":
+        options["cascade"] = config.get("cascade", {})
+        options["local_models"] = config.get("models", {}).get("local_models", [])
+        options["min_confidence"] = config.get("quality", {}).get("min_confidence_threshold")
+    return options
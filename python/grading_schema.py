@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+
+"""
+grading_schema.py - JSON schema for grading results
+The schema is sent to both backends for constrained decoding (Ollama
+"format", OpenAI "response_format") and used to validate what comes
+back; parse outcomes are counted so the failure rate is visible
+"""
+
+import json
+import threading
+from typing import Dict, Any, List, Optional, Tuple
+
+
+_TEXT = {"type": "string"}
+_NUMBER = {"type": "number"}
+
+QUESTION_FEEDBACK_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "question_number": {"type": "integer"},
+        "question_type": {"type": "string", "enum": ["objective", "subjective"]},
+        "score": _NUMBER,
+        "max_score": _NUMBER,
+        "feedback": _TEXT,
+        "is_correct": {"type": "boolean"},
+        "student_answer": _TEXT,
+        "correct_answer": _TEXT,
+        "key_points": _TEXT,
+        "improvement_suggestions": _TEXT
+    },
+    "required": ["question_number", "question_type", "score", "max_score", "feedback", "is_correct",
+                 "student_answer", "correct_answer", "key_points", "improvement_suggestions"],
+    "additionalProperties": False
+}
+
+RESULT_PROPERTIES = {
+    "total_score": {"type": "number", "minimum": 0, "maximum": 100},
+    "breakdown": {
+        "type": "object",
+        "properties": {"accuracy": _NUMBER, "method": _NUMBER, "presentation": _NUMBER},
+        "required": ["accuracy", "method", "presentation"],
+        "additionalProperties": False
+    },
+    "question_feedback": {"type": "array", "items": QUESTION_FEEDBACK_SCHEMA},
+    "feedback": _TEXT,
+    "overall_feedback": _TEXT,
+    "strengths": _TEXT,
+    "improvements": _TEXT,
+    "detailed_analysis": _TEXT
+}
+
+# Fields asked for by the local prompt (per-question report) and by the
+# shorter OpenAI prompt
+FULL_FIELDS = ("total_score", "breakdown", "question_feedback", "overall_feedback",
+               "strengths", "improvements", "detailed_analysis")
+COMPACT_FIELDS = ("total_score", "breakdown", "feedback", "strengths", "improvements")
+
+
+def grading_schema(fields: Tuple[str, ...] = FULL_FIELDS) -> Dict[str, Any]:
+    """
+    Schema of a grading result holding the given fields
+
+    Every field is required: OpenAI strict mode needs every property
+    listed, and constraining to exactly what the prompt asks for keeps
+    the output no longer than before.
+    """
+    return {
+        "type": "object",
+        "properties": {name: RESULT_PROPERTIES[name] for name in fields},
+        "required": list(fields),
+        "additionalProperties": False
+    }
+
+
+GRADING_SCHEMA = grading_schema()
+
+
+def packed_schema(schema: Dict[str, Any] = GRADING_SCHEMA) -> Dict[str, Any]:
+    """Schema of a packed response: {"results": [grading result + student_id]}"""
+    item = dict(schema)
+    item["properties"] = dict(schema["properties"], student_id=_TEXT)
+    item["required"] = ["student_id"] + schema["required"]
+    return {
+        "type": "object",
+        "properties": {"results": {"type": "array", "items": item}},
+        "required": ["results"],
+        "additionalProperties": False
+    }
+
+
+def ollama_format(mode: Any, schema: Dict[str, Any] = GRADING_SCHEMA) -> Optional[Any]:
+    """
+    Value for Ollama's "format" field
+
+    Args:
+        mode: structured_output setting ("json_schema", "json", or false)
+        schema: Schema the response must follow
+
+    Returns:
+        Schema object, "json", or None to leave output unconstrained
+    """
+    if mode == "json_schema" or mode is True:
+        return schema
+    if mode == "json":
+        return "json"
+    return None
+
+
+def openai_response_format(mode: Any, schema: Dict[str, Any] = GRADING_SCHEMA,
+                           name: str = "grading_result") -> Optional[Dict[str, Any]]:
+    """
+    Value for OpenAI's "response_format" field
+
+    Args:
+        mode: structured_output setting ("json_schema", "json", or false)
+        schema: Schema the response must follow
+        name: Schema name reported to the API
+
+    Returns:
+        response_format object, or None to leave output unconstrained
+    """
+    if mode == "json_schema" or mode is True:
+        return {
+            "type": "json_schema",
+            "json_schema": {"name": name, "strict": True, "schema": schema}
+        }
+    if mode == "json":
+        return {"type": "json_object"}
+    return None
+
+
+_TYPES = {
+    "object": dict,
+    "array": list,
+    "string": str,
+    "boolean": bool
+}
+
+
+def _type_ok(value: Any, expected: str) -> bool:
+    if expected == "number":
+        return isinstance(value, (int, float)) and not isinstance(value, bool)
+    if expected == "integer":
+        return isinstance(value, int) and not isinstance(value, bool)
+    return isinstance(value, _TYPES[expected])
+
+
+def validate(instance: Any, schema: Dict[str, Any] = GRADING_SCHEMA, path: str = "$") -> List[str]:
+    """
+    Check a value against the subset of JSON Schema used here
+
+    Supports type, properties, required, items, enum, minimum and maximum.
+    Extra properties are tolerated, since models without constrained
+    decoding often add some.
+
+    Args:
+        instance: Parsed JSON value
+        schema: Schema to check against
+        path: Location of instance, used in messages
+
+    Returns:
+        List of problems; empty when the value conforms
+    """
+    expected = schema.get("type")
+    if expected and not _type_ok(instance, expected):
+        return [f"{path}: expected {expected}"]
+
+    errors = []
+    if "enum" in schema and instance not in schema["enum"]:
+        errors.append(f"{path}: not one of {schema['enum']}")
+    if "minimum" in schema and instance < schema["minimum"]:
+        errors.append(f"{path}: below {schema['minimum']}")
+    if "maximum" in schema and instance > schema["maximum"]:
+        errors.append(f"{path}: above {schema['maximum']}")
+
+    if expected == "object":
+        for name in schema.get("required", []):
+            if name not in instance:
+                errors.append(f"{path}.{name}: missing")
+        for name, subschema in schema.get("properties", {}).items():
+            if name in instance:
+                errors.extend(validate(instance[name], subschema, f"{path}.{name}"))
+    elif expected == "array" and "items" in schema:
+        for i, item in enumerate(instance):
+            errors.extend(validate(item, schema["items"], f"{path}[{i}]"))
+    return errors
+
+
+def is_usable(instance: Any) -> bool:
+    """A result can be used when it is an object with a numeric total_score"""
+    return isinstance(instance, dict) and _type_ok(instance.get("total_score"), "number")
+
+
+class ParseStats:
+    """Thread-safe counts of parse outcomes per model"""
+
+    OUTCOMES = ("valid", "schema_violation", "fallback")
+
+    def __init__(self):
+        self.counts: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, model: str, outcome: str) -> None:
+        with self._lock:
+            counts = self.counts.setdefault(model, {name: 0 for name in self.OUTCOMES})
+            counts[outcome] += 1
+
+    def snapshot(self) -> Dict[str, Dict[str, Any]]:
+        """Counts and fallback rate per model"""
+        with self._lock:
+            report = {}
+            for model, counts in self.counts.items():
+                total = sum(counts.values())
+                report[model] = dict(counts, total=total,
+                                     failure_rate=round(counts["fallback"] / total, 4) if total else 0.0)
+            return report
+
+
+PARSE_STATS = ParseStats()
+
+
+def extract_json_object(text: str) -> Optional[Any]:
+    """
+    Decode the JSON object in a model output
+
+    Constrained output is plain JSON; otherwise the text between the
+    first "{" and the last "}" is tried.
+
+    Returns:
+        Decoded value, or None when there is no valid JSON object
+    """
+    try:
+        return json.loads(text)
+    except (TypeError, ValueError):
+        pass
+
+    start = text.find('{')
+    end = text.rfind('}') + 1
+    if start == -1 or end <= start:
+        return None
+    try:
+        return json.loads(text[start:end])
+    except ValueError:
+        return None
+
+
+def check_result(parsed: Any, model: str, schema: Dict[str, Any] = GRADING_SCHEMA) -> Optional[Dict[str, Any]]:
+    """
+    Validate a parsed result and record the outcome
+
+    Args:
+        parsed: Value decoded from the model output
+        model: Model name, for the metrics
+        schema: Schema the result should follow
+
+    Returns:
+        The result (with "schema_errors" when it deviates from the schema
+        but is still usable), or None when it is unusable and the caller
+        should fall back (the caller records the fallback)
+    """
+    if not is_usable(parsed):
+        return None
+
+    errors = validate(parsed, schema)
+    if errors:
+        parsed["schema_errors"] = errors[:10]
+        PARSE_STATS.record(model, "schema_violation")
+    else:
+        PARSE_STATS.record(model, "valid")
+    return parsed
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+
+"""
+job_ledger.py - Persistent job ledger for resumable batch grading
+Records each submission's state in an append-only JSONL file so a batch
+run that dies halfway can skip completed work when it is restarted
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Any, List, Optional
+
+
+PENDING = "pending"
+IN_FLIGHT = "in_flight"
+DONE = "done"
+FAILED = "failed"
+
+
+def job_fingerprint(text: str, context: Dict[str, Any], backend: str, models: List[str]) -> str:
+    """
+    Hex SHA-256 of what a job's result depends on
+
+    A stored result is only reused for a job with the same submission
+    text, assignment context, backend and models.
+    """
+    material = json.dumps([text, context, backend, models], sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+def result_hash(result: Dict[str, Any]) -> str:
+    """Hex SHA-256 of a result's canonical JSON"""
+    material = json.dumps(result, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class JobLedger:
+    """Append-only JSONL ledger of job states"""
+
+    def __init__(self, path: str, resume: bool = False):
+        self.path = Path(path)
+        self.resume = resume
+        self.jobs: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        if resume and self.path.exists():
+            self._replay()
+        # A fresh run starts a new ledger; a resumed run appends to it
+        self._file = open(self.path, 'a' if resume else 'w', encoding='utf-8')
+
+    def _replay(self) -> None:
+        """Rebuild job states from the ledger file"""
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # torn final line from a crash
+                job = self.jobs.setdefault(str(entry.get("id")), {})
+                job.update(entry)
+
+        # A done entry only counts if its stored result is intact
+        for job in self.jobs.values():
+            if job.get("state") == DONE:
+                result = job.get("result")
+                if result is None or result_hash(result) != job.get("result_hash"):
+                    job["state"] = FAILED
+
+    def _append(self, job_id: str, entry: Dict[str, Any]) -> None:
+        entry = dict(entry, id=job_id, updated_at=time.time())
+        line = json.dumps(entry, ensure_ascii=False) + "\n"
+        with self._lock:
+            self._file.write(line)
+            self._file.flush()
+            self.jobs.setdefault(job_id, {}).update(entry)
+
+    def state(self, job_id: str) -> Optional[str]:
+        """Current state of a job, or None if it has never been seen"""
+        return self.jobs.get(str(job_id), {}).get("state")
+
+    def attempts(self, job_id: str) -> int:
+        """Attempts made for a job across all runs"""
+        return int(self.jobs.get(str(job_id), {}).get("attempts", 0))
+
+    def completed_result(self, job_id: str, fingerprint: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Stored result of a completed job, when resuming
+
+        Args:
+            job_id: Job identifier
+            fingerprint: job_fingerprint of the incoming job; the stored
+                result is only returned when it was graded from the same
+                inputs, so an edited submission or a changed model is
+                graded again
+
+        Returns:
+            Copy of the stored result, or None if the job must be graded
+        """
+        job = self.jobs.get(str(job_id), {})
+        if self.resume and job.get("state") == DONE and job.get("fingerprint") == fingerprint:
+            return dict(job["result"])
+        return None
+
+    def mark_pending(self, job_id: str) -> None:
+        self._append(str(job_id), {"state": PENDING, "attempts": self.attempts(job_id)})
+
+    def mark_in_flight(self, job_id: str) -> None:
+        self._append(str(job_id), {"state": IN_FLIGHT, "attempts": self.attempts(job_id)})
+
+    def mark_finished(self, job_id: str, result: Dict[str, Any], fingerprint: Optional[str] = None) -> None:
+        """Record a graded job (with its job_fingerprint) as done, or failed when the result is an error"""
+        job_id = str(job_id)
+        attempts = self.attempts(job_id) + int(result.get("attempts", 1))
+
+        if result.get("error"):
+            self._append(job_id, {
+                "state": FAILED,
+                "attempts": attempts,
+                "message": result.get("message", "")
+            })
+        else:
+            self._append(job_id, {
+                "state": DONE,
+                "attempts": attempts,
+                "fingerprint": fingerprint,
+                "result_hash": result_hash(result),
+                "result": result
+            })
+
+    def summary(self) -> Dict[str, int]:
+        """Number of jobs per state"""
+        counts = {PENDING: 0, IN_FLIGHT: 0, DONE: 0, FAILED: 0}
+        for job in self.jobs.values():
+            counts[job.get("state", PENDING)] = counts.get(job.get("state", PENDING), 0) + 1
+        return counts
+
+    def close(self) -> None:
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def open_ledger(config: Dict[str, Any]) -> Optional[JobLedger]:
+    """
+    Open the ledger configured for a batch run
+
+    Args:
+        config: Full router configuration (uses its "ledger" section:
+            {"path": ..., "resume": bool})
+
+    Returns:
+        JobLedger, or None when no ledger is configured
+    """
+    ledger_config = config.get("ledger") or {}
+    if not ledger_config.get("path"):
+        return None
+    return JobLedger(os.path.abspath(ledger_config["path"]), bool(ledger_config.get("resume", False)))
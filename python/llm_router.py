@@ -5,23 +5,57 @@ llm_router.py - LLM backend router for KruRooAI
 Handles routing to different LLM backends (local, OpenAI)
 """
 
+import asyncio
 import json
+import os
+import queue
 import sys
-from typing import Dict, Any, Optional
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from pathlib import Path
+from typing import Dict, Any, Optional, Iterable, Iterator, List, Callable, Tuple, Union
 from local_llm import LocalLLMClient
 from api_llm import OpenAIClient
-from privacy_utils import apply_privacy_preprocessing
+from privacy_utils import filter_for_api
+from grading_cache import get_cache, backend_options
+from job_ledger import JobLedger, open_ledger, job_fingerprint
+from resilience import retry_settings
+from objective_grader import split_objective, merge_objective
+from packing import packing_settings, is_packable, pack_ids
+from grading_schema import PARSE_STATS
+from token_budget import budget_settings
+from context_compactor import compact_context
+from scheduler import INTERACTIVE, BULK, scheduler_settings, get_backend_queue, lane_of, queue_status
+from async_http import close_sessions
 
+# Clients are cached per backend config so a long-lived worker reuses
+# their HTTP sessions instead of reconnecting for every submission
+_CLIENT_CACHE: Dict[str, Any] = {}
+_CLIENT_CACHE_LOCK = threading.Lock()
 
-def route_to_llm(text: str, context: Dict[str, Any], backend: str = "local", config: Optional[Dict] = None) -> Dict[str, Any]:
+# Jobs for this backend are collected and graded through the OpenAI Batch API
+BATCH_BACKEND = "openai-batch"
+
+# Seconds without a new job after which partly filled packs are sent, so
+# a worker fed one job at a time does not hold them back
+PACK_IDLE_FLUSH = 0.2
+
+# Seconds between checks for new input while jobs are running
+INPUT_POLL = 0.05
+
+
+def route_to_llm(text: str, context: Dict[str, Any], backend: str = "local", config: Optional[Dict] = None,
+                 lane: str = INTERACTIVE) -> Dict[str, Any]:
     """
     Route text and context to appropriate LLM backend
     
     Args:
         text: Student submission text
         context: Assignment context from markdown
-        backend: Backend type ("local", "openai", "hybrid")
+        backend: Backend type ("local", "openai", "hybrid", "cascade", "openai-batch")
         config: Backend configuration
+        lane: Scheduler lane, "interactive" (served first) or "bulk"
     
     Returns:
         Dictionary with grading results
@@ -30,21 +64,42 @@ def route_to_llm(text: str, context: Dict[str, Any], backend: str = "local", con
         config = {}
     
     try:
+        # Answer-key items are graded here; only the rest goes to the LLM
+        split = objective_split(text, context, backend, config)
+        if split is not None:
+            llm_result = None
+            if split["remaining_text"]:
+                llm_result = route_to_llm(split["remaining_text"], context, backend, without_objective(config), lane)
+            return merge_objective(split, llm_result, config)
+        
         # Apply privacy preprocessing if using API backend
-        if backend in ["openai", "hybrid"]:
-            text = apply_privacy_preprocessing(text, config.get("privacy_rules", {}))
+        if backend in ["openai", "hybrid", BATCH_BACKEND]:
+            text = filter_for_api(text, config.get("privacy_rules", {}))
+        
+        # Only the context sections of the questions being graded are sent
+        context = compact_context(text, context, config)
+        
+        cache, cache_key, cached = lookup_cached(text, context, backend, config)
+        if cached is not None:
+            return cached
         
         # Route to appropriate backend
         if backend == "local":
-            local_config = config.get("backends", {}).get("local", {})
-            return route_to_local(text, context, local_config)
+            result = route_to_local(text, context, backend_config("local", config), lane)
         elif backend == "openai":
-            openai_config = config.get("backends", {}).get("openai", {})
-            return route_to_openai(text, context, openai_config)
+            result = route_to_openai(text, context, backend_config("openai", config), lane)
         elif backend == "hybrid":
-            return route_to_hybrid(text, context, config)
+            result = route_to_hybrid(text, context, config, lane)
+        elif backend == "cascade":
+            result = route_to_cascade(text, context, config, lane)
+        elif backend == BATCH_BACKEND:
+            client = get_client("openai", backend_config("openai", config))
+            result = client.grade_batch_api([("0", text, context)])["0"]
         else:
             raise ValueError(f"Unknown backend: {backend}")
+        
+        store_cached(cache, cache_key, result)
+        return result
             
     except Exception as e:
         return {
@@ -55,39 +110,1106 @@ def route_to_llm(text: str, context: Dict[str, Any], backend: str = "local", con
         }
 
 
-def route_to_local(text: str, context: Dict[str, Any], config: Dict) -> Dict[str, Any]:
+def objective_split(text: str, context: Dict[str, Any], backend: str, config: Dict) -> Optional[Dict[str, Any]]:
+    """Grade objective items against the answer key (see objective_grader)"""
+    if backend == BATCH_BACKEND:
+        # Batch jobs are submitted whole; the fast path is not applied
+        return None
+    return split_objective(text, context, config)
+
+
+def without_objective(config: Dict) -> Dict:
+    """Copy of the config with the objective fast path switched off"""
+    return dict(config, objective_grading=dict(config.get("objective_grading") or {}, enabled=False))
+
+
+def lookup_cached(text: str, context: Dict[str, Any], backend: str, config: Dict) -> tuple:
+    """
+    Look up a grading result in the result cache
+    
+    Args:
+        text: Privacy-filtered submission text
+        context: Assignment context
+        backend: Backend type
+        config: Full router configuration
+        
+    Returns:
+        Tuple of (cache, key, cached_result); cache and key are None when
+        caching is disabled, cached_result is None on a miss or refresh
+    """
+    cache = get_cache(config)
+    if cache is None:
+        return None, None, None
+    
+    key = cache.make_key(text, context, backend, backend_options(backend, config))
+    if config.get("cache", {}).get("refresh", False):
+        return cache, key, None
+    
+    cached = cache.get(key)
+    if cached is not None:
+        cached["cached"] = True
+    return cache, key, cached
+
+
+def store_cached(cache: Any, key: Optional[str], result: Dict[str, Any]) -> None:
+    """
+    Store a successful, fully parsed grading result
+    
+    Degraded results are not cached so the next run tries again: a hybrid
+    result that only one backend produced, and a cascade result no stage
+    was confident enough to accept.
+    """
+    if cache is None or key is None:
+        return
+    if result.get("error") or result.get("parsing_method") == "fallback":
+        return
+    if result.get("hybrid_source"):
+        return
+    cascade = result.get("cascade")
+    if cascade and cascade[-1].get("escalation") is not None:
+        return
+    cache.put(key, result)
+
+
+def backend_config(backend: str, config: Dict[str, Any]) -> Dict[str, Any]:
+    """Backend section of the router config with the shared retry, token budget and scheduler settings"""
+    return dict(config.get("backends", {}).get(backend, {}), retry=retry_settings(config),
+                token_budget=budget_settings(config), scheduler=scheduler_settings(config))
+
+
+def get_client(backend: str, config: Dict) -> Any:
+    """
+    Get a cached client for a backend, creating it on first use
+    
+    Args:
+        backend: Backend type ("local" or "openai")
+        config: Backend configuration
+        
+    Returns:
+        LocalLLMClient or OpenAIClient instance
+    """
+    key = backend + ":" + json.dumps(config, sort_keys=True, default=str)
+    with _CLIENT_CACHE_LOCK:
+        client = _CLIENT_CACHE.get(key)
+        if client is None:
+            if backend == "local":
+                client = LocalLLMClient(config)
+            elif backend == "openai":
+                client = OpenAIClient(config)
+            else:
+                raise ValueError(f"Unknown backend: {backend}")
+            _CLIENT_CACHE[key] = client
+    return client
+
+
+def call_backend(backend: str, config: Dict, lane: str, call: Callable[[], Any], weight: int = 1) -> Any:
+    """
+    Run a client call once the backend's queue admits it (see scheduler)
+    
+    Args:
+        backend: "local" or "openai"
+        config: Backend configuration
+        lane: "interactive" or "bulk"
+        call: Function performing the client call
+        weight: Submissions graded by the call (pack size)
+        
+    Returns:
+        The value returned by call
+    """
+    queue = get_backend_queue(backend, config)
+    if queue is None:
+        return call()
+    return queue.run(lane, call, weight)
+
+
+async def acall_backend(backend: str, config: Dict, lane: str, call: Callable[[], Any], weight: int = 1) -> Any:
+    """Asyncio variant of call_backend; call returns an awaitable"""
+    queue = get_backend_queue(backend, config)
+    if queue is None:
+        return await call()
+    return await queue.arun(lane, call, weight)
+
+
+def route_to_local(text: str, context: Dict[str, Any], config: Dict, lane: str = INTERACTIVE) -> Dict[str, Any]:
     """Route to local LLM (Ollama)"""
-    client = LocalLLMClient(config)
-    return client.grade_submission(text, context)
+    client = get_client("local", config)
+    return call_backend("local", config, lane, lambda: client.grade_submission(text, context))
 
 
-def route_to_openai(text: str, context: Dict[str, Any], config: Dict) -> Dict[str, Any]:
+def route_to_openai(text: str, context: Dict[str, Any], config: Dict, lane: str = INTERACTIVE) -> Dict[str, Any]:
     """Route to OpenAI API"""
-    client = OpenAIClient(config)
-    return client.grade_submission(text, context)
+    client = get_client("openai", config)
+    return call_backend("openai", config, lane, lambda: client.grade_submission(text, context))
+
+
+def hybrid_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Read the hybrid section of the router config
+    
+    Returns:
+        Dictionary with weight_local, weight_api, consensus_threshold and
+        early_exit_confidence (a single result at or above it is used
+        without waiting for the other backend; None, the default, always
+        waits for both)
+    """
+    hybrid = config.get("hybrid", {})
+    early_exit = hybrid.get("early_exit_confidence")
+    return {
+        "weight_local": float(hybrid.get("weight_local", 0.5)),
+        "weight_api": float(hybrid.get("weight_api", 0.5)),
+        "consensus_threshold": float(hybrid.get("consensus_threshold", 0.8)),
+        "early_exit_confidence": float(early_exit) if early_exit is not None else None
+    }
+
+
+def is_decisive(result: Dict[str, Any], settings: Dict[str, Any]) -> bool:
+    """Check whether one backend's result is good enough on its own"""
+    if settings["early_exit_confidence"] is None:
+        return False
+    if result.get("error") or result.get("parsing_method") == "fallback":
+        return False
+    # Confidences are sums of float increments; round off the drift
+    return round(result.get("confidence", 0), 6) >= settings["early_exit_confidence"]
+
+
+def route_to_hybrid(text: str, context: Dict[str, Any], config: Dict, lane: str = INTERACTIVE) -> Dict[str, Any]:
+    """
+    Grade with local and API backends concurrently and combine the results
+    
+    Both results are combined by default. With hybrid.early_exit_confidence
+    set, a backend that answers first with a decisive result wins and the
+    other call is abandoned.
+    """
+    settings = hybrid_settings(config)
+    executor = ThreadPoolExecutor(max_workers=2)
+    futures = {
+        executor.submit(route_to_local, text, context, backend_config("local", config), lane): "local",
+        executor.submit(route_to_openai, text, context, backend_config("openai", config), lane): "openai"
+    }
+    
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = set(futures)
+    try:
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    results[futures[future]] = future.result()
+                except Exception as e:
+                    results[futures[future]] = {"error": True, "message": str(e), "total_score": 0, "confidence": 0.0}
+                if pending and is_decisive(results[futures[future]], settings):
+                    return combine_hybrid_results(results.get("local"), results.get("openai"), settings)
+    finally:
+        # A blocking HTTP call cannot be interrupted; the abandoned call
+        # finishes in the background and its result is dropped
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
+    
+    return combine_hybrid_results(results.get("local"), results.get("openai"), settings)
 
 
-def route_to_hybrid(text: str, context: Dict[str, Any], config: Dict) -> Dict[str, Any]:
-    """Use both local and API, return averaged results"""
-    local_result = route_to_local(text, context, config.get("local", {}))
-    api_result = route_to_openai(text, context, config.get("openai", {}))
+def combine_hybrid_results(local_result: Optional[Dict[str, Any]], api_result: Optional[Dict[str, Any]],
+                           settings: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Combine local and API results into one hybrid result
+    
+    Scores and confidences are weighted by hybrid.weight_local and
+    weight_api. When the two scores differ by more than the consensus
+    threshold allows, confidence is scaled down by their agreement so the
+    submission stands out for review. A missing or failed result leaves
+    the other one to stand alone.
     
-    # Average scores and combine feedback
-    avg_score = (local_result.get("total_score", 0) + api_result.get("total_score", 0)) / 2
+    Args:
+        local_result: Local backend result, or None if it was skipped
+        api_result: API backend result, or None if it was skipped
+        settings: Output of hybrid_settings (defaults to equal weights)
+    
+    Returns:
+        Hybrid grading result
+    """
+    settings = settings or hybrid_settings({})
+    usable = [r for r in (local_result, api_result) if r is not None and not r.get("error")]
+    
+    if len(usable) < 2:
+        if not usable:
+            # Both failed; report whichever error there is
+            return dict(local_result or api_result or {"error": True, "message": "No hybrid result", "total_score": 0, "confidence": 0.0},
+                        model_used="hybrid")
+        single = usable[0]
+        result = dict(single, model_used="hybrid", hybrid_source="local" if single is local_result else "openai")
+        if local_result is not None:
+            result["local_result"] = local_result
+        if api_result is not None:
+            result["api_result"] = api_result
+        return result
+    
+    w_local, w_api = settings["weight_local"], settings["weight_api"]
+    total_weight = (w_local + w_api) or 1.0
+    local_score = float(local_result.get("total_score", 0) or 0)
+    api_score = float(api_result.get("total_score", 0) or 0)
+    score = (w_local * local_score + w_api * api_score) / total_weight
+    confidence = (w_local * local_result.get("confidence", 0) + w_api * api_result.get("confidence", 0)) / total_weight
+    
+    max_score = float(local_result.get("max_score") or api_result.get("max_score") or 100) or 100.0
+    agreement = max(0.0, 1.0 - abs(local_score - api_score) / max_score)
+    consensus = agreement >= settings["consensus_threshold"]
+    if not consensus:
+        confidence *= agreement
     
     combined_feedback = f"Local LLM: {local_result.get('feedback', 'No feedback')}\n\n"
     combined_feedback += f"API LLM: {api_result.get('feedback', 'No feedback')}"
     
     return {
-        "total_score": avg_score,
+        "total_score": round(score, 2),
         "feedback": combined_feedback,
-        "confidence": (local_result.get("confidence", 0) + api_result.get("confidence", 0)) / 2,
+        "confidence": round(confidence, 3),
+        "agreement": round(agreement, 3),
+        "consensus": consensus,
         "model_used": "hybrid",
         "local_result": local_result,
         "api_result": api_result
     }
 
 
+async def aroute_to_hybrid(text: str, context: Dict[str, Any], config: Dict, lane: str = INTERACTIVE) -> Dict[str, Any]:
+    """Asyncio variant of route_to_hybrid; the abandoned request is cancelled"""
+    settings = hybrid_settings(config)
+    local_config = backend_config("local", config)
+    openai_config = backend_config("openai", config)
+    local_client = get_client("local", local_config)
+    openai_client = get_client("openai", openai_config)
+    tasks = {
+        asyncio.ensure_future(acall_backend("local", local_config, lane,
+                                            lambda: local_client.agrade_submission(text, context))): "local",
+        asyncio.ensure_future(acall_backend("openai", openai_config, lane,
+                                            lambda: openai_client.agrade_submission(text, context))): "openai"
+    }
+    
+    results: Dict[str, Dict[str, Any]] = {}
+    pending = set(tasks)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                try:
+                    results[tasks[task]] = task.result()
+                except Exception as e:
+                    results[tasks[task]] = {"error": True, "message": str(e), "total_score": 0, "confidence": 0.0}
+                if pending and is_decisive(results[tasks[task]], settings):
+                    return combine_hybrid_results(results.get("local"), results.get("openai"), settings)
+    finally:
+        for task in pending:
+            task.cancel()
+    
+    return combine_hybrid_results(results.get("local"), results.get("openai"), settings)
+
+
+def cascade_stages(config: Dict[str, Any]) -> List[Tuple[str, Dict[str, Any]]]:
+    """
+    Build the cascade's stages, cheapest first
+    
+    Stages come from cascade.stages ({"backend": ..., "model": ...}); by
+    default the first of models.local_models escalates to the configured
+    local model, so nothing leaves the machine unless an openai stage is
+    listed explicitly.
+    
+    Returns:
+        List of (backend, backend config) pairs
+    """
+    stages = config.get("cascade", {}).get("stages")
+    if not stages:
+        local_model = config.get("backends", {}).get("local", {}).get("model")
+        small_models = config.get("models", {}).get("local_models") or []
+        stages = [{"backend": "local", "model": model} for model in small_models[:1] if model != local_model]
+        stages.append({"backend": "local"})
+    
+    resolved = []
+    for stage in stages:
+        backend = stage.get("backend", "local")
+        if backend not in ("local", "openai"):
+            raise ValueError(f"Unknown cascade backend: {backend}")
+        stage_config = backend_config(backend, config)
+        stage_config.update({k: v for k, v in stage.items() if k != "backend"})
+        resolved.append((backend, stage_config))
+    return resolved
+
+
+def escalation_reason(result: Dict[str, Any], min_confidence: float) -> Optional[str]:
+    """Why a cascade stage's result should go to the next stage, if at all"""
+    if result.get("error"):
+        return "error"
+    if result.get("parsing_method") == "fallback":
+        return "fallback_parse"
+    if result.get("confidence", 0) < min_confidence:
+        return "low_confidence"
+    return None
+
+
+def _cascade_text(backend: str, text: str, config: Dict[str, Any], filtered: Dict[str, str]) -> str:
+    """Submission text for a stage; API stages get the privacy-filtered text"""
+    if backend != "openai":
+        return text
+    if "text" not in filtered:
+        filtered["text"] = filter_for_api(text, config.get("privacy_rules", {}))
+    return filtered["text"]
+
+
+def _finish_cascade(result: Dict[str, Any], trace: List[Dict[str, Any]], results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Pick the accepted (or best available) result and attach the trace"""
+    if trace[-1]["escalation"] is not None:
+        # No stage was confident enough; keep the most confident usable one
+        usable = [r for r in results if not r.get("error")]
+        if usable:
+            result = max(usable, key=lambda r: r.get("confidence", 0))
+    result = dict(result)
+    result["cascade"] = trace
+    return result
+
+
+def route_to_cascade(text: str, context: Dict[str, Any], config: Dict, lane: str = INTERACTIVE) -> Dict[str, Any]:
+    """
+    Grade with the cheapest stage first and escalate only when needed
+    
+    A stage's result is accepted once it parsed cleanly with confidence
+    at or above quality.min_confidence_threshold; otherwise the next,
+    larger stage grades the submission.
+    """
+    min_confidence = float(config.get("quality", {}).get("min_confidence_threshold", 0.6))
+    filtered: Dict[str, str] = {}
+    trace: List[Dict[str, Any]] = []
+    results: List[Dict[str, Any]] = []
+    
+    for backend, stage_config in cascade_stages(config):
+        client = get_client(backend, stage_config)
+        stage_text = _cascade_text(backend, text, config, filtered)
+        result = call_backend(backend, stage_config, lane, lambda: client.grade_submission(stage_text, context))
+        reason = escalation_reason(result, min_confidence)
+        results.append(result)
+        trace.append({"backend": backend, "model": client.model,
+                      "confidence": result.get("confidence", 0.0), "escalation": reason})
+        if reason is None:
+            break
+    
+    return _finish_cascade(result, trace, results)
+
+
+async def aroute_to_cascade(text: str, context: Dict[str, Any], config: Dict, lane: str = INTERACTIVE) -> Dict[str, Any]:
+    """Asyncio variant of route_to_cascade"""
+    min_confidence = float(config.get("quality", {}).get("min_confidence_threshold", 0.6))
+    filtered: Dict[str, str] = {}
+    trace: List[Dict[str, Any]] = []
+    results: List[Dict[str, Any]] = []
+    
+    for backend, stage_config in cascade_stages(config):
+        client = get_client(backend, stage_config)
+        stage_text = _cascade_text(backend, text, config, filtered)
+        result = await acall_backend(backend, stage_config, lane, lambda: client.agrade_submission(stage_text, context))
+        reason = escalation_reason(result, min_confidence)
+        results.append(result)
+        trace.append({"backend": backend, "model": client.model,
+                      "confidence": result.get("confidence", 0.0), "escalation": reason})
+        if reason is None:
+            break
+    
+    return _finish_cascade(result, trace, results)
+
+
+async def aroute_to_llm(text: str, context: Dict[str, Any], backend: str = "local", config: Optional[Dict] = None,
+                       lane: str = INTERACTIVE) -> Dict[str, Any]:
+    """
+    Asyncio variant of route_to_llm
+    
+    Clients share one keep-alive connection pool per backend host, so many
+    calls can be awaited concurrently from a single event loop. Callers
+    other than agrade_batch should await async_http.close_sessions()
+    before the loop closes.
+    
+    Args:
+        text: Student submission text
+        context: Assignment context from markdown
+        backend: Backend type ("local", "openai", "hybrid", "cascade")
+        config: Backend configuration
+        lane: Scheduler lane, "interactive" (served first) or "bulk"
+    
+    Returns:
+        Dictionary with grading results
+    """
+    if config is None:
+        config = {}
+    
+    try:
+        split = objective_split(text, context, backend, config)
+        if split is not None:
+            llm_result = None
+            if split["remaining_text"]:
+                llm_result = await aroute_to_llm(split["remaining_text"], context, backend, without_objective(config), lane)
+            return merge_objective(split, llm_result, config)
+        
+        if backend in ["openai", "hybrid"]:
+            text = filter_for_api(text, config.get("privacy_rules", {}))
+        
+        context = compact_context(text, context, config)
+        
+        cache, cache_key, cached = lookup_cached(text, context, backend, config)
+        if cached is not None:
+            return cached
+        
+        if backend in ("local", "openai"):
+            client_config = backend_config(backend, config)
+            client = get_client(backend, client_config)
+            result = await acall_backend(backend, client_config, lane, lambda: client.agrade_submission(text, context))
+        elif backend == "hybrid":
+            result = await aroute_to_hybrid(text, context, config, lane)
+        elif backend == "cascade":
+            result = await aroute_to_cascade(text, context, config, lane)
+        else:
+            raise ValueError(f"Unknown backend: {backend}")
+        
+        store_cached(cache, cache_key, result)
+        return result
+            
+    except Exception as e:
+        return {
+            "error": True,
+            "message": str(e),
+            "total_score": 0,
+            "confidence": 0.0
+        }
+
+
+async def agrade_batch(jobs: Iterable[Dict[str, Any]], backend: str = "local", config: Optional[Dict] = None) -> List[Dict[str, Any]]:
+    """
+    Grade jobs concurrently on the running event loop
+    
+    At most worker_count(config) jobs are started at once; with the
+    scheduler on, each backend's queue decides how many of them run.
+    The loop's HTTP sessions are closed when the batch ends.
+    
+    Args:
+        jobs: Iterable of job dictionaries (see load_submissions)
+        backend: Default backend type for jobs without one
+        config: Backend configuration
+        
+    Returns:
+        Result dictionaries tagged with the job "id", in input order
+    """
+    if config is None:
+        config = {}
+    
+    limit = asyncio.Semaphore(worker_count(config))
+    jobs = list(jobs)
+    
+    async def grade(job: Dict[str, Any]) -> Dict[str, Any]:
+        async with limit:
+            result = await aroute_to_llm(job.get("text", ""), job.get("context") or {},
+                                         job.get("backend", backend), job.get("config", config), lane_of(job))
+        result["id"] = job.get("id")
+        return result
+    
+    async def grade_pack(indexes: List[int]) -> None:
+        async with limit:
+            pack = [jobs[i] for i in indexes]
+            results = await aroute_packed([job.get("text", "") for job in pack], pack[0].get("context") or {},
+                                          pack[0].get("backend", backend), config)
+        for i, result in zip(indexes, results):
+            result["id"] = jobs[i].get("id")
+            ordered[i] = result
+    
+    # Short submissions of the same assignment share LLM calls
+    ordered: List[Any] = [None] * len(jobs)
+    singles, packs = [], []
+    groups: Dict[str, List[int]] = {}
+    max_students = max(1, int(packing_settings(config)["max_students"]))
+    for i, job in enumerate(jobs):
+        key = pack_key(job, backend, config)
+        if key is None:
+            singles.append(i)
+            continue
+        group = groups.setdefault(key, [])
+        group.append(i)
+        if len(group) == max_students:
+            packs.append(groups.pop(key))
+    packs.extend(groups.values())
+    
+    async def grade_single(i: int) -> None:
+        ordered[i] = await grade(jobs[i])
+    
+    try:
+        await asyncio.gather(*(grade_single(i) for i in singles), *(grade_pack(p) for p in packs))
+    finally:
+        await close_sessions()
+    return ordered
+
+
+def worker_count(config: Dict[str, Any]) -> int:
+    """
+    Jobs a batch run keeps in flight
+    
+    performance.concurrent_requests, raised to scheduler.max_concurrency
+    when the scheduler is on so its adaptive limit has room to grow.
+    """
+    concurrent = max(1, int(config.get("performance", {}).get("concurrent_requests", 3)))
+    settings = scheduler_settings(config)
+    if settings["enabled"]:
+        return max(concurrent, int(settings["max_concurrency"]))
+    return concurrent
+
+
+def _error_result(message: str) -> Dict[str, Any]:
+    return {"error": True, "message": message, "total_score": 0, "confidence": 0.0}
+
+
+def _prepare_packed(texts: List[str], context: Dict[str, Any], backend: str, config: Dict) -> Tuple[List[Any], List[Dict[str, Any]]]:
+    """
+    Resolve what can be answered without the LLM before packing
+    
+    Returns:
+        Tuple of (results with None where the LLM is needed, work items
+        {"index", "text", "split", "cache", "key"})
+    """
+    results: List[Any] = [None] * len(texts)
+    work = []
+    for i, text in enumerate(texts):
+        split = objective_split(text, context, backend, config)
+        if split is not None:
+            if not split["remaining_text"]:
+                results[i] = merge_objective(split, None, config)
+                continue
+            text = split["remaining_text"]
+        if backend == "openai":
+            text = filter_for_api(text, config.get("privacy_rules", {}))
+        
+        cache, key, cached = lookup_cached(text, compact_context(text, context, config), backend, config)
+        if cached is not None:
+            results[i] = merge_objective(split, cached, config) if split else cached
+            continue
+        work.append({"index": i, "text": text, "split": split, "cache": cache, "key": key})
+    return results, work
+
+
+def _finish_packed(results: List[Any], work: List[Dict[str, Any]], graded: Dict[str, Dict[str, Any]], config: Dict) -> List[Dict[str, Any]]:
+    """Cache the LLM results of packed work items and merge them into place"""
+    for pack_id, item in zip(pack_ids(len(work)), work):
+        result = graded[pack_id]
+        store_cached(item["cache"], item["key"], result)
+        results[item["index"]] = merge_objective(item["split"], result, config) if item["split"] else result
+    return results
+
+
+def _pack_max_tokens(client: Any, items: List[Tuple[str, str]], context: Dict[str, Any], config: Dict) -> int:
+    budget = sum(client.budget_for(text, context) for _, text in items)
+    return min(budget, int(packing_settings(config)["max_output_tokens"]))
+
+
+def _grade_packed_items(client: Any, items: List[Tuple[str, str]], context: Dict[str, Any],
+                        config: Dict, backend: str, lane: str = BULK) -> Dict[str, Dict[str, Any]]:
+    """
+    Grade a pack, splitting it when the response cannot be fully parsed
+    
+    Items the model left out or garbled are regraded as a smaller pack
+    (halved when nothing parsed); a single item is graded normally.
+    """
+    client_config = backend_config(backend, config)
+    if len(items) == 1:
+        pack_id, text = items[0]
+        return {pack_id: call_backend(backend, client_config, lane,
+                                      lambda: client.grade_submission(text, context))}
+    
+    try:
+        max_tokens = _pack_max_tokens(client, items, context, config)
+        graded = call_backend(backend, client_config, lane,
+                              lambda: client.grade_packed(items, context, max_tokens), len(items))
+    except Exception as e:
+        return {pack_id: _error_result(f"Packed grading error: {str(e)}") for pack_id, _ in items}
+    
+    missing = [item for item in items if item[0] not in graded]
+    if len(missing) == len(items):
+        half = len(items) // 2
+        graded.update(_grade_packed_items(client, items[:half], context, config, backend, lane))
+        graded.update(_grade_packed_items(client, items[half:], context, config, backend, lane))
+    elif missing:
+        graded.update(_grade_packed_items(client, missing, context, config, backend, lane))
+    return graded
+
+
+async def _agrade_packed_items(client: Any, items: List[Tuple[str, str]], context: Dict[str, Any],
+                               config: Dict, backend: str, lane: str = BULK) -> Dict[str, Dict[str, Any]]:
+    """Asyncio variant of _grade_packed_items"""
+    client_config = backend_config(backend, config)
+    if len(items) == 1:
+        pack_id, text = items[0]
+        return {pack_id: await acall_backend(backend, client_config, lane,
+                                             lambda: client.agrade_submission(text, context))}
+    
+    try:
+        max_tokens = _pack_max_tokens(client, items, context, config)
+        graded = await acall_backend(backend, client_config, lane,
+                                     lambda: client.agrade_packed(items, context, max_tokens), len(items))
+    except Exception as e:
+        return {pack_id: _error_result(f"Packed grading error: {str(e)}") for pack_id, _ in items}
+    
+    missing = [item for item in items if item[0] not in graded]
+    if len(missing) == len(items):
+        half = len(items) // 2
+        graded.update(await _agrade_packed_items(client, items[:half], context, config, backend, lane))
+        graded.update(await _agrade_packed_items(client, items[half:], context, config, backend, lane))
+    elif missing:
+        graded.update(await _agrade_packed_items(client, missing, context, config, backend, lane))
+    return graded
+
+
+def route_packed(texts: List[str], context: Dict[str, Any], backend: str, config: Dict,
+                 lane: str = BULK) -> List[Dict[str, Any]]:
+    """
+    Grade several short submissions of one assignment in shared LLM calls
+    
+    Objective items, privacy filtering and the result cache are handled
+    per submission as in route_to_llm; the remaining texts are sent
+    together under positional ids (S1, S2, ...) and the returned array is
+    split back into individual results.
+    
+    Args:
+        texts: Submission texts
+        context: Assignment context shared by all texts
+        backend: "local" or "openai"
+        config: Full router configuration
+        lane: Scheduler lane
+        
+    Returns:
+        Grading results in input order
+    """
+    try:
+        results, work = _prepare_packed(texts, context, backend, config)
+        if work:
+            client = get_client(backend, backend_config(backend, config))
+            items = list(zip(pack_ids(len(work)), [item["text"] for item in work]))
+            # The pack shares the sections of every question its members answer
+            pack_context = compact_context("\n".join(item["text"] for item in work), context, config)
+            _finish_packed(results, work, _grade_packed_items(client, items, pack_context, config, backend, lane), config)
+        return results
+    except Exception as e:
+        return [_error_result(str(e)) for _ in texts]
+
+
+async def aroute_packed(texts: List[str], context: Dict[str, Any], backend: str, config: Dict,
+                        lane: str = BULK) -> List[Dict[str, Any]]:
+    """Asyncio variant of route_packed"""
+    try:
+        results, work = _prepare_packed(texts, context, backend, config)
+        if work:
+            client = get_client(backend, backend_config(backend, config))
+            items = list(zip(pack_ids(len(work)), [item["text"] for item in work]))
+            pack_context = compact_context("\n".join(item["text"] for item in work), context, config)
+            _finish_packed(results, work, await _agrade_packed_items(client, items, pack_context, config, backend, lane),
+                           config)
+        return results
+    except Exception as e:
+        return [_error_result(str(e)) for _ in texts]
+
+
+def pack_key(job: Dict[str, Any], backend: str, config: Dict[str, Any]) -> Optional[str]:
+    """
+    Grouping key for packable jobs, or None when a job must go alone
+    
+    Jobs pack together when they share backend, config and context and
+    their text is short enough.
+    """
+    settings = packing_settings(config)
+    job_backend = job.get("backend", backend)
+    if not settings["enabled"] or job.get("invalid") or job_backend not in ("local", "openai"):
+        return None
+    if "config" in job or not is_packable(job.get("text", ""), settings):
+        return None
+    return job_backend + ":" + json.dumps(job.get("context") or {}, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def backend_models(backend: str, config: Dict[str, Any]) -> List[str]:
+    """Backend and model of every stage a backend mode grades with"""
+    if backend == "cascade":
+        try:
+            return [f"{name}:{stage.get('model', '')}" for name, stage in cascade_stages(config)]
+        except ValueError:
+            return []
+    names = {"hybrid": ["local", "openai"], BATCH_BACKEND: ["openai"]}.get(backend, [backend])
+    return [f"{name}:{config.get('backends', {}).get(name, {}).get('model', '')}" for name in names]
+
+
+def ledger_fingerprint(job: Dict[str, Any], backend: str, config: Dict[str, Any]) -> str:
+    """Fingerprint of a job for the ledger (see job_ledger.job_fingerprint)"""
+    job_backend = job.get("backend", backend)
+    return job_fingerprint(job.get("text", ""), job.get("context") or {}, job_backend,
+                           backend_models(job_backend, job.get("config", config)))
+
+
+def _grade_pack(jobs: List[Dict[str, Any]], backend: str, config: Dict[str, Any],
+                ledger: Optional[JobLedger] = None) -> List[Dict[str, Any]]:
+    """Grade a group of packable jobs (see pack_key)"""
+    for job in jobs:
+        if ledger is not None and job.get("id") is not None:
+            ledger.mark_in_flight(job["id"])
+    
+    results = route_packed([job.get("text", "") for job in jobs], jobs[0].get("context") or {},
+                           jobs[0].get("backend", backend), config)
+    
+    for job, result in zip(jobs, results):
+        result["id"] = job.get("id")
+        result["attempts"] = 1
+        if ledger is not None and job.get("id") is not None:
+            ledger.mark_finished(job["id"], result, ledger_fingerprint(job, backend, config))
+    return results
+
+
+def iter_container(path: Union[str, Path]) -> Iterator[Dict[str, Any]]:
+    """Stream submission records from a JSONL container, one line at a time"""
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def load_submissions(submissions: Union[str, Iterable[Any]], context: Optional[Dict[str, Any]] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Normalize submissions into grading jobs
+    
+    Args:
+        submissions: Directory of .txt files, a JSONL container written by
+            csv_processor.py, or an iterable of file paths or job dicts
+            ({"id", "text", ...})
+        context: Default assignment context for jobs without one
+        
+    Yields:
+        Job dictionaries with "id", "text" and "context" keys
+    """
+    if isinstance(submissions, (str, Path)):
+        if str(submissions).endswith(".jsonl"):
+            submissions = iter_container(submissions)
+        else:
+            submissions = sorted(Path(submissions).glob("*.txt"))
+    
+    for item in submissions:
+        if isinstance(item, dict):
+            job = dict(item)
+        else:
+            path = Path(item)
+            with open(path, 'r', encoding='utf-8') as f:
+                job = {"id": path.stem, "text": f.read()}
+        
+        if not job.get("context"):
+            job["context"] = context or {}
+        yield job
+
+
+def _grade_job(job: Dict[str, Any], backend: str, config: Dict[str, Any],
+               ledger: Optional[JobLedger] = None) -> Dict[str, Any]:
+    """Grade one job (transient backend failures are retried by the clients)"""
+    tracked = ledger is not None and job.get("id") is not None
+    
+    if job.get("invalid"):
+        result = {
+            "error": True,
+            "message": job["invalid"],
+            "total_score": 0,
+            "confidence": 0.0,
+            "id": job.get("id")
+        }
+        if tracked:
+            ledger.mark_finished(job["id"], result, ledger_fingerprint(job, backend, config))
+        return result
+    
+    if tracked:
+        ledger.mark_in_flight(job["id"])
+    
+    job_backend = job.get("backend", backend)
+    job_config = job.get("config", config)
+    
+    result = route_to_llm(job.get("text", ""), job.get("context") or {}, job_backend, job_config, lane_of(job))
+    result["id"] = job.get("id")
+    result["attempts"] = 1
+    
+    if tracked:
+        ledger.mark_finished(job["id"], result, ledger_fingerprint(job, backend, config))
+    return result
+
+
+_END_OF_INPUT = object()
+
+
+def _read_ahead(jobs: Iterable[Dict[str, Any]], size: int) -> "queue.Queue[Any]":
+    """
+    Pull jobs on a background thread into a bounded queue
+    
+    The queue ends with _END_OF_INPUT, or with the exception the job
+    iterator raised. Reading blocks while the queue is full, so a slow
+    batch does not buffer its whole input.
+    """
+    incoming: "queue.Queue[Any]" = queue.Queue(maxsize=max(1, size))
+    
+    def read() -> None:
+        try:
+            for job in jobs:
+                incoming.put(job)
+        except Exception as e:
+            incoming.put(e)
+        incoming.put(_END_OF_INPUT)
+    
+    threading.Thread(target=read, name="krurooai-input", daemon=True).start()
+    return incoming
+
+
+def iter_grade_batch(jobs: Iterable[Dict[str, Any]], backend: str = "local", config: Optional[Dict] = None,
+                     ledger: Optional[JobLedger] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Grade jobs over a bounded thread pool, yielding results as they finish
+    
+    Jobs are read ahead on a separate thread, at most a few times
+    performance.concurrent_requests at once, and each is started as soon
+    as it arrives, so a client feeding one job at a time over an open
+    pipe gets each result without sending the next job first.
+    
+    Args:
+        jobs: Iterable of job dictionaries (see load_submissions)
+        backend: Default backend type for jobs without one
+        config: Backend configuration
+        ledger: Optional job ledger; every state change is recorded, and
+            when resuming, completed jobs are not regraded unless their
+            text, context, backend or model changed
+        
+    Yields:
+        Result dictionaries tagged with the job "id", in completion order;
+        results of jobs completed in an earlier run carry "skipped": True.
+        Jobs for the "openai-batch" backend are collected and graded
+        through the Batch API after all other jobs.
+    """
+    if config is None:
+        config = {}
+    
+    max_workers = worker_count(config)
+    max_students = max(1, int(packing_settings(config)["max_students"]))
+    incoming = _read_ahead(jobs, max_workers * 2)
+    exhausted = False
+    pending = set()
+    batch_jobs = []
+    packs: Dict[str, List[Dict[str, Any]]] = {}
+    last_arrival = time.monotonic()
+    
+    def flush_packs() -> None:
+        for pack in packs.values():
+            pending.add(executor.submit(_grade_pack, pack, backend, config, ledger))
+        packs.clear()
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while True:
+            while not exhausted and len(pending) < max_workers * 2:
+                # Block for input only when nothing else can make progress
+                idle = not pending
+                try:
+                    if idle:
+                        job = incoming.get(timeout=PACK_IDLE_FLUSH if packs else None)
+                    else:
+                        job = incoming.get_nowait()
+                except queue.Empty:
+                    if idle:
+                        flush_packs()
+                    break
+                
+                if job is _END_OF_INPUT:
+                    exhausted = True
+                    break
+                if isinstance(job, BaseException):
+                    raise job
+                last_arrival = time.monotonic()
+                
+                if ledger is not None and job.get("id") is not None:
+                    completed = ledger.completed_result(job["id"], ledger_fingerprint(job, backend, config))
+                    if completed is not None:
+                        completed.update(id=job["id"], skipped=True)
+                        yield completed
+                        continue
+                    ledger.mark_pending(job["id"])
+                
+                if job.get("backend", backend) == BATCH_BACKEND:
+                    batch_jobs.append(job)
+                    continue
+                
+                key = pack_key(job, backend, config)
+                if key is not None:
+                    pack = packs.setdefault(key, [])
+                    pack.append(job)
+                    if len(pack) == max_students:
+                        pending.add(executor.submit(_grade_pack, packs.pop(key), backend, config, ledger))
+                    continue
+                
+                pending.add(executor.submit(_grade_job, job, backend, config, ledger))
+            
+            # Partly filled packs go out once no more jobs can join them, or
+            # once input has been idle for a while
+            if packs and (exhausted or time.monotonic() - last_arrival >= PACK_IDLE_FLUSH):
+                flush_packs()
+            
+            if not pending:
+                if exhausted:
+                    break
+                continue
+            
+            # Wake up regularly so jobs arriving meanwhile start right away
+            done, pending = wait(pending, timeout=None if exhausted else INPUT_POLL,
+                                 return_when=FIRST_COMPLETED)
+            for future in done:
+                result = future.result()
+                if isinstance(result, list):
+                    yield from result
+                else:
+                    yield result
+    
+    if batch_jobs:
+        yield from iter_grade_openai_batch(batch_jobs, config, ledger)
+
+
+def iter_grade_openai_batch(jobs: List[Dict[str, Any]], config: Dict[str, Any],
+                            ledger: Optional[JobLedger] = None) -> Iterator[Dict[str, Any]]:
+    """
+    Grade jobs through the OpenAI Batch API
+    
+    Texts are privacy-filtered and checked against the result cache (shared
+    with the interactive "openai" backend); the rest are submitted as
+    batches of at most backends.openai.batch_max_requests, polled until
+    done, and mapped back to their jobs by id.
+    
+    Args:
+        jobs: Job dictionaries (see load_submissions)
+        config: Full router configuration
+        ledger: Optional job ledger
+        
+    Yields:
+        Result dictionaries tagged with the job "id"
+    """
+    openai_config = backend_config("openai", config)
+    privacy_rules = config.get("privacy_rules", {})
+    chunk_size = max(1, int(openai_config.get("batch_max_requests", 50000)))
+    
+    def finish(job: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        result["id"] = job.get("id")
+        result["attempts"] = 1
+        if ledger is not None and job.get("id") is not None:
+            ledger.mark_finished(job["id"], result, ledger_fingerprint(job, BATCH_BACKEND, config))
+        return result
+    
+    queued = []
+    for job in jobs:
+        if job.get("invalid"):
+            yield _grade_job(job, BATCH_BACKEND, config, ledger)
+            continue
+        
+        text = filter_for_api(job.get("text", ""), privacy_rules)
+        context = compact_context(text, job.get("context") or {}, config)
+        cache, cache_key, cached = lookup_cached(text, context, "openai", config)
+        if cached is not None:
+            yield finish(job, cached)
+        else:
+            queued.append((job, text, context, cache, cache_key))
+    
+    for start in range(0, len(queued), chunk_size):
+        chunk = queued[start:start + chunk_size]
+        items = [(str(index), text, context) for index, (_, text, context, _, _) in enumerate(chunk)]
+        
+        if ledger is not None:
+            for job, _, _, _, _ in chunk:
+                if job.get("id") is not None:
+                    ledger.mark_in_flight(job["id"])
+        
+        try:
+            results = get_client("openai", openai_config).grade_batch_api(items)
+        except Exception as e:
+            results = {custom_id: {
+                "error": True,
+                "message": f"OpenAI batch error: {str(e)}",
+                "total_score": 0,
+                "confidence": 0.0
+            } for custom_id, _, _ in items}
+        
+        for index, (job, _, _, cache, cache_key) in enumerate(chunk):
+            result = results[str(index)]
+            store_cached(cache, cache_key, result)
+            yield finish(job, result)
+
+
+def write_result(result: Dict[str, Any], output_dir: Union[str, Path]) -> Path:
+    """Atomically write one grading result as <id>.json"""
+    output_path = Path(output_dir) / f"{result.get('id')}.json"
+    tmp_path = output_path.with_suffix(".json.tmp")
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, output_path)
+    return output_path
+
+
+def grade_batch(submissions: Union[str, Iterable[Any]], context: Optional[Dict[str, Any]] = None,
+                backend: str = "local", config: Optional[Dict] = None,
+                output_dir: Optional[str] = None,
+                on_result: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """
+    Grade many submissions concurrently
+    
+    Honors performance.concurrent_requests and batch_size (progress
+    interval) from llm.yaml; retry_attempts and retry_delay apply per
+    request inside the clients.
+    
+    Args:
+        submissions: Directory of .txt files, or list of paths / job dicts
+        context: Assignment context shared by all submissions
+        backend: Backend type ("local", "openai", "hybrid")
+        config: Backend configuration
+        output_dir: If given, each result is written there as soon as it finishes
+        on_result: Optional callback invoked with each finished result
+        
+    Returns:
+        Summary dictionary with counts and the list of results
+    """
+    if config is None:
+        config = {}
+    
+    if output_dir:
+        Path(output_dir).mkdir(parents=True, exist_ok=True)
+    
+    progress_every = max(1, int(config.get("performance", {}).get("batch_size", 5)))
+    summary = {
+        "total": 0,
+        "succeeded": 0,
+        "failed": 0,
+        "skipped": 0,
+        "results": []
+    }
+    
+    ledger = open_ledger(config)
+    try:
+        for result in iter_grade_batch(load_submissions(submissions, context), backend, config, ledger):
+            summary["total"] += 1
+            if result.get("error"):
+                summary["failed"] += 1
+            else:
+                summary["succeeded"] += 1
+            if result.get("skipped"):
+                summary["skipped"] += 1
+            summary["results"].append(result)
+            
+            if output_dir:
+                write_result(result, output_dir)
+            if on_result:
+                on_result(result)
+            
+            if summary["total"] % progress_every == 0:
+                print(f"Graded {summary['total']} submissions ({summary['failed']} failed)", file=sys.stderr)
+    finally:
+        if ledger is not None:
+            ledger.close()
+    
+    # Process-wide parse outcomes per model, so a rising fallback rate shows up
+    summary["parse_stats"] = PARSE_STATS.snapshot()
+    summary["scheduler"] = queue_status()
+    return summary
+
+
 def extract_feedback(response: str) -> Dict[str, Any]:
     """
     Extract structured feedback from LLM response
@@ -172,10 +1294,84 @@ def calculate_confidence(response: Dict[str, Any]) -> float:
     return max(0.0, min(1.0, confidence))
 
 
+def serve(config: Dict[str, Any], stdin=None, stdout=None) -> int:
+    """
+    Run as a long-lived grading worker over JSON lines
+    
+    Each input line is a job object with "id", "text", "context" and
+    "backend" keys (an optional "config" replaces the worker config for
+    that job, and "lane": "interactive" puts it ahead of bulk jobs). One result object, tagged with the job "id", is written per
+    line, in completion order, as soon as the job finishes; the client
+    may keep the pipe open and wait for a result before sending the next
+    job. Clients and their connections stay alive
+    between jobs, and jobs run concurrently per performance settings.
+    With a "ledger" section in the config, job states are recorded so an
+    interrupted run can be resumed.
+    
+    Args:
+        config: Default configuration for all jobs
+        stdin: Input stream (defaults to sys.stdin)
+        stdout: Output stream (defaults to sys.stdout)
+        
+    Returns:
+        Number of jobs processed
+    """
+    stdin = stdin or sys.stdin
+    stdout = stdout or sys.stdout
+    processed = 0
+    
+    def read_jobs() -> Iterator[Dict[str, Any]]:
+        for line in stdin:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError as e:
+                yield {"id": None, "invalid": f"Invalid job line: {str(e)}"}
+    
+    backend = config.get("default_backend", "local")
+    ledger = open_ledger(config)
+    try:
+        for result in iter_grade_batch(read_jobs(), backend, config, ledger):
+            stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+            stdout.flush()
+            processed += 1
+    finally:
+        if ledger is not None:
+            ledger.close()
+    
+    return processed
+
+
+def load_config_file(path: str) -> Dict[str, Any]:
+    """Load a JSON configuration file written by the R layer"""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
 def main():
     """CLI interface for testing the router"""
+    if len(sys.argv) > 1 and sys.argv[1] == "--serve":
+        config = load_config_file(sys.argv[2]) if len(sys.argv) > 2 else {}
+        serve(config)
+        return
+    
+    if len(sys.argv) > 1 and sys.argv[1] == "--batch":
+        if len(sys.argv) < 5:
+            print("Usage: python llm_router.py --batch <submissions_dir|container.jsonl> <context_json> <backend> [config_file] [output_dir]")
+            sys.exit(1)
+        config = load_config_file(sys.argv[5]) if len(sys.argv) > 5 else {}
+        output_dir = sys.argv[6] if len(sys.argv) > 6 else None
+        summary = grade_batch(sys.argv[2], json.loads(sys.argv[3]), sys.argv[4], config, output_dir)
+        summary.pop("results")
+        print(json.dumps(summary, indent=2, ensure_ascii=False))
+        return
+    
     if len(sys.argv) < 4:
         print("Usage: python llm_router.py <text> <context_json> <backend> [config_json]")
+        print("       python llm_router.py --serve [config_file] < jobs.jsonl")
+        print("       python llm_router.py --batch <submissions_dir|container.jsonl> <context_json> <backend> [config_file] [output_dir]")
         sys.exit(1)
     
     text = sys.argv[1]
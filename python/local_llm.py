@@ -8,18 +8,64 @@ Handles communication with local LLM models
 import requests
 import json
 import sys
-from typing import Dict, Any, Optional
+import asyncio
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Callable, Awaitable, Tuple, TypeVar
+
+import async_http
+from stream_parser import IncrementalJSONScanner
+from resilience import RetryPolicy, BackendHTTPError, get_breaker, parse_retry_after
+from endpoint_pool import parse_endpoints, get_endpoint_pool, is_host_failure, DEFAULT_COOLDOWN
+from packing import PACKED_INSTRUCTION, build_packed_block, parse_packed
+from grading_schema import (FULL_FIELDS, grading_schema, packed_schema, ollama_format,
+                            extract_json_object, check_result, PARSE_STATS)
+from token_budget import output_budget, verbosity_level
+
+
+T = TypeVar("T")
+
+# Assignment prompt prefixes kept per client (one per distinct context)
+PREFIX_CACHE_SIZE = 64
 
 
 class LocalLLMClient:
     """Client for local LLM via Ollama"""
     
-    def __init__(self, config: Dict[str, Any]):
+    def __init__(self, config: Dict[str, Any], on_progress: Optional[Callable[[Dict[str, Any]], None]] = None):
         self.model = config.get("model", "gpt-oss:20b")
-        self.endpoint = config.get("endpoint", "http://localhost:11434")
+        # One or more Ollama hosts; requests go to the least loaded one
+        self.endpoints = parse_endpoints(config)
+        self.endpoint = self.endpoints[0]
+        self.pool = get_endpoint_pool(self.endpoints, config.get("endpoint_cooldown", DEFAULT_COOLDOWN))
         self.temperature = config.get("temperature", 0.3)
         self.timeout = config.get("timeout", 60)
         self.max_tokens = config.get("max_tokens", 4000)
+        self.connection_limit = config.get("connection_limit_per_host", 4)
+        # Keep the model (and its prompt KV cache) loaded between students
+        self.keep_alive = config.get("keep_alive", "30m")
+        self.prefix_cache_size = max(1, int(config.get("prefix_cache_size", PREFIX_CACHE_SIZE)))
+        self._prefix_cache: "OrderedDict[str, str]" = OrderedDict()
+        self._prefix_lock = threading.Lock()
+        # Streaming parses the JSON as it arrives and stops generation early
+        self.stream = config.get("stream", False)
+        # Constrain decoding to the grading schema ("json_schema", "json"
+        # for older Ollama versions, or false)
+        self.structured_output = config.get("structured_output", "json_schema")
+        self.schema = grading_schema(FULL_FIELDS)
+        # Output budget and feedback verbosity; the router passes the
+        # token_budget settings in
+        self.token_budget = config.get("token_budget")
+        self.verbosity = verbosity_level(self.token_budget)
+        self.on_progress = on_progress
+        # Reuse one HTTP connection pool across calls (keep-alive)
+        self.session = requests.Session()
+        # Transient failures are retried with backoff; the router passes
+        # the performance settings in as "retry"
+        # Host failures fail over to the next host first; the retry policy
+        # only sees a failure once every host has been tried
+        breaker_name = "local:" + ",".join(self.endpoints)
+        self.retry = RetryPolicy(config.get("retry"), get_breaker(breaker_name, config.get("retry")))
         
     def grade_submission(self, text: str, context: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -34,8 +80,48 @@ class LocalLLMClient:
         """
         try:
             prompt = self._build_grading_prompt(text, context)
-            response = self._call_ollama(prompt)
-            return self._parse_response(response)
+            budget = self.budget_for(text, context)
+            result = self._parse_response(self._generate(prompt, budget))
+            if result.get("parsing_method") == "fallback" and budget < self.max_tokens:
+                # Most likely cut off by the budget; retry once at the full limit
+                result = self._parse_response(self._generate(prompt, self.max_tokens))
+            return result
+            
+        except Exception as e:
+            return {
+                "error": True,
+                "message": f"Local LLM error: {str(e)}",
+                "total_score": 0,
+                "confidence": 0.0,
+                "model_used": self.model
+            }
+    
+    async def agrade_submission(self, text: str, context: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Grade a student submission without blocking the event loop
+        
+        Requests share one keep-alive connection pool per endpoint. Falls
+        back to a worker thread when aiohttp is not installed.
+        
+        Args:
+            text: Student submission
+            context: Assignment context
+            
+        Returns:
+            Grading results dictionary
+        """
+        if not async_http.is_available():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.grade_submission, text, context)
+        
+        try:
+            prompt = self._build_grading_prompt(text, context)
+            budget = self.budget_for(text, context)
+            result = self._parse_response(await self._agenerate(prompt, budget))
+            if result.get("parsing_method") == "fallback" and budget < self.max_tokens:
+                # Most likely cut off by the budget; retry once at the full limit
+                result = self._parse_response(await self._agenerate(prompt, self.max_tokens))
+            return result
             
         except Exception as e:
             return {
@@ -46,8 +132,92 @@ class LocalLLMClient:
                 "model_used": self.model
             }
     
+    def budget_for(self, text: str, context: Dict[str, Any]) -> int:
+        """Completion budget for one submission (see token_budget)"""
+        return output_budget(text, context, self.token_budget, self.max_tokens)
+    
+    def _generate(self, prompt: str, num_predict: int) -> str:
+        """Run one generation with retries and host failover"""
+        return self.retry.call(lambda: self._dispatch(
+            lambda endpoint: self._call_ollama(endpoint, prompt, num_predict=num_predict)))
+    
+    async def _agenerate(self, prompt: str, num_predict: int) -> str:
+        """Asyncio variant of _generate"""
+        return await self.retry.acall(lambda: self._adispatch(
+            lambda endpoint: self._acall_ollama(endpoint, prompt, num_predict=num_predict)))
+    
+    def grade_packed(self, items: List[Tuple[str, str]], context: Dict[str, Any],
+                     max_tokens: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """
+        Grade several short submissions in one generation
+        
+        Args:
+            items: List of (pack id, submission text)
+            context: Assignment context shared by all items
+            max_tokens: Completion budget for the whole pack
+            
+        Returns:
+            Mapping of pack id to grading result; ids the model did not
+            answer properly are missing. Transport errors are raised.
+        """
+        prompt = self._build_packed_prompt(items, context)
+        num_predict = max_tokens or self.max_tokens * len(items)
+        response = self.retry.call(lambda: self._dispatch(
+            lambda endpoint: self._call_ollama(endpoint, prompt, num_predict=num_predict, packed=True)))
+        return self._parse_packed(response, [pack_id for pack_id, _ in items])
+    
+    async def agrade_packed(self, items: List[Tuple[str, str]], context: Dict[str, Any],
+                            max_tokens: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+        """Asyncio variant of grade_packed"""
+        if not async_http.is_available():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(None, self.grade_packed, items, context, max_tokens)
+        
+        prompt = self._build_packed_prompt(items, context)
+        num_predict = max_tokens or self.max_tokens * len(items)
+        response = await self.retry.acall(lambda: self._adispatch(
+            lambda endpoint: self._acall_ollama(endpoint, prompt, num_predict=num_predict, packed=True)))
+        return self._parse_packed(response, [pack_id for pack_id, _ in items])
+    
+    def _build_packed_prompt(self, items: List[Tuple[str, str]], context: Dict[str, Any]) -> str:
+        """Build a prompt holding several submissions after the shared prefix"""
+        prompt = self._build_prompt_prefix(context)
+        prompt += f"## งานของนักเรียน ({len(items)} คน):\n{build_packed_block(items)}\n"
+        prompt += PACKED_INSTRUCTION
+        return prompt
+    
+    def _parse_packed(self, response: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+        """Parse a packed response, adding the usual metadata to each result"""
+        results = {}
+        for pack_id, parsed in parse_packed(response, ids).items():
+            parsed = check_result(parsed, self.model, self.schema)
+            if parsed is None:
+                continue
+            results[pack_id] = parsed
+            parsed["model_used"] = self.model
+            parsed["confidence"] = self._calculate_confidence(parsed)
+            parsed["packed"] = len(ids)
+        return results
+    
     def _build_grading_prompt(self, text: str, context: Dict[str, Any]) -> str:
         """Build grading prompt from context and submission"""
+        # The submission goes last so every student of an assignment shares
+        # a byte-identical prefix that Ollama can serve from its KV cache
+        prompt = self._build_prompt_prefix(context)
+        prompt += f"## งานของนักเรียน:\n{text}\n\n"
+        prompt += "ตอบเป็น JSON ตามรูปแบบข้างต้นเท่านั้น"
+        
+        return prompt
+    
+    def _build_prompt_prefix(self, context: Dict[str, Any]) -> str:
+        """Build (and memoize) the assignment-level part of the prompt"""
+        key = json.dumps(context, sort_keys=True, ensure_ascii=False, default=str)
+        with self._prefix_lock:
+            cached = self._prefix_cache.get(key)
+            if cached is not None:
+                self._prefix_cache.move_to_end(key)
+                return cached
+        
         prompt = "คุณเป็นผู้ช่วยอาจารย์ในการตรวจงานการศึกษา กรุณาตรวจและให้คะแนนงานนี้\n\n"
         
         if context.get("question"):
@@ -59,94 +229,242 @@ class LocalLLMClient:
         if context.get("standard_answer"):
             prompt += f"## คำตอบมาตรฐาน:\n{context['standard_answer']}\n\n"
         
-        prompt += f"## งานของนักเรียน:\n{text}\n\n"
-        
-        prompt += """## คำสั่ง:
-ตรวจงานและให้คะแนน พร้อม feedback รายข้อแบบละเอียด โดยแยกประเภทคำถาม ในรูปแบบ JSON:
+        level = self.verbosity
+        prompt += f"""## คำสั่ง:
+ตรวจงานและให้คะแนน พร้อม feedback รายข้อ{level['style']} โดยแยกประเภทคำถาม ในรูปแบบ JSON:
 
 **สำคัญ**: 
 1. ระบุประเภทของแต่ละข้อ: "objective" (ปรนัย/เลือกตอบ) หรือ "subjective" (อัตนัย/เขียนตอบ)
 2. สำหรับข้อปรนัย: ให้คำตอบที่ถูกต้องและอธิบายเหตุผล
 3. สำหรับข้ออัตนัย: ระบุจุดสำคัญที่ควรมีและข้อเสนอแนะการพัฒนา
-4. ให้ความเห็นและข้อเสนอแนะอย่างละเอียด อย่างน้อย 3-5 ประโยคต่อหัวข้อ
+4. {level['instruction']}
 
-{
+{{
     "total_score": <คะแนนรวม 0-100>,
-    "breakdown": {
+    "breakdown": {{
         "accuracy": <คะแนนความถูกต้อง>,
         "method": <คะแนนวิธีการ>,
         "presentation": <คะแนนการนำเสนอ>
-    },
+    }},
     "question_feedback": [
-        {
+        {{
             "question_number": 1,
             "question_type": "<objective|subjective>",
             "score": <คะแนน>,
             "max_score": <คะแนนเต็ม>,
-            "feedback": "<ข้อเสนอแนะละเอียด อย่างน้อย 50-80 คำ อธิบายว่าทำไมถูกหรือผิด พร้อมแนะนำการปรับปรุง>",
+            "feedback": "<ข้อเสนอแนะ{level['question']} อธิบายว่าทำไมถูกหรือผิด พร้อมแนะนำการปรับปรุง>",
             "is_correct": <true/false>,
             "student_answer": "<คำตอบของนักเรียน>",
             "correct_answer": "<คำตอบที่ถูกต้อง (สำหรับข้อปรนัย)>",
             "key_points": "<จุดสำคัญที่ควรมี (สำหรับข้ออัตนัย)>",
             "improvement_suggestions": "<คำแนะนำเพื่อปรับปรุง (สำหรับข้ออัตนัย)>"
-        }
+        }}
     ],
-    "overall_feedback": "<ข้อเสนอแนะภาพรวมละเอียด อย่างน้อย 100-150 คำ วิเคราะห์จุดแข็งจุดอ่อน และแนวทางพัฒนา>",
-    "strengths": "<จุดเด่นที่เห็นในงาน อย่างน้อย 50-80 คำ ระบุรายละเอียดที่ทำได้ดี>",
-    "improvements": "<ข้อเสนอแนะเพื่อพัฒนา อย่างน้อย 80-120 คำ แนะนำวิธีการปรับปรุงอย่างเป็นขั้นตอน>",
-    "detailed_analysis": "<การวิเคราะห์เชิงลึก อย่างน้อย 150-200 คำ วิเคราะห์แนวคิด วิธีการ และการประยุกต์ใช้>"
-}"""
+    "overall_feedback": "<ข้อเสนอแนะภาพรวม{level['overall']} วิเคราะห์จุดแข็งจุดอ่อน และแนวทางพัฒนา>",
+    "strengths": "<จุดเด่นที่เห็นในงาน {level['strengths']} ระบุรายละเอียดที่ทำได้ดี>",
+    "improvements": "<ข้อเสนอแนะเพื่อพัฒนา {level['improvements']} แนะนำวิธีการปรับปรุงอย่างเป็นขั้นตอน>",
+    "detailed_analysis": "<การวิเคราะห์เชิงลึก {level['analysis']} วิเคราะห์แนวคิด วิธีการ และการประยุกต์ใช้>"
+}}
+
+"""
         
+        with self._prefix_lock:
+            self._prefix_cache[key] = prompt
+            while len(self._prefix_cache) > self.prefix_cache_size:
+                self._prefix_cache.popitem(last=False)
         return prompt
     
-    def _call_ollama(self, prompt: str) -> str:
-        """Make API call to Ollama"""
-        url = f"{self.endpoint}/api/generate"
-        
+    def _build_payload(self, prompt: str, num_predict: Optional[int] = None, packed: bool = False) -> Dict[str, Any]:
+        """Build Ollama /api/generate request body"""
         payload = {
             "model": self.model,
             "prompt": prompt,
             "stream": False,
+            "keep_alive": self.keep_alive,
             "options": {
                 "temperature": self.temperature,
-                "num_predict": self.max_tokens
+                "num_predict": num_predict or self.max_tokens
             }
         }
+        schema = packed_schema(self.schema) if packed else self.schema
+        response_format = ollama_format(self.structured_output, schema)
+        if response_format is not None:
+            payload["format"] = response_format
+        return payload
+    
+    def _dispatch(self, call: Callable[[str], T]) -> T:
+        """
+        Run a request on the least loaded host, failing over to the others
+        
+        Args:
+            call: Function performing the request against one endpoint
+            
+        Returns:
+            The value returned by call
+        """
+        tried = set()
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self.pool.acquire(tried)
+            if endpoint is None:
+                raise last_error
+            tried.add(endpoint)
+            try:
+                result = call(endpoint)
+            except Exception as e:
+                self.pool.release(endpoint, e)
+                if not is_host_failure(e):
+                    raise
+                last_error = e
+                continue
+            self.pool.release(endpoint)
+            return result
+    
+    async def _adispatch(self, call: Callable[[str], Awaitable[T]]) -> T:
+        """Asyncio variant of _dispatch"""
+        tried = set()
+        last_error: Optional[Exception] = None
+        while True:
+            endpoint = self.pool.acquire(tried)
+            if endpoint is None:
+                raise last_error
+            tried.add(endpoint)
+            try:
+                result = await call(endpoint)
+            except asyncio.CancelledError:
+                self.pool.release(endpoint)
+                raise
+            except Exception as e:
+                self.pool.release(endpoint, e)
+                if not is_host_failure(e):
+                    raise
+                last_error = e
+                continue
+            self.pool.release(endpoint)
+            return result
+    
+    def _call_ollama(self, endpoint: str, prompt: str, num_predict: Optional[int] = None,
+                     packed: bool = False) -> str:
+        """Make API call to one Ollama host"""
+        # Streaming stops at the first complete object, so packed
+        # responses are never streamed
+        if self.stream and not packed:
+            return self._stream_ollama(endpoint, prompt, num_predict)
+        
+        url = f"{endpoint}/api/generate"
+        payload = self._build_payload(prompt, num_predict, packed)
         
-        response = requests.post(
+        response = self.session.post(
             url,
             json=payload,
             timeout=self.timeout
         )
         
         if response.status_code != 200:
-            raise Exception(f"Ollama API error: {response.status_code} - {response.text}")
+            raise BackendHTTPError("Ollama", response.status_code, response.text,
+                                   parse_retry_after(response.headers.get("Retry-After")))
         
         result = response.json()
         return result.get("response", "")
     
-    def _parse_response(self, response: str) -> Dict[str, Any]:
-        """Parse LLM response into structured format"""
+    def _stream_ollama(self, endpoint: str, prompt: str, num_predict: Optional[int] = None) -> str:
+        """
+        Stream a generation from Ollama, parsing the JSON as it arrives
+        
+        The connection is closed as soon as the top-level JSON object is
+        complete, which makes Ollama stop generating.
+        """
+        url = f"{endpoint}/api/generate"
+        payload = self._build_payload(prompt, num_predict)
+        payload["stream"] = True
+        scanner = IncrementalJSONScanner(self.on_progress)
+        
+        response = self.session.post(
+            url,
+            json=payload,
+            timeout=self.timeout,
+            stream=True
+        )
+        
         try:
-            # Try to extract JSON from response
-            start = response.find('{')
-            end = response.rfind('}') + 1
+            if response.status_code != 200:
+                raise BackendHTTPError("Ollama", response.status_code, response.text,
+                                       parse_retry_after(response.headers.get("Retry-After")))
             
-            if start != -1 and end > start:
-                json_str = response[start:end]
-                parsed = json.loads(json_str)
-                parsed["model_used"] = self.model
-                parsed["confidence"] = self._calculate_confidence(parsed)
-                return parsed
-            else:
-                # Fallback parsing
-                return self._fallback_parse(response)
-                
-        except json.JSONDecodeError:
+            for line in response.iter_lines():
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise Exception(f"Ollama API error: {chunk['error']}")
+                if scanner.feed(chunk.get("response", "")) or chunk.get("done"):
+                    break
+        finally:
+            response.close()
+        
+        return scanner.text
+    
+    async def _acall_ollama(self, endpoint: str, prompt: str, num_predict: Optional[int] = None,
+                            packed: bool = False) -> str:
+        """Make API call to one Ollama host through the shared async pool"""
+        if self.stream and not packed:
+            return await self._astream_ollama(endpoint, prompt, num_predict)
+        
+        url = f"{endpoint}/api/generate"
+        payload = self._build_payload(prompt, num_predict, packed)
+        
+        status, result, headers = await async_http.post_json(
+            endpoint,
+            url,
+            payload,
+            timeout=self.timeout,
+            limit_per_host=self.connection_limit
+        )
+        
+        if status != 200:
+            raise BackendHTTPError("Ollama", status, result, parse_retry_after(headers.get("Retry-After")))
+        
+        return result.get("response", "")
+    
+    async def _astream_ollama(self, endpoint: str, prompt: str, num_predict: Optional[int] = None) -> str:
+        """Asyncio variant of _stream_ollama"""
+        payload = self._build_payload(prompt, num_predict)
+        payload["stream"] = True
+        scanner = IncrementalJSONScanner(self.on_progress)
+        
+        def on_line(line: str) -> bool:
+            chunk = json.loads(line)
+            if chunk.get("error"):
+                raise Exception(f"Ollama API error: {chunk['error']}")
+            return scanner.feed(chunk.get("response", "")) or bool(chunk.get("done"))
+        
+        status, error, headers = await async_http.post_stream(
+            endpoint,
+            f"{endpoint}/api/generate",
+            payload,
+            on_line,
+            timeout=self.timeout,
+            limit_per_host=self.connection_limit
+        )
+        
+        if status != 200:
+            raise BackendHTTPError("Ollama", status, error, parse_retry_after(headers.get("Retry-After")))
+        
+        return scanner.text
+    
+    def _parse_response(self, response: str) -> Dict[str, Any]:
+        """Parse LLM response into structured format"""
+        parsed = check_result(extract_json_object(response), self.model, self.schema)
+        if parsed is None:
             return self._fallback_parse(response)
+        
+        parsed["model_used"] = self.model
+        parsed["confidence"] = self._calculate_confidence(parsed)
+        return parsed
     
     def _fallback_parse(self, response: str) -> Dict[str, Any]:
         """Fallback parsing when JSON extraction fails"""
+        PARSE_STATS.record(self.model, "fallback")
         # Simple score extraction
         import re
         score_match = re.search(r'(\d+(?:\.\d+)?)\s*/\s*100', response)
@@ -176,24 +494,32 @@ class LocalLLMClient:
         return min(1.0, confidence)
     
     def test_connection(self) -> bool:
-        """Test connection to Ollama server"""
-        try:
-            url = f"{self.endpoint}/api/tags"
-            response = requests.get(url, timeout=5)
-            return response.status_code == 200
-        except:
-            return False
+        """Test connection to the Ollama hosts (True if any is reachable)"""
+        return any(self.check_health().values())
+    
+    def check_health(self) -> Dict[str, bool]:
+        """
+        Health-check every host and update the load balancer
+        
+        Returns:
+            Mapping of endpoint to whether it is up and has the model
+        """
+        return self.pool.check_health(self.session, self.model)
     
     def list_models(self) -> list:
-        """List available models"""
-        try:
-            url = f"{self.endpoint}/api/tags"
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                return [model["name"] for model in response.json().get("models", [])]
-            return []
-        except:
-            return []
+        """List models available on any host"""
+        models = []
+        for endpoint in self.endpoints:
+            try:
+                url = f"{endpoint}/api/tags"
+                response = self.session.get(url, timeout=5)
+                if response.status_code == 200:
+                    for model in response.json().get("models", []):
+                        if model["name"] not in models:
+                            models.append(model["name"])
+            except:
+                continue
+        return models
 
 
 def main():
@@ -210,7 +536,7 @@ def main():
         "temperature": 0.3
     }
     
-    client = LocalLLMClient(config)
+    client = LocalLLMClient(config, on_progress=lambda event: print(json.dumps(event), file=sys.stderr))
     text = sys.argv[1]
     context = json.loads(sys.argv[2])
     
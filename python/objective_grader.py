@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+
+"""
+objective_grader.py - Rule-based grading of objective (multiple-choice) answers
+Matches answers against the answer key in the assignment context so only
+the subjective items of a submission need an LLM call
+"""
+
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Any, List, Optional, Tuple
+
+
+# Submission layout written by csv_processor.render_submission
+QUESTION_HEADER = re.compile(r"^คำถามที่ (\d+): (.*)$")
+ANSWER_PREFIX = "คำตอบ: "
+
+NUMBERED_LINE = re.compile(r"^\s*(?:ข้อ\s*)?(\d+)\s*[.)]\s*(.+)$")
+CHOICE_LINE = re.compile(r"^\s*(?:[*\-•]|[a-dA-Dก-ง][.)])\s+(.+)$")
+CORRECT_MARK = re.compile(r"\s*[✓✔]\s*")
+SUBJECTIVE_MARK = re.compile(r"อัตนัย|subjective", re.IGNORECASE)
+
+DEFAULTS = {
+    "enabled": False,           # merged totals weight every question equally (see merge_objective)
+    "correct_ratio": 0.9,       # answer at least this similar to the key: correct
+    "incorrect_ratio": 0.5,     # at most this similar: incorrect; between goes to the LLM
+    "header_ratio": 0.6,        # minimum similarity to match a CSV header to a question
+    "points_per_question": 10
+}
+
+
+def objective_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Read the objective_grading section of the router config"""
+    return dict(DEFAULTS, **(config.get("objective_grading") or {}))
+
+
+def normalize(text: str) -> str:
+    """Lowercase, drop check marks and collapse whitespace for comparison"""
+    text = CORRECT_MARK.sub(" ", text or "")
+    return " ".join(text.lower().split()).strip(" .")
+
+
+def similarity(a: str, b: str) -> float:
+    """Similarity ratio of two normalized strings"""
+    if not a or not b:
+        return 0.0
+    return SequenceMatcher(None, a, b).ratio()
+
+
+def parse_questions(question_text: str) -> Dict[int, Dict[str, Any]]:
+    """
+    Parse numbered questions and their bulleted choices from the context
+
+    Returns:
+        Mapping of question number to {"stem", "choices", "subjective"}
+    """
+    questions: Dict[int, Dict[str, Any]] = {}
+    current = None
+    for line in (question_text or "").splitlines():
+        match = NUMBERED_LINE.match(line)
+        if match and not line.startswith((" ", "\t")):
+            current = {"stem": match.group(2).strip(), "choices": [],
+                       "subjective": bool(SUBJECTIVE_MARK.search(match.group(2)))}
+            questions[int(match.group(1))] = current
+            continue
+        choice = CHOICE_LINE.match(line)
+        if current is not None and choice:
+            current["choices"].append(choice.group(1).strip())
+    return questions
+
+
+def parse_answer_key(context: Dict[str, Any]) -> Dict[int, Dict[str, Any]]:
+    """
+    Extract the objective answer key from the context
+
+    A numbered line of the standard answer is a key entry when it is
+    marked with a check mark, or when its question lists choices and is
+    not labelled subjective (อัตนัย).
+
+    Returns:
+        Mapping of question number to {"answer", "stem", "choices"}
+    """
+    questions = parse_questions(context.get("question", ""))
+    key: Dict[int, Dict[str, Any]] = {}
+    for line in (context.get("standard_answer") or "").splitlines():
+        match = NUMBERED_LINE.match(line)
+        if not match:
+            continue
+        number = int(match.group(1))
+        question = questions.get(number, {"stem": "", "choices": [], "subjective": False})
+        marked = bool(CORRECT_MARK.search(match.group(2)))
+        if question["subjective"] or not (marked or len(question["choices"]) >= 2):
+            continue
+        key[number] = {
+            "answer": CORRECT_MARK.sub(" ", match.group(2)).strip(),
+            "stem": question["stem"],
+            "choices": question["choices"]
+        }
+    return key
+
+
+def parse_submission(text: str) -> Tuple[List[str], List[Dict[str, Any]]]:
+    """
+    Split a rendered CSV submission into its preamble and answered items
+
+    Returns:
+        Tuple of (preamble lines, items with "number", "header", "answer")
+    """
+    preamble: List[str] = []
+    items: List[Dict[str, Any]] = []
+    for line in text.splitlines():
+        match = QUESTION_HEADER.match(line)
+        if match:
+            items.append({"number": int(match.group(1)), "header": match.group(2), "lines": []})
+        elif items:
+            items[-1]["lines"].append(line)
+        else:
+            preamble.append(line)
+
+    for item in items:
+        # Multi-line question columns continue the header up to the answer
+        lines = item.pop("lines")
+        start = next((i for i, line in enumerate(lines) if line.startswith(ANSWER_PREFIX)), None)
+        if start is None:
+            item["answer"] = "\n".join(lines).strip()
+            continue
+        item["header"] = "\n".join([item["header"]] + lines[:start])
+        item["answer"] = "\n".join([lines[start][len(ANSWER_PREFIX):]] + lines[start + 1:]).strip()
+    return preamble, items
+
+
+def _best_choice(text: str, choices: List[str]) -> Tuple[int, float, float]:
+    """Index of the closest choice, its similarity and its lead over the runner-up"""
+    scores = sorted(((similarity(normalize(text), normalize(c)), i) for i, c in enumerate(choices)), reverse=True)
+    runner_up = scores[1][0] if len(scores) > 1 else 0.0
+    return scores[0][1], scores[0][0], scores[0][0] - runner_up
+
+
+def judge(answer: str, entry: Dict[str, Any], settings: Dict[str, Any]) -> Optional[bool]:
+    """
+    Decide whether an answer matches the key
+
+    With choices, the key and the answer are each resolved to their
+    closest choice and compared; otherwise the answer is compared to the
+    key text directly.
+
+    Returns:
+        True or False when certain, None when the LLM should decide
+    """
+    choices = entry["choices"]
+    if len(choices) >= 2:
+        key_idx, key_sim, key_lead = _best_choice(entry["answer"], choices)
+        ans_idx, ans_sim, ans_lead = _best_choice(answer, choices)
+        if key_lead > 0.1 and ans_sim >= settings["correct_ratio"] and ans_lead > 0.1:
+            return key_idx == ans_idx
+
+    ratio = similarity(normalize(answer), normalize(entry["answer"]))
+    if ratio >= settings["correct_ratio"]:
+        return True
+    if ratio <= settings["incorrect_ratio"]:
+        return False
+    return None
+
+
+def match_question(item: Dict[str, Any], key: Dict[int, Dict[str, Any]], settings: Dict[str, Any]) -> Optional[int]:
+    """Find the question (key entry) of a submission item by its header text, then its position"""
+    header = normalize(item["header"].rstrip("."))
+    best, best_ratio = None, 0.0
+    for number, entry in key.items():
+        stem = normalize(entry["stem"])
+        # Headers are cut to 100 characters, so compare the same length
+        ratio = similarity(header, stem[:len(header)]) if stem else 0.0
+        if ratio > best_ratio:
+            best, best_ratio = number, ratio
+    if best is not None and best_ratio >= settings["header_ratio"]:
+        return best
+    if not any(entry["stem"] for entry in key.values()):
+        return item["number"] if item["number"] in key else None
+    return None
+
+
+def split_objective(text: str, context: Dict[str, Any], config: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Grade the objective items of a submission and strip them from its text
+
+    Args:
+        text: Submission text in the CSV import layout
+        context: Assignment context
+        config: Full router configuration
+
+    Returns:
+        None when nothing could be graded, otherwise a dictionary with
+        "graded" (question_feedback entries), "remaining_text" (the
+        submission without the graded items, or "" when none remain) and
+        "remaining_count"
+    """
+    settings = objective_settings(config)
+    if not settings["enabled"]:
+        return None
+
+    key = parse_answer_key(context)
+    if not key:
+        return None
+    preamble, items = parse_submission(text)
+    if not items:
+        return None
+
+    graded, remaining = [], []
+    points = settings["points_per_question"]
+    for item in items:
+        number = match_question(item, key, settings)
+        verdict = judge(item["answer"], key[number], settings) if number is not None else None
+        if verdict is None:
+            remaining.append(item)
+            continue
+        graded.append({
+            "question_number": item["number"],
+            "question_type": "objective",
+            "score": points if verdict else 0,
+            "max_score": points,
+            "is_correct": verdict,
+            "student_answer": item["answer"],
+            "correct_answer": key[number]["answer"],
+            "feedback": "ตอบถูกต้อง" if verdict else f"คำตอบที่ถูกต้องคือ: {key[number]['answer']}",
+            "graded_by": "answer_key"
+        })
+
+    if not graded:
+        return None
+
+    remaining_text = ""
+    if remaining:
+        lines = list(preamble)
+        for item in remaining:
+            lines.extend([f"คำถามที่ {item['number']}: {item['header']}", f"{ANSWER_PREFIX}{item['answer']}", ""])
+        remaining_text = "\n".join(lines)
+
+    return {"graded": graded, "remaining_text": remaining_text, "remaining_count": len(remaining)}
+
+
+def _question_order(question: Dict[str, Any]) -> int:
+    try:
+        return int(question.get("question_number") or 0)
+    except (TypeError, ValueError):
+        return 0
+
+
+def merge_objective(split: Dict[str, Any], llm_result: Optional[Dict[str, Any]], config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Combine answer-key grading with the LLM result for the remaining items
+
+    The total is weighted by question count: each rule-graded item is
+    worth points_per_question, and the LLM's 0-100 total covers the
+    remaining items together. This replaces any weighting in the rubric:
+    with five objective items and one subjective item, the subjective
+    item counts for 1/6 of the total however many points the rubric
+    gives it.
+
+    Args:
+        split: Output of split_objective
+        llm_result: LLM grading of split["remaining_text"], or None when no
+            items remained
+        config: Full router configuration
+
+    Returns:
+        Grading result in the usual format
+    """
+    points = objective_settings(config)["points_per_question"]
+    graded = split["graded"]
+    earned = sum(q["score"] for q in graded)
+    possible = points * len(graded)
+
+    if llm_result is None:
+        correct = sum(1 for q in graded if q["is_correct"])
+        return {
+            "total_score": round(100.0 * earned / possible, 2),
+            "question_feedback": graded,
+            "feedback": f"ตอบถูก {correct} จาก {len(graded)} ข้อ",
+            "confidence": 1.0,
+            "model_used": "answer_key"
+        }
+
+    if llm_result.get("error"):
+        return llm_result
+
+    result = dict(llm_result)
+    llm_possible = points * split["remaining_count"]
+    llm_earned = float(result.get("total_score", 0) or 0) / 100.0 * llm_possible
+    result["total_score"] = round(100.0 * (earned + llm_earned) / (possible + llm_possible), 2)
+    result["question_feedback"] = sorted(
+        graded + [q for q in result.get("question_feedback") or [] if isinstance(q, dict)],
+        key=_question_order
+    )
+    result["objective_graded"] = len(graded)
+    return result
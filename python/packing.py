@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+"""
+packing.py - Several short submissions per LLM call
+Short answers are graded together in one prompt so the rubric, standard
+answer and response schema are paid for once per pack instead of once
+per student
+"""
+
+import json
+from typing import Dict, Any, List, Tuple
+
+from rate_limiter import estimate_tokens
+
+
+DEFAULTS = {
+    "enabled": False,
+    "max_students": 8,              # submissions per pack
+    "max_submission_tokens": 200,   # only submissions this short are packed
+    "max_output_tokens": 16000      # cap on the completion budget of one pack
+}
+
+# Appended after the packed submissions; overrides the single-object
+# instruction of the normal prompt
+PACKED_INSTRUCTION = (
+    "ตรวจงานของนักเรียนแต่ละคนแยกกันอย่างอิสระ แล้วตอบเป็น JSON object "
+    "{\"results\": [...]} เท่านั้น โดยแต่ละรายการใน results เป็น object ตามรูปแบบข้างต้น "
+    "และเพิ่มฟิลด์ \"student_id\" ให้ตรงกับรหัสนักเรียน ครบทุกคนตามลำดับ"
+)
+
+
+def packing_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Read the packing section of the router config"""
+    return dict(DEFAULTS, **(config.get("packing") or {}))
+
+
+def is_packable(text: str, settings: Dict[str, Any]) -> bool:
+    """Check whether a submission is short enough to share a prompt"""
+    return estimate_tokens(text) <= settings["max_submission_tokens"]
+
+
+def pack_ids(count: int) -> List[str]:
+    """Positional student ids used inside a pack (S1, S2, ...)"""
+    return [f"S{i}" for i in range(1, count + 1)]
+
+
+def build_packed_block(items: List[Tuple[str, str]]) -> str:
+    """
+    Render packed submissions for the prompt
+
+    Args:
+        items: List of (pack id, privacy-filtered text)
+
+    Returns:
+        Submission block with one heading per student
+    """
+    parts = []
+    for pack_id, text in items:
+        parts.append(f"### รหัสนักเรียน: {pack_id}\n{text.strip()}\n")
+    return "\n".join(parts)
+
+
+def parse_packed(content: str, ids: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Parse a packed response into per-student results
+
+    Args:
+        content: Raw model output, expected to hold a JSON array (bare or
+            wrapped in {"results": [...]})
+        ids: Pack ids that were sent
+
+    Returns:
+        Mapping of pack id to parsed result; ids that are missing or
+        malformed are left out so the caller can regrade them
+    """
+    start = content.find('[')
+    end = content.rfind(']') + 1
+    if start == -1 or end <= start:
+        return {}
+
+    try:
+        entries = json.loads(content[start:end])
+    except json.JSONDecodeError:
+        return {}
+    if not isinstance(entries, list):
+        return {}
+
+    wanted = set(ids)
+    results: Dict[str, Dict[str, Any]] = {}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        pack_id = str(entry.pop("student_id", ""))
+        if pack_id in wanted and pack_id not in results and "total_score" in entry:
+            results[pack_id] = entry
+    return results
@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+
+"""
+rate_limiter.py - Client-side request and token pacing for the OpenAI API
+Keeps concurrent grading just under the configured requests-per-minute
+and tokens-per-minute budgets instead of running into 429 storms
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Any, List, Optional
+
+
+# Budget fraction actually used, leaving room for estimation error
+HEADROOM = 0.95
+
+# Seconds of budget that may be spent in one burst; providers enforce
+# per-minute limits over shorter windows, so a full minute's quota must
+# not go out at once
+BURST_SECONDS = 10
+
+# Per-message framing tokens added by the chat format
+MESSAGE_OVERHEAD = 4
+REPLY_PRIMING = 3
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Roughly estimate the token count of a text
+
+    English averages about four characters per token; Thai and other
+    non-ASCII scripts tokenize much more finely, so they are counted at
+    about two characters per token. Errors are corrected over time by
+    RateLimiter.reconcile.
+
+    Args:
+        text: Text to estimate
+
+    Returns:
+        Estimated token count
+    """
+    if not text:
+        return 0
+    ascii_chars = sum(1 for ch in text if ord(ch) < 128)
+    other_chars = len(text) - ascii_chars
+    return ascii_chars // 4 + (other_chars + 1) // 2 + 1
+
+
+def estimate_message_tokens(messages: List[Dict[str, Any]]) -> int:
+    """Estimate the prompt tokens of a chat messages list"""
+    total = REPLY_PRIMING
+    for message in messages:
+        total += MESSAGE_OVERHEAD + estimate_tokens(str(message.get("content", "")))
+    return total
+
+
+class RateLimiter:
+    """
+    Token buckets for requests and tokens per minute
+
+    Each request reserves one request slot plus its estimated prompt tokens
+    and max_tokens (OpenAI counts max_tokens against TPM when the request
+    is admitted). Buckets refill continuously and hold at most
+    BURST_SECONDS of budget, so requests are paced evenly rather than
+    released in bursts at the top of each minute.
+    """
+
+    def __init__(self, requests_per_minute: float = 0, tokens_per_minute: float = 0):
+        self.rpm = float(requests_per_minute or 0) * HEADROOM
+        self.tpm = float(tokens_per_minute or 0) * HEADROOM
+        self.request_capacity = max(1.0, self.rpm * BURST_SECONDS / 60.0)
+        self.token_capacity = self.tpm * BURST_SECONDS / 60.0
+        self.request_level = self.request_capacity
+        self.token_level = self.token_capacity
+        self.updated = time.monotonic()
+        # Learned ratio of actual to estimated prompt tokens
+        self.calibration = 1.0
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self.updated
+        self.updated = now
+        if self.rpm:
+            self.request_level = min(self.request_capacity, self.request_level + elapsed * self.rpm / 60.0)
+        if self.tpm:
+            self.token_level = min(self.token_capacity, self.token_level + elapsed * self.tpm / 60.0)
+
+    def _try_take(self, tokens: int) -> float:
+        """Take capacity if available; otherwise return seconds to wait"""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+
+            # A request larger than the bucket waits for a full bucket and
+            # then drives it negative, which holds back the next requests
+            needed = min(tokens, self.token_capacity)
+            wait = 0.0
+            if self.rpm and self.request_level < 1:
+                wait = max(wait, (1 - self.request_level) * 60.0 / self.rpm)
+            if self.tpm and self.token_level < needed:
+                wait = max(wait, (needed - self.token_level) * 60.0 / self.tpm)
+
+            if wait == 0.0:
+                if self.rpm:
+                    self.request_level -= 1
+                if self.tpm:
+                    self.token_level -= tokens
+            return wait
+
+    def reserve_tokens(self, messages: List[Dict[str, Any]], max_tokens: int) -> int:
+        """Calibrated prompt estimate plus the completion budget"""
+        prompt = int(estimate_message_tokens(messages) * self.calibration) + 1
+        return prompt + int(max_tokens or 0)
+
+    def acquire(self, tokens: int) -> None:
+        """Block until a request of `tokens` tokens fits both budgets"""
+        while True:
+            wait = self._try_take(tokens)
+            if wait == 0.0:
+                return
+            time.sleep(wait)
+
+    async def aacquire(self, tokens: int) -> None:
+        """Asyncio variant of acquire"""
+        while True:
+            wait = self._try_take(tokens)
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait)
+
+    def reconcile(self, messages: List[Dict[str, Any]], reserved: int, usage: Optional[Dict[str, Any]]) -> None:
+        """
+        Correct the budget and estimator with the usage the API reported
+
+        Args:
+            messages: Messages that were sent
+            reserved: Tokens reserved for the request
+            usage: "usage" object from the response
+        """
+        if not usage:
+            return
+
+        with self._lock:
+            estimate = estimate_message_tokens(messages)
+            prompt_tokens = usage.get("prompt_tokens")
+            if prompt_tokens and estimate:
+                # Smoothed so one unusual submission does not swing pacing
+                self.calibration = 0.8 * self.calibration + 0.2 * (prompt_tokens / estimate)
+
+            # Unused reservation is not refunded: the API itself counts
+            # max_tokens, so refunding would let bursts exceed its budget.
+            # Overruns beyond the reservation are charged.
+            total = usage.get("total_tokens")
+            if total is None:
+                # Streams stopped early only have a completion estimate
+                total = int(prompt_tokens or estimate * self.calibration) + int(usage.get("completion_tokens") or 0)
+            if self.tpm and total > reserved:
+                self.token_level -= total - reserved
+
+
+    def refund(self, tokens: int) -> None:
+        """
+        Return reserved tokens of a request that failed
+
+        A rejected or dropped request generated nothing, so its completion
+        budget goes back to the bucket instead of slowing the retries.
+        """
+        if not self.tpm or tokens <= 0:
+            return
+        with self._lock:
+            self.token_level = min(self.token_capacity, self.token_level + tokens)
+
+
+_LIMITERS: Dict[str, RateLimiter] = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(key: str, config: Dict[str, Any]) -> Optional[RateLimiter]:
+    """
+    Get the shared limiter for an API account and model
+
+    Args:
+        key: Limiter identifier, usually base URL and model
+        config: Backend configuration (requests_per_minute, tokens_per_minute)
+
+    Returns:
+        RateLimiter, or None when no budget is configured
+    """
+    rpm = config.get("requests_per_minute") or 0
+    tpm = config.get("tokens_per_minute") or 0
+    if not rpm and not tpm:
+        return None
+
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if limiter is None:
+            limiter = RateLimiter(rpm, tpm)
+            _LIMITERS[key] = limiter
+    return limiter
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+
+"""
+resilience.py - Retry, backoff and circuit breaking for LLM backends
+Retries transient failures (429, 5xx, dropped connections) with
+exponential backoff and jitter, honors Retry-After, and stops sending
+requests to a backend that keeps failing until it has had time to recover
+"""
+
+import asyncio
+import contextvars
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from typing import Awaitable, Callable, Dict, Any, Optional, TypeVar
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:  # aiohttp is optional
+    aiohttp = None
+
+
+T = TypeVar("T")
+
+# Statuses worth retrying: timeouts, conflicts, rate limits and server errors
+RETRYABLE_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+# Receives (seconds, failed) for every attempt RetryPolicy makes; the
+# scheduler sets it while a call holds a queue slot so it sees the latency
+# of single requests rather than of whole retried calls
+ATTEMPT_OBSERVER: "contextvars.ContextVar[Optional[Callable[[float, bool], None]]]" = \
+    contextvars.ContextVar("attempt_observer", default=None)
+
+
+class BackendHTTPError(Exception):
+    """Non-200 response from an LLM backend"""
+
+    def __init__(self, backend: str, status: int, body: Any = "", retry_after: Optional[float] = None):
+        super().__init__(f"{backend} API error: {status} - {body}")
+        self.backend = backend
+        self.status = status
+        self.body = body
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.status in RETRYABLE_STATUS
+
+
+class CircuitOpenError(Exception):
+    """Raised when a backend's circuit breaker is refusing requests"""
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Parse a Retry-After header (delay in seconds or an HTTP date)
+
+    Returns:
+        Seconds to wait, or None when absent or unparseable
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def is_retryable(error: Exception) -> bool:
+    """Check whether a failed call is worth retrying"""
+    if isinstance(error, BackendHTTPError):
+        return error.retryable
+    if isinstance(error, (requests.exceptions.ConnectionError, requests.exceptions.Timeout)):
+        return True
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    if aiohttp is not None and isinstance(error, aiohttp.ClientConnectionError):
+        return True
+    return False
+
+
+def retry_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Extract retry and circuit breaker settings from the router config
+
+    Args:
+        config: Full router configuration (uses its "performance" section)
+
+    Returns:
+        Settings dictionary for RetryPolicy and get_breaker
+    """
+    performance = config.get("performance", {})
+    return {
+        "attempts": performance.get("retry_attempts", 3),
+        "delay": performance.get("retry_delay", 2),
+        "max_delay": performance.get("retry_max_delay", 60),
+        "breaker_threshold": performance.get("circuit_breaker_threshold", 5),
+        "breaker_reset": performance.get("circuit_breaker_reset", 30)
+    }
+
+
+# Seconds between checks of callers waiting for a half-open probe
+PROBE_POLL = 0.5
+
+
+class CircuitBreaker:
+    """
+    Per-backend circuit breaker
+
+    After `threshold` consecutive transient failures the circuit opens and
+    callers wait out `reset_timeout` instead of sending requests. Then
+    exactly one caller is admitted as a probe while the others keep
+    waiting: success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, name: str, threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.threshold = max(1, int(threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        # When the half-open probe was admitted, None while none is out
+        self.probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self.opened_at is None:
+                return "closed"
+            if time.monotonic() - self.opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def wait_time(self) -> float:
+        """Seconds until the circuit lets requests through (0 when it does)"""
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            return max(0.0, self.opened_at + self.reset_timeout - time.monotonic())
+
+    def admit(self) -> float:
+        """
+        Seconds the caller must wait before sending (0 to go ahead)
+
+        Once reset_timeout has passed, the first caller is admitted as the
+        probe and the rest are told to check back every PROBE_POLL seconds
+        until it reports. A probe that never reports (its caller was
+        cancelled) is replaced after another reset_timeout.
+        """
+        with self._lock:
+            if self.opened_at is None:
+                return 0.0
+            now = time.monotonic()
+            remaining = self.opened_at + self.reset_timeout - now
+            if remaining > 0:
+                return remaining
+            if self.probe_started is not None and now - self.probe_started < self.reset_timeout:
+                return PROBE_POLL
+            self.probe_started = now
+            return 0.0
+
+    def release_probe(self) -> None:
+        """End a probe that said nothing about backend health"""
+        with self._lock:
+            self.probe_started = None
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probe_started = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self.probe_started = None
+            if self.failures >= self.threshold:
+                self.opened_at = time.monotonic()
+
+
+_BREAKERS: Dict[str, CircuitBreaker] = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_breaker(name: str, settings: Optional[Dict[str, Any]] = None) -> CircuitBreaker:
+    """Get the shared circuit breaker for a backend, creating it on first use"""
+    settings = settings or {}
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(name)
+        if breaker is None:
+            breaker = CircuitBreaker(
+                name,
+                threshold=settings.get("breaker_threshold", 5),
+                reset_timeout=settings.get("breaker_reset", 30)
+            )
+            _BREAKERS[name] = breaker
+    return breaker
+
+
+class RetryPolicy:
+    """Exponential backoff with full jitter, bounded by a circuit breaker"""
+
+    def __init__(self, settings: Optional[Dict[str, Any]] = None, breaker: Optional[CircuitBreaker] = None):
+        settings = settings or {}
+        self.attempts = max(1, int(settings.get("attempts", 3)))
+        self.delay = float(settings.get("delay", 2))
+        self.max_delay = float(settings.get("max_delay", 60))
+        self.breaker = breaker
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Seconds to wait after a failed attempt (1-based)"""
+        ceiling = min(self.max_delay, self.delay * (2 ** (attempt - 1)))
+        wait = random.uniform(0, ceiling)
+        retry_after = getattr(error, "retry_after", None)
+        if retry_after is not None:
+            # The server knows best; never come back earlier than asked
+            wait = max(wait, min(retry_after, self.max_delay))
+        return wait
+
+    def _breaker_wait(self) -> float:
+        if self.breaker is None:
+            return 0.0
+        wait = self.breaker.admit()
+        if wait > self.max_delay:
+            raise CircuitOpenError(f"Circuit open for {self.breaker.name}; retry in {wait:.0f}s")
+        return wait
+
+    @staticmethod
+    def _observe(started: float, error: Optional[Exception]) -> None:
+        """Report one attempt's latency to the ATTEMPT_OBSERVER, if any"""
+        observer = ATTEMPT_OBSERVER.get()
+        if observer is not None:
+            # Only transient failures say anything about backend load
+            observer(time.monotonic() - started, error is not None and is_retryable(error))
+
+    def _record(self, error: Optional[Exception]) -> bool:
+        """Update the breaker; returns True if the error should be retried"""
+        if error is None:
+            if self.breaker is not None:
+                self.breaker.record_success()
+            return False
+        if not is_retryable(error):
+            if self.breaker is not None:
+                self.breaker.release_probe()
+            return False
+        if self.breaker is not None:
+            self.breaker.record_failure()
+        return True
+
+    def call(self, func: Callable[[], T]) -> T:
+        """
+        Call func, retrying transient failures
+
+        Args:
+            func: Zero-argument callable performing one request
+
+        Returns:
+            The value returned by func
+        """
+        for attempt in range(1, self.attempts + 1):
+            wait = self._breaker_wait()
+            while wait > 0:
+                time.sleep(wait)
+                wait = self._breaker_wait()
+            started = time.monotonic()
+            try:
+                result = func()
+            except Exception as e:
+                self._observe(started, e)
+                if not self._record(e) or attempt == self.attempts:
+                    raise
+                time.sleep(self.backoff(attempt, e))
+                continue
+            self._observe(started, None)
+            self._record(None)
+            return result
+
+    async def acall(self, func: Callable[[], Awaitable[T]]) -> T:
+        """Asyncio variant of call; func returns a fresh awaitable per attempt"""
+        for attempt in range(1, self.attempts + 1):
+            wait = self._breaker_wait()
+            while wait > 0:
+                await asyncio.sleep(wait)
+                wait = self._breaker_wait()
+            started = time.monotonic()
+            try:
+                result = await func()
+            except Exception as e:
+                self._observe(started, e)
+                if not self._record(e) or attempt == self.attempts:
+                    raise
+                await asyncio.sleep(self.backoff(attempt, e))
+                continue
+            self._observe(started, None)
+            self._record(None)
+            return result
@@ -0,0 +1,298 @@
+#!/usr/bin/env python3
+
+"""
+scheduler.py - Per-backend admission queues with priority lanes and adaptive concurrency
+Every grading call waits for a slot on its backend's queue. Interactive
+requests go ahead of bulk ones, and the number of slots follows observed
+latency (additive increase, multiplicative decrease) so a GPU host is
+kept busy without being overloaded
+"""
+
+import asyncio
+import threading
+import time
+from typing import Dict, Any, Callable, Awaitable, Optional, TypeVar
+
+from endpoint_pool import parse_endpoints
+from resilience import ATTEMPT_OBSERVER
+
+
+T = TypeVar("T")
+
+INTERACTIVE = "interactive"
+BULK = "bulk"
+LANES = (INTERACTIVE, BULK)
+
+DEFAULTS = {
+    "enabled": True,
+    "min_concurrency": 1,
+    "max_concurrency": 8,
+    "latency_tolerance": 2.0,   # back off when latency exceeds this multiple of the baseline
+    "backoff": 0.7              # factor applied to the limit on backoff
+}
+
+# Per-sample drift of the latency baseline, so one unusually fast call
+# does not hold it down forever
+BASELINE_DRIFT = 0.05
+
+# Poll interval of asyncio waiters (same approach as RateLimiter.aacquire)
+ASYNC_POLL = 0.05
+
+
+def scheduler_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Read the scheduler section of the router config
+
+    The starting concurrency is performance.concurrent_requests.
+    """
+    settings = dict(DEFAULTS, **(config.get("scheduler") or {}))
+    settings.setdefault("initial_concurrency", config.get("performance", {}).get("concurrent_requests", 3))
+    return settings
+
+
+def lane_of(job: Dict[str, Any]) -> str:
+    """Lane of a worker job; jobs are bulk unless marked interactive"""
+    return INTERACTIVE if job.get("lane") == INTERACTIVE else BULK
+
+
+class AIMDLimit:
+    """
+    Concurrency limit driven by latency
+
+    Each call that finishes within latency_tolerance times the baseline
+    (the lowest recent latency) raises the limit by 1/limit, about one
+    slot per round of calls. A slow or failed call multiplies it by
+    backoff, at most once per baseline interval so one burst of slow
+    calls counts as one signal.
+    """
+
+    def __init__(self, settings: Dict[str, Any]):
+        self.minimum = max(1, int(settings["min_concurrency"]))
+        self.maximum = max(self.minimum, int(settings["max_concurrency"]))
+        self.tolerance = float(settings["latency_tolerance"])
+        self.backoff = float(settings["backoff"])
+        self.limit = float(min(self.maximum, max(self.minimum, int(settings["initial_concurrency"]))))
+        self.baseline: Optional[float] = None
+        self.last_decrease = 0.0
+
+    def record(self, latency: float, failed: bool, now: float) -> None:
+        if not failed:
+            self.baseline = latency if self.baseline is None else min(latency, self.baseline * (1 + BASELINE_DRIFT))
+
+        congested = failed or (self.baseline is not None and latency > self.baseline * self.tolerance)
+        if congested:
+            if now - self.last_decrease >= (self.baseline or 0.0):
+                self.limit = max(float(self.minimum), self.limit * self.backoff)
+                self.last_decrease = now
+        else:
+            self.limit = min(float(self.maximum), self.limit + 1.0 / self.limit)
+
+
+class BackendQueue:
+    """
+    Admission queue of one backend
+
+    A call is admitted while fewer than the current limit are in flight;
+    bulk calls also wait while any interactive call is waiting.
+    """
+
+    def __init__(self, name: str, settings: Dict[str, Any]):
+        self.name = name
+        self.limit = AIMDLimit(settings)
+        self.in_flight = 0
+        self.waiting = {lane: 0 for lane in LANES}
+        self.served = {lane: 0 for lane in LANES}
+        self._cond = threading.Condition()
+
+    def _admissible(self, lane: str) -> bool:
+        if self.in_flight >= int(self.limit.limit):
+            return False
+        return lane == INTERACTIVE or self.waiting[INTERACTIVE] == 0
+
+    def _admit(self, lane: str) -> None:
+        self.in_flight += 1
+        self.served[lane] += 1
+
+    def acquire(self, lane: str = INTERACTIVE) -> None:
+        """Block until a call in this lane may start"""
+        with self._cond:
+            self.waiting[lane] += 1
+            try:
+                while not self._admissible(lane):
+                    self._cond.wait()
+            finally:
+                self.waiting[lane] -= 1
+                # Bulk waiters held back by this one may go now
+                self._cond.notify_all()
+            self._admit(lane)
+
+    async def aacquire(self, lane: str = INTERACTIVE) -> None:
+        """Asyncio variant of acquire"""
+        with self._cond:
+            self.waiting[lane] += 1
+        try:
+            while True:
+                with self._cond:
+                    if self._admissible(lane):
+                        self._admit(lane)
+                        return
+                await asyncio.sleep(ASYNC_POLL)
+        finally:
+            with self._cond:
+                self.waiting[lane] -= 1
+                self._cond.notify_all()
+
+    def record(self, latency: float, failed: bool) -> None:
+        """Feed one request's outcome to the limit"""
+        with self._cond:
+            self.limit.record(latency, failed, time.monotonic())
+
+    def release(self, latency: Optional[float] = None, failed: bool = False) -> None:
+        """
+        Free a slot and feed the call's outcome to the limit
+
+        Args:
+            latency: Seconds the call took, or None when it was cancelled
+                or its attempts were already recorded
+            failed: Whether the call raised or returned an error result
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if latency is not None:
+                self.limit.record(latency, failed, time.monotonic())
+            self._cond.notify_all()
+
+    def _observe(self, weight: int) -> "AttemptLog":
+        log = AttemptLog(self, weight)
+        log.token = ATTEMPT_OBSERVER.set(log.record)
+        return log
+
+    def run(self, lane: str, call: Callable[[], T], weight: int = 1) -> T:
+        """
+        Run a call once admitted
+
+        Args:
+            lane: "interactive" or "bulk"
+            call: Function performing the client call
+            weight: Submissions graded by the call; latency is divided by
+                it so a packed call compares with single ones
+        """
+        self.acquire(lane)
+        log = self._observe(weight)
+        start = time.monotonic()
+        failed = True
+        try:
+            result = call()
+            failed = _is_failure(result)
+            return result
+        finally:
+            ATTEMPT_OBSERVER.reset(log.token)
+            self.release(log.unobserved(time.monotonic() - start), failed)
+
+    async def arun(self, lane: str, call: Callable[[], Awaitable[T]], weight: int = 1) -> T:
+        """Asyncio variant of run"""
+        await self.aacquire(lane)
+        log = self._observe(weight)
+        start = time.monotonic()
+        try:
+            result = await call()
+        except asyncio.CancelledError:
+            self.release()
+            raise
+        except Exception:
+            self.release(log.unobserved(time.monotonic() - start), True)
+            raise
+        finally:
+            ATTEMPT_OBSERVER.reset(log.token)
+        self.release(log.unobserved(time.monotonic() - start), _is_failure(result))
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        """Current limit, load and latency baseline, for diagnostics"""
+        with self._cond:
+            return {
+                "limit": round(self.limit.limit, 2),
+                "in_flight": self.in_flight,
+                "waiting": dict(self.waiting),
+                "served": dict(self.served),
+                "baseline_latency": round(self.limit.baseline, 3) if self.limit.baseline is not None else None
+            }
+
+
+class AttemptLog:
+    """
+    Per-attempt latencies of one admitted call
+
+    Clients retry inside the call, so the call's own duration includes
+    backoff sleeps; each attempt is recorded on its own instead. Calls
+    made without RetryPolicy report nothing and fall back to the call's
+    duration.
+    """
+
+    def __init__(self, queue: BackendQueue, weight: int):
+        self.queue = queue
+        self.weight = max(1, int(weight))
+        self.attempts = 0
+        self.token: Any = None
+
+    def record(self, latency: float, failed: bool) -> None:
+        self.attempts += 1
+        self.queue.record(latency / self.weight, failed)
+
+    def unobserved(self, latency: float) -> Optional[float]:
+        """Latency for release: None when attempts were recorded already"""
+        return None if self.attempts else latency / self.weight
+
+
+def _is_failure(result: Any) -> bool:
+    return isinstance(result, dict) and bool(result.get("error"))
+
+
+def queue_key(backend: str, config: Dict[str, Any]) -> str:
+    """
+    Identify the capacity a backend call uses
+
+    Local calls share a queue per set of Ollama hosts and model, so the
+    latency baseline of a small cascade model is not dragged up by a large
+    one; API calls share one per base URL and model, the unit of rate
+    limits.
+    """
+    if backend == "local":
+        return "local:" + ",".join(parse_endpoints(config)) + ":" + str(config.get("model", ""))
+    return f"{backend}:{config.get('base_url', '')}:{config.get('model', '')}"
+
+
+_QUEUES: Dict[str, BackendQueue] = {}
+_QUEUES_LOCK = threading.Lock()
+
+
+def get_backend_queue(backend: str, config: Dict[str, Any]) -> Optional[BackendQueue]:
+    """
+    Get the shared queue for a backend, creating it on first use
+
+    Args:
+        backend: "local" or "openai"
+        config: Backend configuration; the router passes the scheduler
+            settings in as "scheduler"
+
+    Returns:
+        BackendQueue, or None when scheduling is disabled
+    """
+    settings = config.get("scheduler")
+    if not settings or not settings.get("enabled"):
+        return None
+
+    key = queue_key(backend, config)
+    with _QUEUES_LOCK:
+        queue = _QUEUES.get(key)
+        if queue is None:
+            queue = BackendQueue(key, settings)
+            _QUEUES[key] = queue
+    return queue
+
+
+def queue_status() -> Dict[str, Dict[str, Any]]:
+    """Status of every queue created so far"""
+    with _QUEUES_LOCK:
+        queues = list(_QUEUES.values())
+    return {queue.name: queue.status() for queue in queues}
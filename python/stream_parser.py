@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""
+stream_parser.py - Incremental JSON parsing for streamed LLM output
+Tracks the first top-level JSON object as tokens arrive so clients can
+report early fields and stop generation once the object is complete
+"""
+
+import re
+from typing import Callable, Dict, Any, Optional
+
+
+TOTAL_SCORE_PATTERN = re.compile(r'"total_score"\s*:\s*(-?\d+(?:\.\d+)?)')
+
+
+class IncrementalJSONScanner:
+    """Scan streamed text for the end of the first top-level JSON object"""
+
+    def __init__(self, on_progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.on_progress = on_progress
+        self.parts = []
+        self.length = 0
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
+        self.start = -1
+        self.end = -1
+        self.total_score = None
+        self._tail = ""
+
+    @property
+    def complete(self) -> bool:
+        """True once the top-level object's closing brace has been seen"""
+        return self.end != -1
+
+    @property
+    def text(self) -> str:
+        """Text received so far, cut after the top-level object if complete"""
+        text = "".join(self.parts)
+        return text[:self.end] if self.complete else text
+
+    def feed(self, chunk: str) -> bool:
+        """
+        Consume the next chunk of streamed text
+
+        Args:
+            chunk: Newly received text
+
+        Returns:
+            True when the top-level object is complete
+        """
+        if self.complete or not chunk:
+            return self.complete
+
+        offset = self.length
+        self.parts.append(chunk)
+        self.length += len(chunk)
+
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == '\\':
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == '"':
+                if self.depth > 0:
+                    self.in_string = True
+            elif ch == '{':
+                if self.depth == 0:
+                    self.start = offset + i
+                self.depth += 1
+            elif ch == '}' and self.depth > 0:
+                self.depth -= 1
+                if self.depth == 0:
+                    self.end = offset + i + 1
+                    break
+
+        self._check_progress(chunk)
+        return self.complete
+
+    def _check_progress(self, chunk: str) -> None:
+        """Report total_score as soon as it has been streamed"""
+        if self.total_score is not None:
+            return
+
+        # Search a short sliding window so a field split across chunks is
+        # still seen whole without rescanning the whole buffer
+        window = self._tail + chunk
+        self._tail = window[-64:]
+        if self.start == -1:
+            return
+
+        match = TOTAL_SCORE_PATTERN.search(window)
+
+        # The number is final only once a delimiter follows it
+        if match and match.end() < len(window):
+            self.total_score = float(match.group(1))
+            if self.on_progress:
+                self.on_progress({"event": "total_score", "total_score": self.total_score})
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+
+"""
+token_budget.py - Output token budgets sized to the submission
+Estimates how many completion tokens a grading needs from the number of
+questions and the feedback verbosity, so short quizzes do not reserve
+(and let the model fill) the full max_tokens
+"""
+
+from typing import Dict, Any, Optional
+
+from rate_limiter import estimate_tokens
+from objective_grader import parse_questions, parse_submission
+
+
+DEFAULTS = {
+    "enabled": False,
+    "feedback_verbosity": "detailed",   # brief, standard or detailed
+    "headroom": 1.25,                   # multiplier on the estimate
+    "reserve_tokens": 0,                # extra for models that think before answering
+    "min_tokens": 512
+}
+
+# Per level: estimated tokens for the overall fields and for each
+# question's feedback entry, and the length wording used in the prompts.
+# "detailed" is the original prompt.
+VERBOSITY = {
+    "brief": {
+        "base_tokens": 400,
+        "question_tokens": 150,
+        "style": "แบบสั้น",
+        "instruction": "ให้ความเห็นสั้นและตรงประเด็น 1-2 ประโยคต่อหัวข้อ",
+        "question": "สั้น ๆ 1-2 ประโยค",
+        "overall": "สั้น ๆ 2-3 ประโยค",
+        "strengths": "1-2 ประโยค",
+        "improvements": "1-2 ประโยค",
+        "analysis": "2-3 ประโยค"
+    },
+    "standard": {
+        "base_tokens": 1000,
+        "question_tokens": 300,
+        "style": "แบบกระชับ",
+        "instruction": "ให้ความเห็นและข้อเสนอแนะที่ชัดเจน 2-3 ประโยคต่อหัวข้อ",
+        "question": "ที่ชัดเจน ประมาณ 20-40 คำ",
+        "overall": "ที่ชัดเจน ประมาณ 50-80 คำ",
+        "strengths": "ประมาณ 30-50 คำ",
+        "improvements": "ประมาณ 30-50 คำ",
+        "analysis": "ประมาณ 60-100 คำ"
+    },
+    "detailed": {
+        "base_tokens": 1800,
+        "question_tokens": 500,
+        "style": "แบบละเอียด",
+        "instruction": "ให้ความเห็นและข้อเสนอแนะอย่างละเอียด อย่างน้อย 3-5 ประโยคต่อหัวข้อ",
+        "question": "ละเอียด อย่างน้อย 50-80 คำ",
+        "overall": "ละเอียด อย่างน้อย 100-150 คำ",
+        "strengths": "อย่างน้อย 50-80 คำ",
+        "improvements": "อย่างน้อย 80-120 คำ",
+        "analysis": "อย่างน้อย 150-200 คำ"
+    }
+}
+
+
+def budget_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Read the token_budget section of the router config"""
+    return dict(DEFAULTS, **(config.get("token_budget") or {}))
+
+
+def verbosity_level(settings: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Prompt wording and token estimates for the configured verbosity"""
+    name = (settings or {}).get("feedback_verbosity", DEFAULTS["feedback_verbosity"])
+    if name not in VERBOSITY:
+        raise ValueError(f"Unknown feedback_verbosity: {name}")
+    return VERBOSITY[name]
+
+
+def count_questions(text: str, context: Dict[str, Any]) -> int:
+    """
+    Number of questions a grading covers
+
+    Uses the question headings of a CSV-imported submission, then the
+    numbered questions of the assignment, and counts one otherwise.
+    """
+    _, items = parse_submission(text or "")
+    if items:
+        return len(items)
+    return max(1, len(parse_questions(context.get("question", ""))))
+
+
+def output_budget(text: str, context: Dict[str, Any], settings: Optional[Dict[str, Any]],
+                  ceiling: int, itemized: bool = True) -> int:
+    """
+    Completion tokens to allow for grading one submission
+
+    Args:
+        text: Submission text as sent to the model
+        context: Assignment context
+        settings: Output of budget_settings, or None
+        ceiling: Backend max_tokens, which the budget never exceeds
+        itemized: Whether the response has a feedback entry per question
+
+    Returns:
+        Token budget; the ceiling itself when budgeting is disabled
+    """
+    if not settings or not settings.get("enabled"):
+        return ceiling
+
+    level = verbosity_level(settings)
+    estimate = level["base_tokens"]
+    if itemized:
+        # Feedback entries echo the student's answers back
+        estimate += count_questions(text, context) * level["question_tokens"] + estimate_tokens(text)
+    budget = int(estimate * float(settings["headroom"])) + int(settings["reserve_tokens"])
+    return min(int(ceiling), max(int(settings["min_tokens"]), budget))
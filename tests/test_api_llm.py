@@ -0,0 +1,107 @@
+"""
+test_api_llm.py - Tests for OpenAIClient streaming and rate limit accounting
+"""
+
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from api_llm import OpenAIClient  # noqa: E402
+from resilience import BackendHTTPError  # noqa: E402
+
+
+GRADING = {
+    "total_score": 85,
+    "breakdown": {"accuracy": 40, "method": 30, "presentation": 15},
+    "feedback": "อธิบายได้ครบถ้วน " * 10,
+    "strengths": "ใช้ตัวอย่างชัดเจน",
+    "improvements": "ควรสรุปท้าย"
+}
+
+
+class _StreamingChat(BaseHTTPRequestHandler):
+    """Streams GRADING, more text, then the usage chunk a client stopping early never reads"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        text = json.dumps(GRADING, ensure_ascii=False) + " ต่อท้าย" * 500
+        events = [{"choices": [{"delta": {"content": text[i:i + 16]}}]} for i in range(0, len(text), 16)]
+        events.append({"choices": [], "usage": {"prompt_tokens": 300, "completion_tokens": 900, "total_tokens": 1200}})
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for event in events + ["[DONE]"]:
+                data = event if isinstance(event, str) else json.dumps(event, ensure_ascii=False)
+                chunk = f"data: {data}\n\n".encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client hung up once the object was complete
+
+
+@pytest.fixture
+def chat_server(monkeypatch):
+    monkeypatch.setenv("KRUROOAI_TEST_KEY", "sk-test")
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StreamingChat)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_stopped_stream_reports_estimated_usage(chat_server):
+    client = OpenAIClient({
+        "model": "gpt-4o-mini",
+        "api_key_env": "KRUROOAI_TEST_KEY",
+        "base_url": chat_server,
+        "stream": True,
+        "tokens_per_minute": 200000,
+        "timeout": 5
+    })
+    reconciled = []
+    client.rate_limiter.reconcile = lambda messages, reserved, usage: reconciled.append(usage)
+
+    result = client.grade_submission("คำตอบของนักเรียน", {"question": "อธิบาย"})
+
+    assert result["total_score"] == 85
+    assert reconciled[0]["estimated"] is True
+    assert reconciled[0]["completion_tokens"] > 0
+    assert result["usage"] == reconciled[0]
+
+
+def test_failed_call_refunds_completion_reservation(monkeypatch):
+    monkeypatch.setenv("KRUROOAI_TEST_KEY", "sk-test")
+    client = OpenAIClient({
+        "model": "gpt-4o-mini",
+        "api_key_env": "KRUROOAI_TEST_KEY",
+        "base_url": "http://127.0.0.1:9",
+        "tokens_per_minute": 100000,
+        "max_tokens": 2000
+    })
+    limiter = client.rate_limiter
+    messages = [{"role": "user", "content": "คำตอบ"}]
+
+    def rejected(*args):
+        raise BackendHTTPError("OpenAI", 429, "rate limited")
+
+    monkeypatch.setattr(client, "_call_openai", rejected)
+    before = limiter.token_level
+    with pytest.raises(BackendHTTPError):
+        client._paced_call(messages)
+
+    prompt_reserved = limiter.reserve_tokens(messages, 0)
+    assert before - limiter.token_level == pytest.approx(prompt_reserved, abs=50)
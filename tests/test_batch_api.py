@@ -0,0 +1,177 @@
+"""
+test_batch_api.py - OpenAI Batch API flow against a local stand-in server
+Covers upload -> create -> poll -> download -> mapping results back by
+custom_id, including one request that failed inside the batch
+"""
+
+import json
+import os
+import re
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from api_llm import OpenAIClient  # noqa: E402
+
+
+FAILED_ID = "1"
+
+
+def _completion(custom_id: str) -> dict:
+    """Chat completion body whose score identifies the request it answers"""
+    grading = {
+        "total_score": 70 + int(custom_id),
+        "breakdown": {"accuracy": 30, "method": 25, "presentation": 15},
+        "feedback": f"ผลตรวจของ {custom_id}",
+        "strengths": "อธิบายได้ชัดเจน",
+        "improvements": "ควรยกตัวอย่างเพิ่ม"
+    }
+    return {
+        "choices": [{"message": {"content": json.dumps(grading, ensure_ascii=False)}, "finish_reason": "stop"}],
+        "usage": {"prompt_tokens": 120, "completion_tokens": 80}
+    }
+
+
+class BatchStandIn:
+    """
+    Minimal Files/Batches API
+
+    A created batch reports in_progress on its first poll and completed on
+    the next; its output file answers every request except FAILED_ID,
+    which gets a 500 line in the same file.
+    """
+
+    def __init__(self):
+        self.files = {}
+        self.batches = {}
+        self.log = []
+        self.polls = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, *args):
+                pass
+
+            def _send(self, status, body, content_type="application/json"):
+                data = body if isinstance(body, bytes) else json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                stand_in.log.append(("POST", self.path))
+                if self.path == "/files":
+                    self._send(200, stand_in.upload(self.headers["Content-Type"], body))
+                elif self.path == "/batches":
+                    self._send(200, stand_in.create(json.loads(body)))
+                else:
+                    self._send(404, {"error": {"message": "not found"}})
+
+            def do_GET(self):
+                stand_in.log.append(("GET", self.path))
+                match = re.fullmatch(r"/files/([^/]+)/content", self.path)
+                if match and match.group(1) in stand_in.files:
+                    self._send(200, stand_in.files[match.group(1)], "application/jsonl")
+                    return
+                match = re.fullmatch(r"/batches/([^/]+)", self.path)
+                if match and match.group(1) in stand_in.batches:
+                    self._send(200, stand_in.poll(match.group(1)))
+                    return
+                self._send(404, {"error": {"message": "not found"}})
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self.server.server_address[1]}"
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+
+    def upload(self, content_type: str, body: bytes) -> dict:
+        boundary = content_type.split("boundary=")[1].encode("utf-8")
+        for part in body.split(b"--" + boundary):
+            head, _, content = part.partition(b"\r\n\r\n")
+            if b'name="file"' in head:
+                file_id = f"file-in-{len(self.files)}"
+                self.files[file_id] = content[:-2]  # trailing CRLF before the boundary
+                return {"id": file_id, "object": "file", "purpose": "batch"}
+        raise AssertionError("no file part in upload")
+
+    def create(self, request: dict) -> dict:
+        assert request["endpoint"] == "/v1/chat/completions"
+        lines = [json.loads(line) for line in self.files[request["input_file_id"]].splitlines() if line.strip()]
+        output = []
+        for line in lines:
+            if line["custom_id"] == FAILED_ID:
+                response = {"status_code": 500, "body": {"error": {"message": "server overloaded"}}}
+            else:
+                response = {"status_code": 200, "body": _completion(line["custom_id"])}
+            output.append(json.dumps({"id": "req-" + line["custom_id"], "custom_id": line["custom_id"],
+                                      "response": response, "error": None}, ensure_ascii=False))
+        # Output order differs from input order, as the real API allows
+        self.files["file-out"] = ("\n".join(reversed(output)) + "\n").encode("utf-8")
+
+        batch_id = f"batch-{len(self.batches)}"
+        self.batches[batch_id] = {"id": batch_id, "status": "validating", "input_file_id": request["input_file_id"],
+                                  "request_counts": {"total": len(lines), "completed": 0, "failed": 0}}
+        return self.batches[batch_id]
+
+    def poll(self, batch_id: str) -> dict:
+        self.polls += 1
+        batch = self.batches[batch_id]
+        if self.polls == 1:
+            batch["status"] = "in_progress"
+        else:
+            total = batch["request_counts"]["total"]
+            batch.update(status="completed", output_file_id="file-out",
+                         request_counts={"total": total, "completed": total - 1, "failed": 1})
+        return batch
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def stand_in(monkeypatch):
+    monkeypatch.setenv("KRUROOAI_TEST_KEY", "sk-test")
+    with BatchStandIn() as server:
+        yield server
+
+
+def test_grade_batch_api_maps_results_by_custom_id(stand_in):
+    events = []
+    client = OpenAIClient({
+        "model": "gpt-4o-mini",
+        "api_key_env": "KRUROOAI_TEST_KEY",
+        "base_url": stand_in.base_url,
+        "timeout": 5,
+        "batch_poll_interval": 0
+    }, on_progress=events.append)
+
+    context = {"question": "1. อธิบายการสังเคราะห์ด้วยแสง", "standard_answer": "พืชใช้แสงสร้างอาหาร"}
+    items = [(str(index), f"คำตอบของนักเรียนคนที่ {index}", context) for index in range(3)]
+    results = client.grade_batch_api(items, timeout=10)
+
+    assert stand_in.log[:2] == [("POST", "/files"), ("POST", "/batches")]
+    assert stand_in.log[-1] == ("GET", "/files/file-out/content")
+    assert stand_in.polls == 2
+    assert [event["status"] for event in events] == ["in_progress"]
+
+    uploaded = [json.loads(line) for line in stand_in.files["file-in-0"].splitlines()]
+    assert [line["custom_id"] for line in uploaded] == ["0", "1", "2"]
+    assert all(line["url"] == "/v1/chat/completions" for line in uploaded)
+
+    assert set(results) == {"0", "1", "2"}
+    assert results["0"]["total_score"] == 70
+    assert results["2"]["total_score"] == 72
+    assert not results["0"].get("error") and not results["2"].get("error")
+    assert results[FAILED_ID]["error"] is True
+    assert "server overloaded" in results[FAILED_ID]["message"]
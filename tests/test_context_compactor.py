@@ -0,0 +1,30 @@
+"""
+test_context_compactor.py - Tests for per-question context compaction
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from context_compactor import ContextCompactor, compact_field  # noqa: E402
+
+
+RUBRIC = "1. Accuracy (50%)\n2. Clarity (30%)\n3. Reasoning (20%)"
+
+CONTEXT = {
+    "question": "ข้อ 1. อธิบายการสังเคราะห์ด้วยแสง\nข้อ 2. อธิบายการหายใจ\nข้อ 3. เปรียบเทียบสองกระบวนการ",
+    "standard_answer": "ข้อ 1. พืชใช้แสงสร้างอาหาร\nข้อ 2. เซลล์สลายอาหารได้พลังงาน\nข้อ 3. กระบวนการตรงข้ามกัน",
+    "grading_criteria": RUBRIC
+}
+
+
+def test_numbered_rubric_is_kept_whole():
+    assert compact_field(RUBRIC, keep={3}, known={1, 2, 3}) == RUBRIC
+
+
+def test_question_headings_are_compacted_and_rubric_kept():
+    compacted = ContextCompactor().compact(CONTEXT, {3}, min_tokens=0)
+    assert compacted["question"] == "ข้อ 3. เปรียบเทียบสองกระบวนการ"
+    assert compacted["standard_answer"] == "ข้อ 3. กระบวนการตรงข้ามกัน"
+    assert compacted["grading_criteria"] == RUBRIC
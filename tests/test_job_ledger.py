@@ -0,0 +1,29 @@
+"""
+test_job_ledger.py - Tests for resuming batch runs from the job ledger
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from job_ledger import JobLedger, job_fingerprint  # noqa: E402
+
+
+CONTEXT = {"question": "1. อธิบายการสังเคราะห์ด้วยแสง"}
+
+
+def test_completed_result_requires_matching_fingerprint(tmp_path):
+    path = str(tmp_path / "ledger.jsonl")
+    graded = job_fingerprint("คำตอบเดิม", CONTEXT, "local", ["local:llama3.2:3b"])
+
+    ledger = JobLedger(path)
+    ledger.mark_finished("s1", {"total_score": 8, "confidence": 0.9}, graded)
+    ledger.close()
+
+    resumed = JobLedger(path, resume=True)
+    assert resumed.completed_result("s1", graded)["total_score"] == 8
+    assert resumed.completed_result("s1", job_fingerprint("คำตอบใหม่", CONTEXT, "local", ["local:llama3.2:3b"])) is None
+    assert resumed.completed_result("s1", job_fingerprint("คำตอบเดิม", CONTEXT, "local", ["local:qwen2.5:7b"])) is None
+    assert resumed.completed_result("s1", job_fingerprint("คำตอบเดิม", CONTEXT, "openai", ["openai:gpt-4o-mini"])) is None
+    resumed.close()
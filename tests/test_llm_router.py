@@ -0,0 +1,146 @@
+"""
+test_llm_router.py - Tests for routing decisions in llm_router
+"""
+
+import asyncio
+import json
+import os
+import queue
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+import async_http  # noqa: E402
+import llm_router  # noqa: E402
+from llm_router import agrade_batch, hybrid_settings, is_decisive, serve, store_cached  # noqa: E402
+
+
+def test_hybrid_waits_for_both_results_by_default():
+    settings = hybrid_settings({"hybrid": {"weight_local": 0.5, "weight_api": 0.5}})
+    assert settings["early_exit_confidence"] is None
+    assert not is_decisive({"total_score": 8, "confidence": 1.0}, settings)
+
+
+def test_hybrid_early_exit_when_configured():
+    settings = hybrid_settings({"hybrid": {"early_exit_confidence": 0.9}})
+    assert is_decisive({"total_score": 8, "confidence": 1.0}, settings)
+    assert not is_decisive({"total_score": 8, "confidence": 0.5}, settings)
+    assert not is_decisive({"error": True, "confidence": 1.0}, settings)
+
+
+class _RecordingCache:
+    def __init__(self):
+        self.stored = {}
+
+    def put(self, key, value):
+        self.stored[key] = value
+
+
+def test_store_cached_skips_degraded_results():
+    cache = _RecordingCache()
+    store_cached(cache, "hybrid", {"total_score": 8, "confidence": 0.9, "hybrid_source": "local"})
+    store_cached(cache, "cascade", {"total_score": 8, "confidence": 0.4,
+                                    "cascade": [{"backend": "local", "escalation": "low_confidence"}]})
+    store_cached(cache, "accepted", {"total_score": 8, "confidence": 0.9,
+                                     "cascade": [{"backend": "local", "escalation": None}]})
+    assert list(cache.stored) == ["accepted"]
+
+
+class _OllamaStandIn(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        grading = {"total_score": 80, "breakdown": {"accuracy": 40, "method": 30, "presentation": 10}}
+        body = json.dumps({"response": json.dumps(grading), "done": True}).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def test_agrade_batch_closes_http_sessions():
+    if not async_http.is_available():
+        pytest.skip("aiohttp is not installed")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _OllamaStandIn)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    config = {
+        "backends": {"local": {"endpoint": f"http://127.0.0.1:{server.server_address[1]}", "model": "m"}},
+        "cache": {"enabled": False},
+        "packing": {"enabled": False}
+    }
+    jobs = [{"id": str(i), "text": f"คำตอบ {i}", "context": {"question": "อธิบาย"}} for i in range(3)]
+
+    async def run():
+        results = await agrade_batch(jobs, "local", config)
+        loop_id = id(asyncio.get_running_loop())
+        return results, [key for key in async_http._SESSIONS if key[0] == loop_id]
+
+    try:
+        results, open_sessions = asyncio.run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert [result["total_score"] for result in results] == [80, 80, 80]
+    assert open_sessions == []
+
+
+class _LineQueue:
+    """Writable stream that hands each written line to a queue"""
+
+    def __init__(self):
+        self.lines = queue.Queue()
+
+    def write(self, text):
+        for line in text.splitlines():
+            self.lines.put(json.loads(line))
+
+    def flush(self):
+        pass
+
+
+def test_serve_answers_each_job_while_the_pipe_stays_open(monkeypatch):
+    def fake_route(text, context, backend="local", config=None, lane="interactive"):
+        return {"total_score": len(text), "confidence": 0.9}
+
+    def fake_packed(texts, context, backend, config):
+        return [{"total_score": len(text), "confidence": 0.9} for text in texts]
+
+    monkeypatch.setattr(llm_router, "route_to_llm", fake_route)
+    monkeypatch.setattr(llm_router, "route_packed", fake_packed)
+
+    read_fd, write_fd = os.pipe()
+    stdin = os.fdopen(read_fd, "r", encoding="utf-8")
+    writer = os.fdopen(write_fd, "w", encoding="utf-8")
+    stdout = _LineQueue()
+    config = {"default_backend": "local", "packing": {"enabled": True, "max_students": 8}}
+    processed = []
+    worker = threading.Thread(target=lambda: processed.append(serve(config, stdin, stdout)), daemon=True)
+    worker.start()
+
+    try:
+        # A long job goes out alone; a short one is packable and must not
+        # wait for a full pack while the client waits for its result
+        for job_id, text in [("long", "ก" * 2000), ("short", "คำตอบ")]:
+            job = {"id": job_id, "text": text, "context": {"question": "อธิบาย"}}
+            writer.write(json.dumps(job, ensure_ascii=False) + "\n")
+            writer.flush()
+            result = stdout.lines.get(timeout=5)
+            assert result["id"] == job_id
+            assert result["total_score"] == len(text)
+    finally:
+        writer.close()
+
+    worker.join(timeout=5)
+    assert processed == [2]
+    stdin.close()
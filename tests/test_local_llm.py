@@ -0,0 +1,82 @@
+"""
+test_local_llm.py - Tests for LocalLLMClient prompt building
+"""
+
+import asyncio
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+import async_http  # noqa: E402
+from local_llm import LocalLLMClient  # noqa: E402
+
+
+def test_prompt_prefix_cache_is_bounded_lru():
+    client = LocalLLMClient({"model": "m", "prefix_cache_size": 2})
+    first = {"question": "ข้อ 1"}
+    client._build_prompt_prefix(first)
+    client._build_prompt_prefix({"question": "ข้อ 2"})
+    client._build_prompt_prefix(first)  # most recently used again
+    client._build_prompt_prefix({"question": "ข้อ 3"})
+
+    assert len(client._prefix_cache) == 2
+    assert any("ข้อ 1" in key for key in client._prefix_cache)
+    assert not any("ข้อ 2" in key for key in client._prefix_cache)
+
+
+class _StreamingOllama(BaseHTTPRequestHandler):
+    """Streams a grading in small chunks, followed by text a client should never read"""
+
+    protocol_version = "HTTP/1.1"
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        type(self).requests.append(json.loads(self.rfile.read(int(self.headers["Content-Length"]))))
+        grading = {"total_score": 75, "breakdown": {"accuracy": 35, "method": 25, "presentation": 15}}
+        text = json.dumps(grading) + " trailing text" * 200
+        self.send_response(200)
+        self.send_header("Content-Type", "application/x-ndjson")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            for i in range(0, len(text), 8):
+                chunk = (json.dumps({"response": text[i:i + 8], "done": False}) + "\n").encode("utf-8")
+                self.wfile.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # the client hung up once the object was complete
+
+
+def test_async_grading_streams_when_enabled():
+    if not async_http.is_available():
+        pytest.skip("aiohttp is not installed")
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _StreamingOllama)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    client = LocalLLMClient({"endpoint": f"http://127.0.0.1:{server.server_address[1]}", "model": "m", "stream": True})
+
+    async def run():
+        try:
+            return await client.agrade_submission("คำตอบ", {"question": "อธิบาย"})
+        finally:
+            await async_http.close_sessions()
+
+    try:
+        result = asyncio.run(run())
+    finally:
+        server.shutdown()
+        server.server_close()
+
+    assert result["total_score"] == 75
+    assert result.get("parsing_method") != "fallback"
+    assert _StreamingOllama.requests[0]["stream"] is True
@@ -0,0 +1,91 @@
+"""
+test_objective_grader.py - Answer-key grading merged with an LLM result
+Pins how the total of a mixed objective/subjective submission is weighted
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from objective_grader import split_objective, merge_objective  # noqa: E402
+
+
+CONTEXT = {
+    "question": "\n".join([
+        "1. ข้อใดคือหน่วยพื้นฐานของสิ่งมีชีวิต?",
+        "   * เซลล์",
+        "   * อะตอม",
+        "2. พืชสร้างอาหารด้วยกระบวนการใด?",
+        "   * การสังเคราะห์ด้วยแสง",
+        "   * การหายใจ",
+        "3. สัตว์ชนิดใดเป็นสัตว์เลี้ยงลูกด้วยนม?",
+        "   * วาฬ",
+        "   * ฉลาม",
+        "4. (อัตนัย) อธิบายความสำคัญของการสังเคราะห์ด้วยแสง"
+    ]),
+    "standard_answer": "\n".join([
+        "1. เซลล์ ✓",
+        "2. การสังเคราะห์ด้วยแสง ✓",
+        "3. วาฬ ✓",
+        "4. พืชเปลี่ยนพลังงานแสงเป็นพลังงานเคมีและปล่อยออกซิเจน"
+    ]),
+    # The rubric puts most of the weight on the subjective item; merged
+    # totals ignore it and weight every question equally
+    "grading_criteria": "ข้อ 1-3 รวม 10 คะแนน ข้อ 4 (อัตนัย) 90 คะแนน"
+}
+
+SUBMISSION = "\n".join([
+    "คำถามที่ 1: ข้อใดคือหน่วยพื้นฐานของสิ่งมีชีวิต?",
+    "คำตอบ: เซลล์",
+    "",
+    "คำถามที่ 2: พืชสร้างอาหารด้วยกระบวนการใด?",
+    "คำตอบ: การสังเคราะห์ด้วยแสง",
+    "",
+    "คำถามที่ 3: สัตว์ชนิดใดเป็นสัตว์เลี้ยงลูกด้วยนม?",
+    "คำตอบ: ฉลาม",
+    "",
+    "คำถามที่ 4: (อัตนัย) อธิบายความสำคัญของการสังเคราะห์ด้วยแสง",
+    "คำตอบ: ทำให้พืชมีอาหารและโลกมีออกซิเจน",
+    ""
+])
+
+ENABLED = {"objective_grading": {"enabled": True, "points_per_question": 10}}
+
+
+def test_objective_grading_is_off_by_default():
+    assert split_objective(SUBMISSION, CONTEXT, {}) is None
+
+
+def test_merged_total_weights_each_question_equally():
+    split = split_objective(SUBMISSION, CONTEXT, ENABLED)
+    assert [q["question_number"] for q in split["graded"]] == [1, 2, 3]
+    assert [q["is_correct"] for q in split["graded"]] == [True, True, False]
+    assert split["remaining_count"] == 1
+    assert "คำถามที่ 4:" in split["remaining_text"]
+    assert "คำถามที่ 1:" not in split["remaining_text"]
+
+    llm_result = {
+        "total_score": 80,
+        "question_feedback": [{"question_number": 4, "score": 8, "max_score": 10}],
+        "feedback": "อธิบายได้ดี",
+        "confidence": 0.9
+    }
+    merged = merge_objective(split, llm_result, ENABLED)
+
+    # (10 + 10 + 0 + 0.8 * 10) / 40: the subjective item is a quarter of
+    # the total whatever weight the rubric gives it
+    assert merged["total_score"] == 70.0
+    assert merged["objective_graded"] == 3
+    assert [q["question_number"] for q in merged["question_feedback"]] == [1, 2, 3, 4]
+    assert merged["feedback"] == "อธิบายได้ดี"
+
+
+def test_merged_total_without_remaining_items():
+    objective_only = SUBMISSION.split("คำถามที่ 4:")[0]
+    split = split_objective(objective_only, CONTEXT, ENABLED)
+    assert split["remaining_text"] == ""
+
+    merged = merge_objective(split, None, ENABLED)
+    assert merged["total_score"] == 66.67
+    assert merged["model_used"] == "answer_key"
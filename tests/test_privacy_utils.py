@@ -0,0 +1,50 @@
+"""
+test_privacy_utils.py - Regression tests for span-based anonymization
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+import privacy_utils  # noqa: E402
+from privacy_utils import DEFAULT_PRIVACY_RULES, analyze_privacy, anonymize_for_api, merge_spans  # noqa: E402
+
+
+OVERLAPPING_NAME = "ชื่อ: นาย สมชาย ส่งงาน"
+
+
+def test_overlapping_name_is_removed_entirely():
+    assert anonymize_for_api(OVERLAPPING_NAME, "remove") == " ส่งงาน"
+
+
+def test_overlapping_name_is_hashed_entirely():
+    result = anonymize_for_api(OVERLAPPING_NAME, "hash")
+    assert "สมชาย" not in result
+    assert result.startswith("[PERSONAL_NAME_")
+    assert result.endswith("] ส่งงาน")
+
+
+def test_merge_spans_keeps_winner_label_over_union():
+    detections = [
+        {"type": "numeric_id", "text": "1234", "start": 4, "end": 8, "confidence": 0.5},
+        {"type": "student_id", "text": "12345678", "start": 0, "end": 6, "confidence": 0.9},
+    ]
+    merged = merge_spans(detections)
+    assert len(merged) == 1
+    assert merged[0]["type"] == "student_id"
+    assert (merged[0]["start"], merged[0]["end"]) == (0, 8)
+
+
+def test_analyze_privacy_scans_placeholder_mode_once(monkeypatch):
+    scans = []
+    scan = privacy_utils.scan_personal_info
+    monkeypatch.setattr(privacy_utils, "scan_personal_info", lambda *args: scans.append(1) or scan(*args))
+    monkeypatch.setattr(privacy_utils, "apply_privacy_preprocessing",
+                        lambda *args: (_ for _ in ()).throw(AssertionError("rescanned")))
+
+    text = "นางสาว สมศรี รหัสนักเรียน: 12345678 อีเมล: somsri@example.com"
+    result = analyze_privacy(text, DEFAULT_PRIVACY_RULES)
+
+    assert result["filtered_text"] == "[STUDENT] [REDACTED] [REDACTED]"
+    assert len(scans) == 1
@@ -0,0 +1,51 @@
+"""
+test_resilience.py - Tests for retries and circuit breaking
+"""
+
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from resilience import BackendHTTPError, CircuitBreaker, RetryPolicy  # noqa: E402
+
+
+def test_half_open_circuit_admits_a_single_probe():
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=0.2)
+    breaker.record_failure()
+    policy = RetryPolicy({"attempts": 1, "max_delay": 5}, breaker)
+
+    started = []
+    lock = threading.Lock()
+
+    def request():
+        with lock:
+            started.append(time.monotonic())
+        time.sleep(0.3)
+        return "ok"
+
+    workers = [threading.Thread(target=policy.call, args=(request,)) for _ in range(5)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join(timeout=10)
+
+    started.sort()
+    assert len(started) == 5
+    # Everyone else waited for the probe to succeed
+    assert all(t - started[0] >= 0.3 for t in started[1:])
+    assert breaker.state == "closed"
+
+
+def test_failed_probe_reopens_circuit():
+    breaker = CircuitBreaker("test", threshold=1, reset_timeout=0.1)
+    breaker.record_failure()
+    time.sleep(0.15)
+
+    assert breaker.admit() == 0.0
+    assert breaker.admit() > 0  # probe out, others wait
+    policy = RetryPolicy({"attempts": 1}, breaker)
+    policy._record(BackendHTTPError("Ollama", 503, "busy"))
+    assert breaker.state == "open"
@@ -0,0 +1,52 @@
+"""
+test_scheduler.py - Tests for backend admission queues
+"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "python"))
+
+from resilience import BackendHTTPError, RetryPolicy  # noqa: E402
+from scheduler import DEFAULTS, BackendQueue, queue_key  # noqa: E402
+
+
+def _queue():
+    return BackendQueue("test", dict(DEFAULTS, initial_concurrency=4))
+
+
+def test_local_queues_are_per_model():
+    small = {"endpoint": "http://localhost:11434", "model": "llama3.2:3b"}
+    large = {"endpoint": "http://localhost:11434", "model": "gpt-oss:20b"}
+    assert queue_key("local", small) != queue_key("local", large)
+
+
+def test_latency_is_recorded_per_attempt_without_backoff():
+    queue = _queue()
+    policy = RetryPolicy({"attempts": 2, "delay": 0.3, "max_delay": 0.3})
+    calls = []
+
+    def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise BackendHTTPError("Ollama", 503, "busy", retry_after=0.3)
+        return {"total_score": 80}
+
+    queue.run("bulk", lambda: policy.call(flaky))
+
+    # The success was about instant; the 0.3s backoff must not count
+    assert queue.limit.baseline is not None and queue.limit.baseline < 0.1
+    assert queue.in_flight == 0
+
+
+def test_packed_latency_is_divided_by_pack_size():
+    queue = _queue()
+    policy = RetryPolicy({"attempts": 1})
+
+    def packed_call():
+        time.sleep(0.2)
+        return [{"total_score": 80}] * 8
+
+    queue.run("bulk", lambda: policy.call(packed_call), weight=8)
+    assert 0.02 <= queue.limit.baseline < 0.05